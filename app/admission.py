@@ -0,0 +1,172 @@
+"""Control de admisión: limita la concurrencia por grupo de rutas y descarta carga con 503.
+
+`AdmissionControlMiddleware` se registra en `main.py`; sus métricas se exponen en `/status`.
+"""
+import asyncio
+import os
+import re
+from collections import deque
+from fastapi.responses import JSONResponse
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+# Peticiones concurrentes por grupo de rutas
+ADMISSION_HEAVY_CONCURRENCY = int(os.getenv("ADMISSION_HEAVY_CONCURRENCY", "32"))
+ADMISSION_DEFAULT_CONCURRENCY = int(os.getenv("ADMISSION_DEFAULT_CONCURRENCY", "256"))
+# Segundos que una petición puede esperar un cupo antes de descartarse con 503
+ADMISSION_MAX_QUEUE_WAIT = float(os.getenv("ADMISSION_MAX_QUEUE_WAIT", "0.5"))
+# Retraso del event loop (segundos) a partir del cual se descartan las peticiones nuevas
+ADMISSION_MAX_LOOP_LAG = float(os.getenv("ADMISSION_MAX_LOOP_LAG", "0.2"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+LOOP_LAG_INTERVAL = 0.1
+
+# Rutas baratas: nunca esperan cupo ni se descartan
+PRIORITY_PATHS = {"/", "/health", "/status"}
+
+# Rutas pesadas (canal completo con miembros, exportaciones y listados), con su propio límite
+HEAVY_ROUTES = [
+    ("GET", re.compile(r"^/v1/channels/?$")),
+    ("GET", re.compile(r"^/v1/channels/export")),
+    ("GET", re.compile(r"^/v1/channels/[^/]+$")),
+    ("GET", re.compile(r"^/v1/members/(owner/|channel/)?[^/]+$")),
+]
+
+
+class _RouteLimiter:
+    """Límite de peticiones concurrentes de un grupo de rutas, con espera acotada por un cupo."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self, timeout: float) -> bool:
+        """Toma un cupo; devuelve False si no se libera ninguno dentro de `timeout` segundos.
+
+        Las peticiones esperan en orden de llegada: mientras haya alguna en espera, una nueva no toma
+        un cupo libre por delante de ella, y `release` entrega el cupo directamente a la siguiente.
+        """
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        if timeout <= 0:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as exc:
+            if waiter.done() and not waiter.cancelled():
+                # El cupo se entregó justo al vencer la espera: se devuelve para el siguiente
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if isinstance(exc, TimeoutError):
+                return False
+            raise
+        self.admitted += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake_next()
+
+    def _wake_next(self):
+        """Entrega los cupos libres a las peticiones en espera (el cupo se cuenta en `in_flight` al entregarlo)."""
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class _LoopLagMonitor:
+    """Mide cuánto se atrasa el event loop respecto de un `sleep` periódico."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - start - self.interval)
+            self.max_lag = max(self.max_lag, self.lag)
+
+
+route_limiters = {
+    "heavy": _RouteLimiter("heavy", ADMISSION_HEAVY_CONCURRENCY),
+    "default": _RouteLimiter("default", ADMISSION_DEFAULT_CONCURRENCY),
+}
+loop_lag_monitor = _LoopLagMonitor()
+
+
+def _route_limiter(method: str, path: str) -> _RouteLimiter | None:
+    """Limitador del grupo de la ruta, o None si la ruta tiene prioridad."""
+    if path in PRIORITY_PATHS:
+        return None
+    for route_method, pattern in HEAVY_ROUTES:
+        if method == route_method and pattern.match(path):
+            return route_limiters["heavy"]
+    return route_limiters["default"]
+
+
+class AdmissionControlMiddleware:
+    """Middleware ASGI que limita la concurrencia por grupo de rutas y descarta carga con 503.
+
+    Una petición se rechaza con `503` + `Retry-After` si el event loop está atrasado más de
+    `ADMISSION_MAX_LOOP_LAG` o si no obtiene cupo en `ADMISSION_MAX_QUEUE_WAIT` segundos. El cupo
+    se mantiene hasta terminar de enviar la respuesta (incluidas las respuestas en streaming).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = _route_limiter(scope["method"], scope["path"])
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        if loop_lag_monitor.lag > ADMISSION_MAX_LOOP_LAG or not await limiter.acquire(ADMISSION_MAX_QUEUE_WAIT):
+            limiter.rejected += 1
+            response = JSONResponse(
+                {"detail": "Servicio sobrecargado, intente nuevamente más tarde."},
+                status_code=503,
+                headers={"Retry-After": str(ADMISSION_RETRY_AFTER)}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+def admission_stats() -> dict:
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "loop_lag": loop_lag_monitor.lag,
+        "max_loop_lag": loop_lag_monitor.max_lag,
+        **{name: limiter.stats() for name, limiter in route_limiters.items()},
+    }
@@ -1,48 +1,71 @@
+from collections.abc import AsyncIterator
 from ..db import querys
+from ..db.querys import OwnerNotMemberError
+from ..db.cache import channel_cache, basic_info_cache, status_cache, channel_cache_key, invalidate_channel
+from ..db.pagination import encode_cursor, decode_cursor
 from ..schemas.channels import Channel
 from ..schemas.payloads import ChannelCreatePayload, ChannelUpdatePayload
-from ..schemas.responses import ChannelIDResponse, ChannelBasicInfoResponse
-from ..events.publish import publish_message_main
-from ..events.clients import rabbit_clients
+from ..schemas.responses import ChannelIDResponse, ChannelBasicInfoResponse, ChannelBatchItem
+from ..events.outbox import notify_outbox
 
 
 async def create_channel(channel_data_payload: ChannelCreatePayload) -> Channel:
-    """Crea un nuevo canal y lo guarda en MongoDB."""
-    channel = querys.db_create_channel(channel_data_payload)
-    
-    payload = {"channel_id": channel.id, "name": channel.name, "owner_id": channel.owner_id, "created_at": channel.created_at}
-    await publish_message_main(rabbit_clients["channel"], payload, "channelService.v1.channel.created")
-    
+    """Crea un nuevo canal y lo guarda en MongoDB (el evento `channel.created` queda en su outbox)."""
+    channel = await querys.db_create_channel(channel_data_payload)
+    notify_outbox()
     return channel
 
 
-def list_channels(page: int, page_size: int) -> list[ChannelBasicInfoResponse]:
+async def list_channels(page: int, page_size: int) -> list[ChannelBasicInfoResponse]:
     """Obtiene una lista paginada de información básica de todos los canales."""
     offset = (page - 1) * page_size
-    channels = querys.db_get_all_channels_paginated(skip=offset, limit=page_size)
+    channels = await querys.db_get_all_channels_paginated(skip=offset, limit=page_size)
     return channels
 
 
-def get_channel(channel_id: str) -> Channel | None:
-    """Obtiene un canal existente por su ID."""
-    return querys.db_get_channel_by_id(channel_id)
+async def list_channels_after(cursor: str | None, page_size: int) -> tuple[list[ChannelBasicInfoResponse], str | None]:
+    """Obtiene una página de canales a partir de un cursor opaco (paginación por keyset).
+
+    Returns:
+        tuple: (channels, next_cursor). `next_cursor` es None si no hay más páginas.
+    """
+    after_id = decode_cursor(cursor) if cursor else None
+    # Se pide un elemento extra para saber si existe una página siguiente
+    channels = await querys.db_get_all_channels_after(after_id, limit=page_size + 1)
+    if len(channels) <= page_size:
+        return channels, None
+    channels = channels[:page_size]
+    return channels, encode_cursor(channels[-1].id)
+
+
+async def get_channel(channel_id: str, include_members: bool = True) -> Channel | None:
+    """Obtiene un canal existente por su ID. Con `include_members=False` no se cargan sus miembros."""
+    key = channel_cache_key(channel_id)
+    if key is None:
+        return await querys.db_get_channel_by_id(channel_id, include_members=include_members)
+    return await channel_cache.get_or_load(
+        (key, include_members),
+        lambda: querys.db_get_channel_by_id(channel_id, include_members=include_members)
+    )
+
+
+async def get_channel_version(channel_id: str) -> float | None:
+    """Obtiene el `updated_at` de un canal activo sin cargar el documento completo."""
+    return await querys.db_get_channel_version(channel_id)
 
 
 async def update_channel(channel_id: str, channel_update_payload: ChannelUpdatePayload) -> Channel | None:
-    """Actualiza un canal existente en MongoDB. Para cambiar el owner_id, el nuevo owner debe ser miembro del canal."""
-    
-    new_owner_id = channel_update_payload.owner_id
-    if new_owner_id is not None:
-        new_owner_is_member = querys.db_check_user_exists_in_channel(channel_id, new_owner_id)
-        if not new_owner_is_member:
-            raise ValueError(f"El nuevo owner_id '{new_owner_id}' no es miembro del canal.")
+    """Actualiza un canal existente en MongoDB. Para cambiar el owner_id, el nuevo owner debe ser miembro del canal.
+
+    Raises:
+        OwnerNotMemberError: Si el canal existe pero el nuevo owner_id no es miembro.
+    """
     
-    channel = querys.db_update_channel(channel_id, channel_update_payload)
+    channel = await querys.db_update_channel(channel_id, channel_update_payload)
     
     if channel:
-        updated_fields = channel_update_payload.model_dump(exclude_unset=True, exclude_none=True)
-        payload = {"channel_id": channel.id, "updated_fields": updated_fields, "updated_at": channel.updated_at}
-        await publish_message_main(rabbit_clients["channel"], payload, "channelService.v1.channel.updated")
+        invalidate_channel(channel_id)
+        notify_outbox()
     
     return channel
 
@@ -53,18 +76,13 @@ async def delete_channel(channel_id: str) -> tuple[Channel | None, Channel | Non
     Returns:
         tuple: (channel_before_delete, channel_after_delete)
     """
-    channel_before = querys.db_get_channel_by_id(channel_id, include_inactive=True)
-    
-    if not channel_before:
-        return None, None
+    channel_before, channel_after = await querys.db_deactivate_channel(channel_id)
     
-    if not channel_before.is_active:
+    if channel_after is None:
         return channel_before, None
     
-    channel_after = querys.db_deactivate_channel(channel_id)
-    
-    payload = {"channel_id": channel_id, "deleted_at": channel_after.deleted_at}
-    await publish_message_main(rabbit_clients["channel"], payload, "channelService.v1.channel.deleted")
+    invalidate_channel(channel_id)
+    notify_outbox()
     
     return channel_before, channel_after
 
@@ -75,26 +93,61 @@ async def reactivate_channel(channel_id: str) -> tuple[Channel | None, bool]:
     Returns:
         tuple: (channel, was_already_active)
     """
-    channel = querys.db_get_channel_by_id(channel_id, include_inactive=True)
+    channel_before, channel = await querys.db_reactivate_channel(channel_id)
     
-    if not channel:
+    if channel_before is None:
         return None, False
     
-    if channel.is_active:
-        return channel, True
+    if channel is None:
+        return channel_before, True
     
-    channel = querys.db_reactivate_channel(channel_id)
-    
-    payload = {"channel_id": channel.id, "reactivated_at": channel.updated_at}
-    await publish_message_main(rabbit_clients["channel"], payload, "channelService.v1.channel.reactivated")
+    invalidate_channel(channel_id)
+    notify_outbox()
     
     return channel, False
 
 
-def get_channel_basic_info(channel_id: str) -> ChannelBasicInfoResponse | None:
+async def get_channel_basic_info(channel_id: str) -> ChannelBasicInfoResponse | None:
     """Obtiene información básica de un canal específico desde MongoDB."""
-    return querys.db_get_basic_channel_info(channel_id)
+    key = channel_cache_key(channel_id)
+    if key is None:
+        return await querys.db_get_basic_channel_info(channel_id)
+    return await basic_info_cache.get_or_load(key, lambda: querys.db_get_basic_channel_info(channel_id))
 
-def is_channel_active(channel_id: str) -> bool | None:
+async def is_channel_active(channel_id: str) -> bool | None:
     """Verifica si un canal está activo."""
-    return querys.db_is_channel_active(channel_id)
\ No newline at end of file
+    key = channel_cache_key(channel_id)
+    if key is None:
+        return await querys.db_is_channel_active(channel_id)
+    return await status_cache.get_or_load(key, lambda: querys.db_is_channel_active(channel_id))
+
+async def get_channels_batch(channel_ids: list[str]) -> dict[str, ChannelBatchItem]:
+    """Obtiene la información básica y el estado de varios canales con una sola consulta.
+
+    Cada ID solicitado aparece en el resultado; los inexistentes con `found=False`. Igual que en
+    `/basic`, la información básica solo se incluye para canales activos.
+    """
+    channels = await querys.db_get_channels_batch(channel_ids)
+    result = {}
+    for channel_id in channel_ids:
+        if channel_id not in channels:
+            result[channel_id] = ChannelBatchItem(found=False)
+            continue
+        is_active, basic_info = channels[channel_id]
+        result[channel_id] = ChannelBatchItem(found=True, is_active=is_active, channel=basic_info if is_active else None)
+    return result
+
+
+def export_channels(
+    is_active: bool | None = None,
+    channel_type: str | None = None,
+    updated_since: float | None = None,
+    batch_size: int = querys.EXPORT_BATCH_SIZE
+) -> AsyncIterator[dict]:
+    """Recorre todos los canales que cumplen los filtros para exportarlos en streaming."""
+    return querys.db_iter_channels_export(is_active, channel_type, updated_since, batch_size)
+
+
+def export_members(status: str | None = None, batch_size: int = querys.EXPORT_BATCH_SIZE) -> AsyncIterator[dict]:
+    """Recorre todas las membresías (opcionalmente filtradas por status) para exportarlas en streaming."""
+    return querys.db_iter_members_export(status, batch_size)
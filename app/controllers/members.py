@@ -1,46 +1,144 @@
+from collections.abc import AsyncIterator
 from ..db import querys
+from ..db.cache import invalidate_channel
+from ..db.pagination import encode_cursor, decode_cursor, encode_key_cursor, decode_key_cursor
 from ..schemas.channels import Channel, ChannelMember
 from ..schemas.payloads import ChannelUserPayload
-from ..schemas.responses import ChannelBasicInfoResponse
-from ..events.publish import publish_message_main
-from ..events.clients import rabbit_clients
-from datetime import datetime
+from ..schemas.responses import ChannelBasicInfoResponse, MembershipChangeResponse
+from ..events.outbox import notify_outbox
+
+
+def _membership_changed(channel_id: str):
+    """Invalida la caché local del canal y avisa al relay (el evento ya quedó en el outbox del canal)."""
+    invalidate_channel(channel_id)
+    notify_outbox()
 
 
 async def add_user_to_channel(payload: ChannelUserPayload) -> Channel | None:
     """Agrega un usuario a un canal existente en MongoDB."""
-    channel = querys.db_add_user_to_channel(payload.channel_id, payload.user_id)
+    channel = await querys.db_add_user_to_channel(payload.channel_id, payload.user_id)
     
     if channel:
-        added_user = next((u for u in channel.users if u.id == payload.user_id), None)
-        publish_payload = {"channel_id": channel.id, "user_id": payload.user_id, "added_at": added_user.joined_at if added_user else None}
-        await publish_message_main(rabbit_clients["channel"], publish_payload, "channelService.v1.user.added")
+        _membership_changed(payload.channel_id)
     
     return channel
 
 
+async def add_user_to_channel_minimal(payload: ChannelUserPayload) -> MembershipChangeResponse | None:
+    """Agrega un usuario a un canal y devuelve solo el miembro agregado y el nuevo conteo."""
+    change = await querys.db_add_user_to_channel_minimal(payload.channel_id, payload.user_id)
+
+    if change:
+        _membership_changed(payload.channel_id)
+
+    return change
+
+
 async def remove_user_from_channel(payload: ChannelUserPayload) -> Channel | None:
     """Elimina un usuario de un canal existente en MongoDB."""
-    channel = querys.db_remove_user_from_channel(payload.channel_id, payload.user_id)
+    channel = await querys.db_remove_user_from_channel(payload.channel_id, payload.user_id)
     
     if channel:
-        publish_payload = {"channel_id": channel.id, "user_id": payload.user_id, "removed_at": datetime.now().timestamp()}
-        await publish_message_main(rabbit_clients["channel"], publish_payload, "channelService.v1.user.removed")
+        _membership_changed(payload.channel_id)
     
     return channel
 
 
-def get_channels_by_member(user_id: str) -> list[ChannelBasicInfoResponse]:
-    """Obtiene todos los canales en los que un usuario es miembro desde MongoDB."""
-    return querys.db_get_channels_by_member_id(user_id)
+async def remove_user_from_channel_minimal(payload: ChannelUserPayload) -> MembershipChangeResponse | None:
+    """Elimina un usuario de un canal y devuelve solo el miembro eliminado y el nuevo conteo."""
+    change = await querys.db_remove_user_from_channel_minimal(payload.channel_id, payload.user_id)
+
+    if change:
+        _membership_changed(payload.channel_id)
+
+    return change
+
+
+def _next_page(channels: list[ChannelBasicInfoResponse], page_size: int) -> tuple[list[ChannelBasicInfoResponse], str | None]:
+    """Recorta el elemento extra pedido a la base de datos y calcula el cursor de la página siguiente."""
+    if len(channels) <= page_size:
+        return channels, None
+    channels = channels[:page_size]
+    return channels, encode_cursor(channels[-1].id)
+
+
+async def get_channels_by_member(user_id: str, cursor: str | None = None, page_size: int = 100) -> tuple[list[ChannelBasicInfoResponse], str | None]:
+    """Obtiene una página de los canales en los que un usuario es miembro (paginación por cursor).
+
+    Returns:
+        tuple: (channels, next_cursor). `next_cursor` es None si no hay más páginas.
+    """
+    after_id = decode_cursor(cursor) if cursor else None
+    channels = await querys.db_get_channels_by_member_id(user_id, after_id, limit=page_size + 1)
+    return _next_page(channels, page_size)
 
 
-def get_channels_by_owner(owner_id: str) -> list[ChannelBasicInfoResponse]:
-    """Obtiene todos los canales asociados a un propietario específico desde MongoDB."""
-    return querys.db_get_channels_by_owner_id(owner_id)
+async def get_channels_by_owner(owner_id: str, cursor: str | None = None, page_size: int = 100) -> tuple[list[ChannelBasicInfoResponse], str | None]:
+    """Obtiene una página de los canales de un propietario (paginación por cursor).
 
+    Returns:
+        tuple: (channels, next_cursor). `next_cursor` es None si no hay más páginas.
+    """
+    after_id = decode_cursor(cursor) if cursor else None
+    channels = await querys.db_get_channels_by_owner_id(owner_id, after_id, limit=page_size + 1)
+    return _next_page(channels, page_size)
 
-def get_channel_member_ids(channel_id: str, page: int, page_size: int) -> list[ChannelMember] | None:
-    """Obtiene los IDs de los miembros de un canal específico desde MongoDB."""
+
+def stream_channels_by_member(user_id: str, cursor: str | None = None) -> AsyncIterator[ChannelBasicInfoResponse]:
+    """Recorre todos los canales de un miembro (desde `cursor`, si se indica) sin cargarlos en memoria."""
+    return querys.db_iter_channels_by_member_id(user_id, decode_cursor(cursor) if cursor else None)
+
+
+def stream_channels_by_owner(owner_id: str, cursor: str | None = None) -> AsyncIterator[ChannelBasicInfoResponse]:
+    """Recorre todos los canales de un propietario (desde `cursor`, si se indica) sin cargarlos en memoria."""
+    return querys.db_iter_channels_by_owner_id(owner_id, decode_cursor(cursor) if cursor else None)
+
+
+async def get_channel_member(channel_id: str, user_id: str) -> tuple[bool, ChannelMember | None]:
+    """Obtiene la membresía (y su status) de un usuario en un canal activo.
+
+    Returns:
+        tuple: (channel_active, member)
+    """
+    return await querys.db_get_channel_member(channel_id, user_id)
+
+
+async def get_channel_member_ids(
+    channel_id: str,
+    page: int,
+    page_size: int,
+    status: str | None = None
+) -> tuple[list[ChannelMember] | None, float | None]:
+    """Obtiene los IDs de los miembros de un canal específico desde MongoDB, opcionalmente filtrados por status.
+
+    Returns:
+        tuple: (members, updated_at). `members` es None si el canal no existe; `updated_at` es la versión
+        del canal leída en la misma consulta (None si no existe o está desactivado).
+    """
     offset = (page - 1) * page_size
-    return querys.db_get_channel_member_ids(channel_id, skip=offset, limit=page_size)
+    result = await querys.db_get_channel_member_ids(channel_id, skip=offset, limit=page_size, status=status)
+    return result if result is not None else (None, None)
+
+
+async def get_channel_members_after(
+    channel_id: str,
+    cursor: str | None,
+    page_size: int,
+    status: str | None = None
+) -> tuple[list[ChannelMember] | None, str | None, float | None]:
+    """Obtiene una página de miembros de un canal a partir de un cursor opaco (paginación por keyset).
+
+    Returns:
+        tuple: (members, next_cursor, updated_at). `members` es None si el canal no existe; `next_cursor`
+        es None si no hay más páginas; `updated_at` como en `get_channel_member_ids`.
+    """
+    after_user_id = decode_key_cursor(cursor) if cursor else None
+    # Se pide un elemento extra para saber si existe una página siguiente
+    result = await querys.db_get_channel_member_ids(channel_id, limit=page_size + 1, after_user_id=after_user_id, status=status)
+    if result is None:
+        return None, None, None
+    members, updated_at = result
+    if len(members) <= page_size:
+        return members, None, updated_at
+    members = members[:page_size]
+    return members, encode_key_cursor(members[-1].id), updated_at
@@ -0,0 +1,146 @@
+"""Filtro de Bloom (opcional) de los IDs de canales existentes.
+
+Permite responder "el canal no existe" sin consultar MongoDB cuando se pide un ID que nunca se
+creó. Un resultado positivo solo significa "puede existir" y la consulta se hace igual.
+
+Los canales nunca se eliminan físicamente (ver `db_deactivate_channel`), así que el filtro solo
+crece: se reconstruye al iniciar (`rebuild_channel_filter`) y se le agregan los canales creados
+por esta réplica (`db_create_channel`) y por las demás (evento `channelService.v1.channel.created`).
+
+El evento de un canal creado en otra réplica llega con retraso (lo publica el relay del outbox), así
+que el filtro solo descarta IDs generados antes de construirse: un `_id` cuyo `generation_time` es
+posterior al inicio de la construcción (menos `CHANNEL_BLOOM_CLOCK_SKEW`) siempre "puede existir".
+Las escrituras y la moderación no consultan el filtro.
+"""
+import hashlib
+import logging
+import math
+import os
+import time
+from bson import ObjectId
+from bson.errors import InvalidId
+from .conn import get_async_database
+from ..models.channels import ChannelDocument
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_BLOOM_ENABLED = os.getenv("CHANNEL_BLOOM_ENABLED", "false").lower() == "true"
+# Canales esperados; al reconstruir se usa al menos el doble de los existentes
+CHANNEL_BLOOM_CAPACITY = int(os.getenv("CHANNEL_BLOOM_CAPACITY", "1000000"))
+CHANNEL_BLOOM_ERROR_RATE = float(os.getenv("CHANNEL_BLOOM_ERROR_RATE", "0.01"))
+CHANNEL_BLOOM_BATCH_SIZE = 5000
+# Desfase de reloj tolerado (segundos) entre las réplicas que generan los `_id` y esta
+CHANNEL_BLOOM_CLOCK_SKEW = float(os.getenv("CHANNEL_BLOOM_CLOCK_SKEW", "60"))
+
+
+class BloomFilter:
+    """Filtro de Bloom sobre claves `bytes`, dimensionado para `capacity` claves con `error_rate` de falsos positivos."""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._bits_set = 0
+        self.count = 0
+
+    def _positions(self, key: bytes):
+        # Doble hashing (Kirsch-Mitzenmacher): k posiciones a partir de dos hashes de 64 bits
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key: bytes):
+        for position in self._positions(key):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not self._bits[byte] & mask:
+                self._bits[byte] |= mask
+                self._bits_set += 1
+        self.count += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def false_positive_rate(self) -> float:
+        """Tasa de falsos positivos estimada a partir de la proporción de bits encendidos."""
+        return (self._bits_set / self.size) ** self.hash_count
+
+
+class _ChannelFilterState:
+    filter: BloomFilter | None = None
+    # Mientras se reconstruye, todas las consultas van a MongoDB
+    ready: bool = False
+    # Inicio (timestamp) de la última construcción: los IDs generados después no están en el filtro
+    built_at: float = 0.0
+    checks: int = 0
+    recent_misses: int = 0
+    definite_misses: int = 0
+
+_state = _ChannelFilterState()
+
+
+def channel_may_exist(object_id: ObjectId) -> bool:
+    """False solo si el canal seguro no existe; True si puede existir (o si el filtro no está listo)."""
+    if not _state.ready:
+        return True
+    _state.checks += 1
+    if object_id.binary in _state.filter:
+        return True
+    if object_id.generation_time.timestamp() >= _state.built_at - CHANNEL_BLOOM_CLOCK_SKEW:
+        # Posterior a la construcción: puede ser un canal de otra réplica cuyo evento aún no llega
+        _state.recent_misses += 1
+        return True
+    _state.definite_misses += 1
+    return False
+
+
+def add_channel(channel_id: ObjectId | str):
+    """Registra un canal recién creado. No hace nada si el filtro está deshabilitado."""
+    if _state.filter is None:
+        return
+    try:
+        key = ObjectId(channel_id).binary
+    except (InvalidId, TypeError):
+        logger.warning(f"ID de canal inválido para el filtro de Bloom: {channel_id}")
+        return
+    # El evento de creación también llega a la réplica que creó el canal
+    if key not in _state.filter:
+        _state.filter.add(key)
+
+
+async def rebuild_channel_filter():
+    """Construye el filtro con los `_id` de todos los canales (cursor proyectado, en lotes).
+
+    Los canales creados mientras se recorre el cursor se agregan al filtro nuevo vía `add_channel`.
+    """
+    if not CHANNEL_BLOOM_ENABLED:
+        return
+
+    collection = get_async_database()[ChannelDocument._get_collection_name()]
+    existing = await collection.estimated_document_count()
+    _state.ready = False
+    _state.built_at = time.time()
+    _state.filter = BloomFilter(max(CHANNEL_BLOOM_CAPACITY, 2 * existing), CHANNEL_BLOOM_ERROR_RATE)
+
+    async for document in collection.find({}, {"_id": 1}).batch_size(CHANNEL_BLOOM_BATCH_SIZE):
+        _state.filter.add(document["_id"].binary)
+
+    _state.ready = True
+    logger.info(f"Filtro de Bloom de canales construido con {_state.filter.count} canal(es) ({_state.filter.size} bits, {_state.filter.hash_count} hashes).")
+
+
+def bloom_stats() -> dict:
+    """Métricas del filtro de Bloom de canales."""
+    if _state.filter is None:
+        return {"enabled": CHANNEL_BLOOM_ENABLED, "ready": False}
+    return {
+        "enabled": CHANNEL_BLOOM_ENABLED,
+        "ready": _state.ready,
+        "channels": _state.filter.count,
+        "size_bits": _state.filter.size,
+        "hash_count": _state.filter.hash_count,
+        "false_positive_rate": _state.filter.false_positive_rate(),
+        "checks": _state.checks,
+        "recent_misses": _state.recent_misses,
+        "definite_misses": _state.definite_misses,
+    }
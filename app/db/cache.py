@@ -0,0 +1,143 @@
+"""Caché en proceso (TTL + LRU) de lecturas de canales.
+
+Guarda el canal (con y sin miembros), su información básica y su estado activo/inactivo. Toda
+escritura sobre un canal o sus miembros debe llamar a `invalidate_channel`; las demás réplicas se
+enteran por los eventos del exchange `channel` (ver `events/listeners/cache.py`).
+
+Los fallos concurrentes de una misma clave comparten una sola consulta (ver `singleflight.py`),
+también con la caché deshabilitada.
+"""
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+from bson import ObjectId
+from bson.errors import InvalidId
+from .singleflight import SingleFlight
+
+CHANNEL_CACHE_ENABLED = os.getenv("CHANNEL_CACHE_ENABLED", "true").lower() == "true"
+# Segundos que una entrada se considera válida; acota la desactualización si se pierde una invalidación
+CHANNEL_CACHE_TTL = float(os.getenv("CHANNEL_CACHE_TTL", "30"))
+# Cantidad máxima de entradas por caché; al superarla se descarta la usada hace más tiempo
+CHANNEL_CACHE_MAX_SIZE = int(os.getenv("CHANNEL_CACHE_MAX_SIZE", "10000"))
+
+
+class TTLCache:
+    """Caché LRU acotada por cantidad de entradas, con expiración por TTL y contadores de aciertos."""
+
+    def __init__(self, name: str, ttl: float = CHANNEL_CACHE_TTL, max_size: int = CHANNEL_CACHE_MAX_SIZE, enabled: bool = CHANNEL_CACHE_ENABLED):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.enabled = enabled
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        # Se incrementa con cada invalidación: una carga que empezó antes no debe guardar su resultado
+        self._epoch = 0
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Devuelve el valor guardado en `key` o lo carga con `loader` y lo guarda.
+
+        Las llamadas concurrentes con la misma clave comparten una sola ejecución de `loader`.
+        Los resultados `None` (canal inexistente o inactivo) no se guardan.
+        """
+        if not self.enabled:
+            return await self._flights.do(key, loader)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        self.misses += 1
+        return await self._flights.do(key, lambda: self._load(key, loader))
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        epoch = self._epoch
+        value = await loader()
+        if value is not None and epoch == self._epoch:
+            self._store(key, value)
+        return value
+
+    def _store(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys: Hashable):
+        self._epoch += 1
+        for key in keys:
+            # Una lectura posterior a la escritura no debe unirse a una carga iniciada antes
+            self._flights.forget(key)
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        self._epoch += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            **self._flights.stats(),
+        }
+
+
+# Claves (= consultas distintas): (channel_id, include_members) para canales; channel_id para información básica y estado
+channel_cache = TTLCache("channel")
+basic_info_cache = TTLCache("basic_info")
+status_cache = TTLCache("status")
+
+_caches = (channel_cache, basic_info_cache, status_cache)
+
+
+def channel_cache_key(channel_id: str) -> str | None:
+    """Clave de un canal en las cachés: su ObjectId en hexadecimal en minúsculas, igual que `str(ObjectId)`
+    en los eventos, para que todas las formas de un mismo ID compartan entrada. None si el ID no es
+    válido: esas lecturas no se guardan."""
+    try:
+        return str(ObjectId(channel_id))
+    except (InvalidId, TypeError):
+        return None
+
+
+def invalidate_channel(channel_id: str):
+    """Descarta de todas las cachés las entradas de un canal."""
+    key = channel_cache_key(channel_id)
+    if key is None:
+        return
+    channel_cache.invalidate((key, True), (key, False))
+    basic_info_cache.invalidate(key)
+    status_cache.invalidate(key)
+
+
+def clear_caches():
+    for cache in _caches:
+        cache.clear()
+
+
+def cache_stats() -> dict:
+    """Métricas de aciertos/fallos de cada caché."""
+    return {
+        "enabled": CHANNEL_CACHE_ENABLED,
+        "ttl": CHANNEL_CACHE_TTL,
+        **{cache.name: cache.stats() for cache in _caches},
+    }
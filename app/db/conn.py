@@ -1,5 +1,6 @@
 import os
 from mongoengine import connect, disconnect, connection
+from pymongo import AsyncMongoClient
 from logging import getLogger, INFO
 
 # Configuración básica de logging
@@ -8,33 +9,46 @@ logger = getLogger(__name__)
 class DBManager:
     """
     Clase para gestionar la conexión a la base de datos MongoDB.
+
+    `client`/`database` son la conexión síncrona de mongoengine (modelos e índices).
+    `async_client`/`async_database` son la conexión asíncrona usada por las consultas.
     """
     client = None
     database = None
+    async_client: AsyncMongoClient | None = None
+    async_database = None
     alias: str = "default"
 
 db_manager = DBManager()
 
 # ====================================
 
-def connect_to_mongo():
+async def connect_to_mongo():
     """
     Establece la conexión con la base de datos MongoDB.
     """
     mongo_url = os.getenv("MONGO_URL", "mongodb://localhost:27017")
     logger.info(f"Conectando a MongoDB en: {mongo_url} ...")
-    
+
     mongo_db_name = os.getenv("MONGO_DB_NAME", "channel_db")
     connect(db=mongo_db_name, host=mongo_url, alias=db_manager.alias)
     db_manager.client = connection.get_connection(alias=db_manager.alias)
     db_manager.database = connection.get_db(alias=db_manager.alias)
+
+    db_manager.async_client = AsyncMongoClient(mongo_url)
+    db_manager.async_database = db_manager.async_client[mongo_db_name]
+    await db_manager.async_database.command("ping")
     logger.info("Conexión a MongoDB establecida con éxito.")
 
-def close_mongo_connection():
+async def close_mongo_connection():
     """
     Cierra la conexión con la base de datos MongoDB.
     """
     logger.info("Cerrando la conexión a MongoDB...")
+    if db_manager.async_client:
+        await db_manager.async_client.close()
+        db_manager.async_client = None
+        db_manager.async_database = None
     if db_manager.client:
         disconnect(alias=db_manager.alias)
         db_manager.client = None
@@ -48,3 +62,11 @@ def get_database():
     if db_manager.client is None:
         raise Exception("La conexión a la base de datos no está establecida. Llama a connect_to_mongo() primero.")
     return connection.get_db(alias=db_manager.alias)
+
+def get_async_database():
+    """
+    Obtiene la instancia asíncrona de la base de datos MongoDB.
+    """
+    if db_manager.async_database is None:
+        raise Exception("La conexión a la base de datos no está establecida. Llama a connect_to_mongo() primero.")
+    return db_manager.async_database
@@ -0,0 +1,98 @@
+import os
+import logging
+from mongoengine import Document
+from .conn import get_async_database
+from ..models.channels import ChannelDocument
+from ..models.members import MemberDocument
+
+logger = logging.getLogger(__name__)
+
+# Modo de gestión de índices al iniciar:
+# - "create": crea los índices declarados que falten y reemplaza o elimina los que no coinciden (por defecto)
+# - "verify": no cambia nada; falla el arranque si algún índice falta, difiere o sobra
+# - "warn": no cambia nada; solo registra una advertencia por cada diferencia
+INDEX_MODE = os.getenv("MONGO_INDEX_MODE", "create").lower()
+
+# Modelos cuyos índices se gestionan al iniciar
+INDEXED_DOCUMENTS: list[type[Document]] = [ChannelDocument, MemberDocument]
+
+# Índices que se declararon antes y ya no se usan, por colección; en modo "create" se eliminan
+OBSOLETE_INDEXES: dict[str, list[str]] = {
+    # owner_id_is_active: reemplazado por owner_id_is_active_id (listado por propietario ordenado por _id).
+    # users_id_is_active: los miembros pasaron a la colección `channel_members`.
+    # outbox_since: reemplazado por outbox_since_retry_at (omite los canales aplazados).
+    "channels": ["owner_id_is_active", "users_id_is_active", "outbox_since"],
+}
+
+# Opciones que distinguen dos índices con las mismas claves, con su valor por defecto
+INDEX_OPTIONS = {"unique": False, "sparse": False, "partialFilterExpression": None}
+
+class MissingIndexError(Exception):
+    """Excepción lanzada en modo 'verify' cuando faltan índices declarados, tienen otras opciones o sobran obsoletos."""
+    pass
+
+def _index_options(index: dict) -> dict:
+    return {option: index.get(option, default) for option, default in INDEX_OPTIONS.items()}
+
+async def _index_changes(document_cls: type[Document]) -> tuple[list[dict], list[str]]:
+    """Compara los índices declarados en el modelo con los de la colección.
+
+    Un índice existente con las mismas claves pero distintas opciones (`INDEX_OPTIONS`) no sirve: se
+    elimina y se vuelve a crear con las declaradas.
+
+    Returns:
+        tuple: (especificaciones de índices a crear, nombres de índices existentes a eliminar).
+    """
+    collection = get_async_database()[document_cls._get_collection_name()]
+    existing = await collection.index_information()
+    existing_by_key = {tuple(tuple(key) for key in info["key"]): (name, info) for name, info in existing.items()}
+
+    missing, to_drop = [], []
+    for spec in document_cls._meta["index_specs"]:
+        name, info = existing_by_key.get(tuple(tuple(key) for key in spec["fields"]), (None, None))
+        if info is None:
+            missing.append(spec)
+        elif _index_options(info) != _index_options(spec):
+            missing.append(spec)
+            to_drop.append(name)
+    to_drop += [name for name in OBSOLETE_INDEXES.get(collection.name, []) if name in existing]
+    return missing, to_drop
+
+async def _create_indexes(document_cls: type[Document], specs: list[dict]):
+    collection = get_async_database()[document_cls._get_collection_name()]
+    background = document_cls._meta.get("index_background", False)
+    for spec in specs:
+        options = {key: value for key, value in spec.items() if key != "fields"}
+        name = await collection.create_index(spec["fields"], background=background, **options)
+        logger.info(f"Índice '{name}' creado en la colección '{collection.name}'.")
+
+async def ensure_indexes(mode: str = INDEX_MODE):
+    """Crea o verifica los índices declarados en los modelos según `mode`."""
+    if mode not in ("create", "verify", "warn"):
+        raise ValueError(f"Modo de índices desconocido: '{mode}'. Use 'create', 'verify' o 'warn'.")
+
+    for document_cls in INDEXED_DOCUMENTS:
+        collection_name = document_cls._get_collection_name()
+        missing, to_drop = await _index_changes(document_cls)
+        if not missing and not to_drop:
+            logger.info(f"Todos los índices de la colección '{collection_name}' están presentes.")
+            continue
+
+        missing_names = [spec.get("name", spec["fields"]) for spec in missing]
+        if mode == "create":
+            collection = get_async_database()[collection_name]
+            for name in to_drop:
+                await collection.drop_index(name)
+                logger.info(f"Índice '{name}' eliminado de la colección '{collection_name}'.")
+            if missing:
+                logger.info(f"Creando {len(missing)} índice(s) faltante(s) en '{collection_name}'...")
+                await _create_indexes(document_cls, missing)
+        elif mode == "verify":
+            message = f"Índices de la colección '{collection_name}' distintos a los declarados: faltan {missing_names}, sobran {to_drop}"
+            logger.error(message)
+            raise MissingIndexError(message)
+        else:
+            for name in missing_names:
+                logger.warning(f"Falta el índice {name} (o tiene otras opciones) en la colección '{collection_name}'.")
+            for name in to_drop:
+                logger.warning(f"El índice '{name}' de la colección '{collection_name}' ya no se usa.")
@@ -0,0 +1,132 @@
+"""Tareas de mantenimiento de datos en MongoDB.
+
+Uso:
+    python -m app.db.maintenance migrate-members [--batch-size 500] [--dry-run]
+    python -m app.db.maintenance repair-user-count [--batch-size 500] [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+from bson import ObjectId
+from pymongo import UpdateOne
+from .conn import connect_to_mongo, close_mongo_connection, get_async_database
+from .querys import db_migrate_legacy_members
+from ..models.channels import ChannelDocument
+from ..models.members import MemberDocument
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+def _channels_collection():
+    return get_async_database()[ChannelDocument._get_collection_name()]
+
+def _members_collection():
+    return get_async_database()[MemberDocument._get_collection_name()]
+
+async def _count_members(channel_ids: list[ObjectId]) -> dict[ObjectId, int]:
+    """Cuenta los miembros de cada canal en `channel_ids` con una sola agregación."""
+    pipeline = [
+        {"$match": {"channel_id": {"$in": channel_ids}}},
+        {"$group": {"_id": "$channel_id", "count": {"$sum": 1}}}
+    ]
+    counts = {channel_id: 0 for channel_id in channel_ids}
+    async for doc in await _members_collection().aggregate(pipeline):
+        counts[doc["_id"]] = doc["count"]
+    return counts
+
+async def repair_user_counts(batch_size: int = DEFAULT_BATCH_SIZE, dry_run: bool = False) -> int:
+    """Recalcula `user_count` de los canales a partir de `channel_members`, en lotes por `_id`.
+
+    La corrección está condicionada al valor leído, así que un alta/baja concurrente hace que ese
+    canal se omita en lugar de sobrescribir su $inc; basta con volver a ejecutar la tarea.
+
+    Returns:
+        int: Cantidad de canales corregidos (o que se corregirían con `dry_run`).
+    """
+    last_id = None
+    repaired = 0
+
+    while True:
+        query = {} if last_id is None else {"_id": {"$gt": last_id}}
+        batch = await _channels_collection().find(query, {"_id": 1, "user_count": 1}).sort("_id", 1).limit(batch_size).to_list()
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        counts = await _count_members([doc["_id"] for doc in batch])
+        updates = [
+            UpdateOne({"_id": doc["_id"], "user_count": doc.get("user_count")}, {"$set": {"user_count": counts[doc["_id"]]}})
+            for doc in batch if doc.get("user_count") != counts[doc["_id"]]
+        ]
+        if updates and not dry_run:
+            result = await _channels_collection().bulk_write(updates, ordered=False)
+            repaired += result.modified_count
+        else:
+            repaired += len(updates)
+        logger.info(f"Lote procesado hasta _id={last_id}: {repaired} canal(es) corregido(s) en total.")
+
+    logger.info(f"Reparación de user_count finalizada: {repaired} canal(es) {'por corregir' if dry_run else 'corregido(s)'}.")
+    return repaired
+
+async def migrate_embedded_members(batch_size: int = DEFAULT_BATCH_SIZE, dry_run: bool = False) -> int:
+    """Copia los miembros embebidos (`channels.users`) a la colección `channel_members`, en lotes.
+
+    Cada lote se migra en una transacción (ver `db_migrate_legacy_members`): inserta los miembros con
+    upsert + $setOnInsert (no pisa altas o cambios de estado hechos por el servicio), elimina el arreglo
+    `users` de los canales copiados y recalcula su `user_count`. El servicio lee el arreglo legado y
+    migra cada canal al tocarlo, así que la tarea puede correr en cualquier momento. Es idempotente:
+    si se interrumpe, basta con volver a ejecutarla. Requiere el índice único (channel_id, user_id),
+    que el servicio crea al iniciar.
+
+    Returns:
+        int: Cantidad de canales migrados (o que se migrarían con `dry_run`).
+    """
+    legacy_query = {"users": {"$exists": True}}
+    if dry_run:
+        pending = await _channels_collection().count_documents(legacy_query)
+        logger.info(f"Migración de miembros: {pending} canal(es) por migrar.")
+        return pending
+
+    migrated = 0
+    last_id = None
+    while True:
+        query = legacy_query if last_id is None else {**legacy_query, "_id": {"$gt": last_id}}
+        batch = await _channels_collection().find(query, {"_id": 1}).sort("_id", 1).limit(batch_size).to_list()
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        # Los canales que el servicio migró mientras tanto ya no se cuentan
+        migrated += await db_migrate_legacy_members([doc["_id"] for doc in batch])
+        logger.info(f"Lote migrado hasta _id={last_id}: {migrated} canal(es) migrado(s) en total.")
+
+    logger.info(f"Migración de miembros finalizada: {migrated} canal(es) migrado(s).")
+    return migrated
+
+async def _main():
+    parser = argparse.ArgumentParser(description="Tareas de mantenimiento de datos en MongoDB.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate-members", help="Copia los miembros embebidos de los canales a la colección channel_members.")
+    migrate_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    migrate_parser.add_argument("--dry-run", action="store_true", help="Solo cuenta los canales a migrar.")
+
+    repair_parser = subparsers.add_parser("repair-user-count", help="Rellena o corrige el contador user_count de los canales.")
+    repair_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    repair_parser.add_argument("--dry-run", action="store_true", help="Solo cuenta los canales a corregir.")
+
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    try:
+        if args.command == "migrate-members":
+            await migrate_embedded_members(batch_size=args.batch_size, dry_run=args.dry_run)
+        elif args.command == "repair-user-count":
+            await repair_user_counts(batch_size=args.batch_size, dry_run=args.dry_run)
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,34 @@
+import base64
+import binascii
+from bson import ObjectId
+from bson.errors import InvalidId
+
+class InvalidCursorError(ValueError):
+    """Excepción lanzada cuando un cursor de paginación no es válido."""
+    pass
+
+def encode_cursor(object_id: str | ObjectId) -> str:
+    """Codifica un `_id` como cursor opaco (base64 url-safe, sin padding)."""
+    return base64.urlsafe_b64encode(ObjectId(object_id).binary).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> ObjectId:
+    """Decodifica un cursor opaco al `_id` a partir del cual continuar."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return ObjectId(raw)
+    except (binascii.Error, InvalidId, TypeError, ValueError) as e:
+        raise InvalidCursorError(f"Cursor de paginación inválido: '{cursor}'") from e
+
+def encode_key_cursor(key: str) -> str:
+    """Codifica una clave de texto (p. ej. un `user_id`) como cursor opaco."""
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_key_cursor(cursor: str) -> str:
+    """Decodifica un cursor opaco a la clave de texto a partir de la cual continuar."""
+    try:
+        key = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise InvalidCursorError(f"Cursor de paginación inválido: '{cursor}'") from e
+    if not key:
+        raise InvalidCursorError(f"Cursor de paginación inválido: '{cursor}'")
+    return key
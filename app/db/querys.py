@@ -1,291 +1,952 @@
-from mongoengine.errors import DoesNotExist, ValidationError
-from mongoengine.queryset.visitor import Q
-from ..models.channels import ChannelDocument, _document_to_channel, _document_to_channel_basic_info, ChannelMemberDocument
+import asyncio
+import functools
+import os
+from collections import deque
+from collections.abc import AsyncIterator
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from .conn import get_async_database
+from .bloom import channel_may_exist, add_channel
+from ..deadline import is_deadline_error
+from ..models.channels import ChannelDocument, _raw_to_channel, _raw_to_basic_infos
+from ..models.members import MemberDocument, _raw_to_member, _raw_to_members
 from datetime import datetime
 from ..schemas.channels import Channel, ChannelMember
 from ..schemas.payloads import ChannelUserPayload, ChannelUpdatePayload, ChannelCreatePayload
-from ..schemas.responses import ChannelBasicInfoResponse
+from ..schemas.responses import ChannelBasicInfoResponse, MembershipChangeResponse
 import logging
-from bson import ObjectId
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def db_create_channel(channel_data: ChannelCreatePayload) -> Channel | None:
-    payload = channel_data.model_dump()
+# `user_count` de un canal. Los canales creados antes del contador no lo tienen hasta que se migran o se
+# ejecuta `repair-user-count`: se toma el largo de su arreglo legado `users`
+USER_COUNT_EXPRESSION = {"$ifNull": ["$user_count", {"$size": {"$ifNull": ["$users", []]}}]}
+
+# Proyección común para las respuestas de información básica de un canal
+BASIC_INFO_PROJECTION = {
+    "$project": {
+        "id": {"$toString": "$_id"},
+        "name": "$name",
+        "owner_id": "$owner_id",
+        "channel_type": "$channel_type",
+        "created_at": "$created_at",
+        "updated_at": "$updated_at",
+        "user_count": USER_COUNT_EXPRESSION
+    }
+}
+
+# Excluye los eventos pendientes de las lecturas de canales. Del arreglo legado `users` (ver ChannelDocument.users)
+# solo se trae un arreglo vacío si existe, para detectar los canales aún no migrados
+CHANNEL_PROJECTION = {"users": {"$slice": 0}, "outbox": 0, "outbox_since": 0}
+
+# Proyección de las verificaciones previas a una escritura: `users` aparece (vacío) solo si el canal no está
+# migrado, y `user_count` falta en los canales creados antes del contador
+LEGACY_CHECK_PROJECTION = {"_id": 1, "users": {"$slice": 0}, "user_count": 1}
+
+MEMBER_PROJECTION = {"_id": 0, "user_id": 1, "joined_at": 1, "status": 1}
+
+# Etapa de agregación que entrega los miembros ya con la forma de `ChannelMember`, para validarlos por lote
+MEMBER_LIST_PROJECTION = {"$project": {"_id": 0, "id": "$user_id", "joined_at": 1, "status": 1}}
+
+# Campos del canal que devuelve una alta/baja de miembro en su representación mínima
+MEMBERSHIP_CHANGE_PROJECTION = {"_id": 1, "user_count": 1, "updated_at": 1}
+
+# Máximo de eventos pendientes en el outbox de un canal: con el relay detenido o un evento que no se
+# puede publicar, las escrituras sobre el canal se rechazan (`OutboxFullError`) en vez de crecer el documento
+OUTBOX_MAX_PENDING = int(os.getenv("OUTBOX_MAX_PENDING", "1000"))
+# Segundos sugeridos (cabecera Retry-After) para reintentar una escritura rechazada por outbox lleno
+OUTBOX_FULL_RETRY_AFTER = int(os.getenv("OUTBOX_FULL_RETRY_AFTER", "5"))
+# Condición de las escrituras que encolan un evento: el outbox aún no tiene `OUTBOX_MAX_PENDING` eventos
+OUTBOX_HAS_ROOM = {f"outbox.{OUTBOX_MAX_PENDING - 1}": {"$exists": False}}
+
+# Eventos que el broker rechazó repetidamente, retirados del outbox (ver `db_dead_letter_outbox_event`)
+OUTBOX_DEAD_LETTERS_COLLECTION = "outbox_dead_letters"
+
+# Colección de locks con vencimiento (p. ej. el del relay del outbox, ver `db_acquire_lease`)
+LOCKS_COLLECTION = "service_locks"
+
+# Documentos por lote que pide al servidor un cursor recorrido en streaming
+STREAM_BATCH_SIZE = 500
+
+# Lote por defecto de las exportaciones masivas (documentos pequeños y proyectados)
+EXPORT_BATCH_SIZE = 1000
+
+# Campos de un canal en la exportación NDJSON (sin el arreglo legado `users`)
+EXPORT_CHANNEL_PROJECTION = {
+    "$project": {
+        "_id": 0,
+        "id": {"$toString": "$_id"},
+        "name": 1,
+        "owner_id": 1,
+        "channel_type": 1,
+        "is_active": 1,
+        "user_count": USER_COUNT_EXPRESSION,
+        "created_at": 1,
+        "updated_at": 1,
+        "deleted_at": 1
+    }
+}
+
+EXPORT_MEMBER_PROJECTION = {
+    "$project": {
+        "_id": 0,
+        "channel_id": {"$toString": "$channel_id"},
+        "user_id": 1,
+        "joined_at": 1,
+        "status": 1
+    }
+}
+
+def _fallback_on_error(message: str, default_factory=lambda: None):
+    """Decorador para lecturas que, ante un error, lo registran y devuelven `default_factory()`.
+
+    Un deadline agotado (ver `is_deadline_error`) no se oculta: se propaga para responder 504.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                if is_deadline_error(e):
+                    raise
+                logger.exception(message)
+                return default_factory()
+        return wrapper
+    return decorator
+
+def _channels_collection():
+    """Colección asíncrona de canales (mismo nombre que declara `ChannelDocument`)."""
+    return get_async_database()[ChannelDocument._get_collection_name()]
+
+def _members_collection():
+    """Colección asíncrona de membresías (mismo nombre que declara `MemberDocument`)."""
+    return get_async_database()[MemberDocument._get_collection_name()]
+
+async def _get_members(channel_object_id: ObjectId) -> list[ChannelMember]:
+    pipeline = [{"$match": {"channel_id": channel_object_id}}, {"$sort": {"user_id": 1}}, MEMBER_LIST_PROJECTION]
+    cursor = await _members_collection().aggregate(pipeline)
+    return _raw_to_members(await cursor.to_list())
+
+async def _build_channel(document: dict | None) -> Channel | None:
+    """Construye un `Channel` a partir del documento crudo, cargando sus miembros.
+
+    Si el canal aún tiene el arreglo legado `users` (ver `CHANNEL_PROJECTION`), antes se migran sus miembros.
+    """
+    if document is None:
+        return None
+    if document.pop("users", None) is not None:
+        await db_migrate_legacy_members([document["_id"]])
+    return _raw_to_channel(document, await _get_members(document["_id"]))
+
+def _outbox_event(routing_key: str, payload: dict, created_at: float) -> dict:
+    """Evento a encolar en el outbox de un canal; lo publica el relay (ver `events/outbox.py`)."""
+    return {"event_id": ObjectId(), "routing_key": routing_key, "payload": payload, "created_at": created_at}
+
+def _outbox_push(event: dict) -> dict:
+    """Operadores que encolan `event` en el outbox del canal, en la misma actualización que el cambio que lo origina."""
+    return {"$push": {"outbox": event}, "$min": {"outbox_since": event["created_at"]}}
+
+class OutboxFullError(Exception):
+    """Excepción lanzada cuando una escritura encolaría un evento en un outbox que ya tiene `OUTBOX_MAX_PENDING`."""
+    pass
+
+async def _check_outbox_room(object_id: ObjectId, session=None):
+    """Tras una escritura que no encontró su canal con `OUTBOX_HAS_ROOM`, distingue el outbox lleno de
+    los demás casos (canal inexistente, inactivo, ...), que siguen devolviendo None."""
+    full = {"_id": object_id, f"outbox.{OUTBOX_MAX_PENDING - 1}": {"$exists": True}}
+    if await _channels_collection().find_one(full, {"_id": 1}, session=session):
+        raise OutboxFullError(f"El canal '{object_id}' tiene demasiados eventos sin publicar; reintente más tarde.")
+
+class _Rollback(Exception):
+    """Deshace la transacción en curso sin tratarse como error (ver `_run_transaction`)."""
+    pass
+
+async def _run_transaction(callback):
+    """Ejecuta `callback(session)` en una transacción de MongoDB y devuelve su resultado.
+
+    Todas las escrituras de `callback` (p. ej. la membresía, el contador `user_count` del canal y su
+    evento en el outbox) se confirman juntas o no se aplica ninguna. `with_transaction` reintenta
+    ante errores transitorios, como el conflicto de dos transacciones que actualizan el mismo canal.
+    Si `callback` lanza `_Rollback`, la transacción se deshace y se devuelve None.
+    """
+    async with get_async_database().client.start_session() as session:
+        try:
+            return await session.with_transaction(callback)
+        except _Rollback:
+            return None
+
+async def _copy_legacy_members(channel_ids: list[ObjectId], session) -> int:
+    """Migra los canales de `channel_ids` que aún tienen el arreglo legado `users`, dentro de `session`.
+
+    Inserta sus miembros en `channel_members` con upsert + $setOnInsert (no pisa altas ni cambios de
+    status hechos por el servicio), elimina el arreglo y recalcula `user_count`. Como todo ocurre en
+    la misma transacción, un canal nunca queda sin el arreglo y sin sus miembros copiados.
+
+    Returns:
+        int: Cantidad de canales migrados.
+    """
+    documents = await _channels_collection().find(
+        {"_id": {"$in": channel_ids}, "users": {"$exists": True}}, {"_id": 1, "users": 1}, session=session
+    ).to_list()
+    if not documents:
+        return 0
+
+    upserts = [
+        UpdateOne(
+            {"channel_id": doc["_id"], "user_id": member["id"]},
+            {"$setOnInsert": {"joined_at": member["joined_at"], "status": member.get("status", "normal")}},
+            upsert=True
+        )
+        for doc in documents for member in doc.get("users") or []
+    ]
+    if upserts:
+        await _members_collection().bulk_write(upserts, ordered=False, session=session)
+
+    migrated_ids = [doc["_id"] for doc in documents]
+    counts = {channel_id: 0 for channel_id in migrated_ids}
+    pipeline = [{"$match": {"channel_id": {"$in": migrated_ids}}}, {"$group": {"_id": "$channel_id", "count": {"$sum": 1}}}]
+    async for doc in await _members_collection().aggregate(pipeline, session=session):
+        counts[doc["_id"]] = doc["count"]
+    await _channels_collection().bulk_write(
+        [UpdateOne({"_id": channel_id}, {"$unset": {"users": ""}, "$set": {"user_count": count}}) for channel_id, count in counts.items()],
+        ordered=False,
+        session=session
+    )
+    return len(documents)
+
+async def db_migrate_legacy_members(channel_ids: list[ObjectId]) -> int:
+    """Migra en una transacción los miembros embebidos de los canales indicados (ver `_copy_legacy_members`).
+
+    La usan las lecturas que encuentran un canal aún no migrado y la tarea `migrate-members`.
+    """
+    return await _run_transaction(lambda session: _copy_legacy_members(channel_ids, session)) or 0
+
+async def _find_active_channel(query: dict, session) -> bool:
+    """Comprueba dentro de una transacción que el canal de `query` existe y que su outbox admite otro
+    evento (si no, lanza `OutboxFullError`); si aún tiene el arreglo legado `users`, migra sus miembros
+    en la misma transacción antes de la escritura. Si le falta `user_count`, lo calcula antes del $inc."""
+    document = await _channels_collection().find_one({**query, **OUTBOX_HAS_ROOM}, LEGACY_CHECK_PROJECTION, session=session)
+    if document is None:
+        await _check_outbox_room(query["_id"], session)
+        return False
+    if "users" in document:
+        await _copy_legacy_members([document["_id"]], session)
+    elif "user_count" not in document:
+        count = await _members_collection().count_documents({"channel_id": document["_id"]}, session=session)
+        await _channels_collection().update_one({"_id": document["_id"]}, {"$set": {"user_count": count}}, session=session)
+    return True
+
+def _to_object_id(channel_id: str) -> ObjectId | None:
+    """Convierte un ID de canal a ObjectId. Devuelve None si el ID no es válido."""
+    try:
+        return ObjectId(channel_id)
+    except (InvalidId, TypeError):
+        return None
+
+async def db_create_channel(channel_data: ChannelCreatePayload) -> Channel | None:
+    payload = channel_data.model_dump(mode="json")
     if not payload:
         return None
-    
+
     now = datetime.now().timestamp()
-    
-    user_list = [{"id": payload["owner_id"], "joined_at": now, "status": "normal"}]
-    
-    document = ChannelDocument(**payload, users=user_list, created_at=now, updated_at=now)
-    document.save()
-    return _document_to_channel(document)
-
-def db_get_all_channels_paginated(skip: int = 0, limit: int = 100) -> list[ChannelBasicInfoResponse]:
-    try:
-        pipeline = [
-            {"$match": {"is_active": True}},
-            {
-                "$project": {
-                    "id": {"$toString": "$_id"},
-                    "name": "$name",
-                    "owner_id": "$owner_id",
-                    "channel_type": "$channel_type",
-                    "created_at": "$created_at",
-                    "user_count": {"$size": "$users"}
-                }
-            },
-            {"$skip": skip},
-            {"$limit": limit}
-        ]
-        aggregated_results = ChannelDocument.objects.aggregate(pipeline)
-        return [ChannelBasicInfoResponse.model_validate(doc) for doc in aggregated_results]
-    except Exception as e:
-        logger.exception("Error al obtener canales paginados")
-        return []
+    object_id = ObjectId()
+
+    event = _outbox_event(
+        "channelService.v1.channel.created",
+        {"channel_id": str(object_id), "name": payload["name"], "owner_id": payload["owner_id"], "created_at": now},
+        now
+    )
+    document = {
+        "_id": object_id, **payload, "user_count": 1, "is_active": True, "created_at": now, "updated_at": now,
+        "outbox": [event], "outbox_since": now
+    }
+    owner = {"channel_id": object_id, "user_id": payload["owner_id"], "joined_at": now, "status": "normal"}
+
+    async def insert(session):
+        # Copias: `insert_one` agrega `_id` al dict y la transacción puede reintentarse
+        await _channels_collection().insert_one(dict(document), session=session)
+        await _members_collection().insert_one(dict(owner), session=session)
+
+    await _run_transaction(insert)
+    add_channel(object_id)
+    return _raw_to_channel(document, [_raw_to_member(owner)])
+
+@_fallback_on_error("Error al obtener canales paginados", list)
+async def db_get_all_channels_paginated(skip: int = 0, limit: int = 100) -> list[ChannelBasicInfoResponse]:
+    pipeline = [
+        {"$match": {"is_active": True}},
+        {"$sort": {"_id": 1}},
+        {"$skip": skip},
+        {"$limit": limit},
+        BASIC_INFO_PROJECTION
+    ]
+    aggregated_results = await _channels_collection().aggregate(pipeline)
+    return _raw_to_basic_infos(await aggregated_results.to_list())
+
+@_fallback_on_error("Error al obtener canales por cursor", list)
+async def db_get_all_channels_after(after_id: ObjectId | None = None, limit: int = 100) -> list[ChannelBasicInfoResponse]:
+    """Paginación por keyset: canales activos con `_id` mayor que `after_id`, ordenados por `_id`.
+
+    Usa el índice (is_active, _id), por lo que cualquier página cuesta lo mismo que la primera.
+    """
+    match = {"is_active": True}
+    if after_id is not None:
+        match["_id"] = {"$gt": after_id}
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"_id": 1}},
+        {"$limit": limit},
+        BASIC_INFO_PROJECTION
+    ]
+    aggregated_results = await _channels_collection().aggregate(pipeline)
+    return _raw_to_basic_infos(await aggregated_results.to_list())
 
-def db_get_channel_by_id(channel_id: str, include_inactive: bool = False) -> Channel | None:
-    if not channel_id:
+async def db_get_channel_by_id(channel_id: str, include_inactive: bool = False, include_members: bool = True) -> Channel | None:
+    object_id = _to_object_id(channel_id)
+    if object_id is None or not channel_may_exist(object_id):
         return None
-    try:
-        query = Q(id=channel_id) if include_inactive else Q(id=channel_id) & Q(is_active=True)
-        document = ChannelDocument.objects.get(query)
-    except (DoesNotExist, ValidationError):
+    query = {"_id": object_id} if include_inactive else {"_id": object_id, "is_active": True}
+    document = await _channels_collection().find_one(query, CHANNEL_PROJECTION)
+    if not include_members:
+        return _raw_to_channel(document, None)
+    return await _build_channel(document)
+
+async def db_get_channel_version(channel_id: str) -> float | None:
+    """Obtiene solo el `updated_at` de un canal activo (proyección, sin cargar miembros)."""
+    object_id = _to_object_id(channel_id)
+    if object_id is None or not channel_may_exist(object_id):
         return None
-    return _document_to_channel(document)
+    document = await _channels_collection().find_one({"_id": object_id, "is_active": True}, {"_id": 0, "updated_at": 1})
+    return document["updated_at"] if document else None
 
-def db_get_channels_by_owner_id(user_id: str) -> list[ChannelBasicInfoResponse]:
+def _channels_by_owner_pipeline(owner_id: str, after_id: ObjectId | None) -> list[dict]:
+    """Canales activos de un propietario ordenados por `_id` (índice owner_id_is_active_id)."""
+    match = {"owner_id": owner_id, "is_active": True}
+    if after_id is not None:
+        match["_id"] = {"$gt": after_id}
+    return [{"$match": match}, {"$sort": {"_id": 1}}]
+
+@_fallback_on_error("Error al obtener canales por propietario", list)
+async def db_get_channels_by_owner_id(user_id: str, after_id: ObjectId | None = None, limit: int | None = None) -> list[ChannelBasicInfoResponse]:
+    """Canales activos de un propietario, paginados por keyset sobre `_id` si se indica `limit`."""
     if not user_id:
         return []
-    try:
-        pipeline = [
-            {"$match": {"owner_id": user_id, "is_active": True}},
-            {
-                "$project": {
-                    "id": {"$toString": "$_id"},
-                    "name": "$name",
-                    "owner_id": "$owner_id",
-                    "channel_type": "$channel_type",
-                    "created_at": "$created_at",
-                    "user_count": {"$size": "$users"}
-                }
-            }
-        ]
-        aggregated_results = ChannelDocument.objects.aggregate(pipeline)
-        return [ChannelBasicInfoResponse.model_validate(doc) for doc in aggregated_results]
-    except Exception as e:
-        logger.exception("Error al obtener canales por propietario")
-        return []
+    pipeline = _channels_by_owner_pipeline(user_id, after_id)
+    if limit is not None:
+        pipeline.append({"$limit": limit})
+    pipeline.append(BASIC_INFO_PROJECTION)
+    aggregated_results = await _channels_collection().aggregate(pipeline)
+    return _raw_to_basic_infos(await aggregated_results.to_list())
+
+async def db_iter_channels_by_owner_id(user_id: str, after_id: ObjectId | None = None) -> AsyncIterator[ChannelBasicInfoResponse]:
+    """Recorre los canales activos de un propietario sin cargar el resultado completo en memoria."""
+    if not user_id:
+        return
+    pipeline = [*_channels_by_owner_pipeline(user_id, after_id), BASIC_INFO_PROJECTION]
+    async for doc in await _channels_collection().aggregate(pipeline, batchSize=STREAM_BATCH_SIZE):
+        yield ChannelBasicInfoResponse.model_validate(doc)
+
+class OwnerNotMemberError(ValueError):
+    """Excepción lanzada cuando el nuevo owner_id de un canal no es miembro del canal."""
+    pass
+
+async def db_update_channel(channel_id: str, update_data: ChannelUpdatePayload) -> Channel | None:
+    """Actualiza los campos enviados de un canal activo y encola el evento `channel.updated`.
+
+    Si cambia el `owner_id`, la comprobación de que el nuevo owner es miembro y la actualización
+    ocurren en una misma transacción.
 
-def db_update_channel(channel_id: str, update_data: ChannelUpdatePayload) -> Channel | None:
-    payload = update_data.model_dump(exclude_unset=True, exclude_none=True)
-    if not channel_id or not payload:
+    Raises:
+        OwnerNotMemberError: Si el canal existe pero el nuevo owner_id no es miembro.
+    """
+    payload = update_data.model_dump(mode="json", exclude_unset=True, exclude_none=True)
+    object_id = _to_object_id(channel_id)
+    if object_id is None or not payload:
         return None
 
-    try:
-        now = datetime.now().timestamp()
-        update_fields = {f"set__{key}": value for key, value in payload.items()}
-        update_fields["set__updated_at"] = now
-        query = Q(id=channel_id) & Q(is_active=True)
-        document = ChannelDocument.objects(query).modify(
-            new=True, 
-            **update_fields
+    now = datetime.now().timestamp()
+    event = _outbox_event(
+        "channelService.v1.channel.updated",
+        {"channel_id": str(object_id), "updated_fields": payload, "updated_at": now},
+        now
+    )
+    update = {"$set": {**payload, "updated_at": now}, **_outbox_push(event)}
+    new_owner_id = payload.get("owner_id")
+    if new_owner_id is None:
+        document = await _channels_collection().find_one_and_update(
+            {"_id": object_id, "is_active": True, **OUTBOX_HAS_ROOM},
+            update,
+            projection=CHANNEL_PROJECTION,
+            return_document=ReturnDocument.AFTER
         )
-        if not document:
+        if document is None:
+            await _check_outbox_room(object_id)
+        return await _build_channel(document)
+
+    async def update_owner(session):
+        if not await _find_active_channel({"_id": object_id, "is_active": True}, session):
             return None
-    except ValidationError:
-        return None
+        # Una baja concurrente del nuevo owner también escribe el canal: las transacciones chocan y
+        # una de ellas se reintenta, así que el owner nunca queda fuera de `channel_members`
+        if await _members_collection().find_one({"channel_id": object_id, "user_id": new_owner_id}, {"_id": 1}, session=session) is None:
+            raise OwnerNotMemberError(f"El nuevo owner_id '{new_owner_id}' no es miembro del canal.")
+        return await _channels_collection().find_one_and_update(
+            {"_id": object_id, "is_active": True},
+            update,
+            projection=CHANNEL_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+
+    return await _build_channel(await _run_transaction(update_owner))
+
+async def _set_channel_active(channel_id: str, active: bool) -> tuple[Channel | None, Channel | None]:
+    """Activa o desactiva un canal en un solo `find_one_and_update`, sin cargar sus miembros.
+
+    La actualización es un pipeline condicional: solo cambia los campos (y encola el evento
+    `channel.deleted` o `channel.reactivated`) si el canal aún no está en el estado pedido, así que con
+    el documento previo se distinguen todos los casos sin otra lectura.
+
+    Returns:
+        tuple: (canal antes, canal después). (None, None) si no existe; (canal, None) si ya estaba en
+        el estado pedido.
+    """
+    object_id = _to_object_id(channel_id)
+    if object_id is None:
+        return None, None
+    now = datetime.now().timestamp()
+    changes = {"is_active": active, "updated_at": now}
+    if not active:
+        changes["deleted_at"] = now
+    if active:
+        event = _outbox_event("channelService.v1.channel.reactivated", {"channel_id": str(object_id), "reactivated_at": now}, now)
+    else:
+        event = _outbox_event("channelService.v1.channel.deleted", {"channel_id": str(object_id), "deleted_at": now}, now)
+    unchanged = {"$eq": ["$is_active", active]}
+    stage = {field: {"$cond": [unchanged, f"${field}", value]} for field, value in changes.items()}
+    # `$literal`: el evento es un valor, no una expresión de agregación
+    stage["outbox"] = {"$cond": [unchanged, "$outbox", {"$concatArrays": [{"$ifNull": ["$outbox", []]}, {"$literal": [event]}]}]}
+    stage["outbox_since"] = {"$cond": [unchanged, "$outbox_since", {"$min": ["$outbox_since", now]}]}
+    before = await _channels_collection().find_one_and_update(
+        # Sin cambio no se encola evento, así que el outbox lleno solo impide el cambio de estado
+        {"_id": object_id, "$or": [{"is_active": active}, OUTBOX_HAS_ROOM]},
+        [{"$set": stage}],
+        projection=CHANNEL_PROJECTION,
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        await _check_outbox_room(object_id)
+        return None, None
+    channel_before = _raw_to_channel(before, None)
+    if before["is_active"] == active:
+        return channel_before, None
+    return channel_before, channel_before.model_copy(update=changes)
 
-    return _document_to_channel(document)
+async def db_deactivate_channel(channel_id: str) -> tuple[Channel | None, Channel | None]:
+    """Desactiva un canal. Ver `_set_channel_active` para el significado del resultado."""
+    return await _set_channel_active(channel_id, False)
 
-def db_deactivate_channel(channel_id: str) -> Channel | None:
-    if not channel_id:
+async def db_reactivate_channel(channel_id: str) -> tuple[Channel | None, Channel | None]:
+    """Reactiva un canal. Ver `_set_channel_active` para el significado del resultado."""
+    return await _set_channel_active(channel_id, True)
+
+async def _insert_member(channel_id: str, user_id: str, channel_projection: dict) -> tuple[dict, dict] | None:
+    """Da de alta un miembro, incrementa `user_count` y encola el evento `user.added`, en una transacción.
+
+    Returns:
+        tuple: (membresía insertada, canal actualizado con `channel_projection`), o None si el canal
+        no está activo o el usuario ya es miembro.
+    """
+    object_id = _to_object_id(channel_id)
+    if object_id is None or not user_id:
         return None
-    try:
-        now = datetime.now().timestamp()
-        query = Q(id=channel_id) & Q(is_active=True)
-        document = ChannelDocument.objects(query).modify(
-            new=True,
-            set__is_active=False,
-            set__deleted_at=now
-        )
-        if not document:
+
+    now = datetime.now().timestamp()
+    new_member = {"channel_id": object_id, "user_id": user_id, "joined_at": now, "status": "normal"}
+    event = _outbox_event(
+        "channelService.v1.user.added",
+        {"channel_id": str(object_id), "user_id": user_id, "added_at": now},
+        now
+    )
+
+    async def insert(session):
+        if not await _find_active_channel({"_id": object_id, "is_active": True}, session):
             return None
-    except ValidationError:
-        return None
-    return _document_to_channel(document)
+        try:
+            await _members_collection().insert_one(dict(new_member), session=session)
+        except DuplicateKeyError:
+            # El usuario ya es miembro
+            raise _Rollback()
+        document = await _channels_collection().find_one_and_update(
+            {"_id": object_id, "is_active": True},
+            {"$inc": {"user_count": 1}, "$set": {"updated_at": now}, **_outbox_push(event)},
+            projection=channel_projection,
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if document is None:
+            raise _Rollback()
+        return new_member, document
+
+    return await _run_transaction(insert)
 
-def db_reactivate_channel(channel_id: str) -> Channel | None:
-    if not channel_id:
+async def _delete_member(channel_id: str, user_id: str, channel_projection: dict) -> tuple[dict, dict] | None:
+    """Da de baja un miembro (que no sea el propietario), decrementa `user_count` y encola el evento
+    `user.removed`, en una transacción.
+
+    Returns:
+        tuple: (membresía eliminada, canal actualizado con `channel_projection`), o None si el canal
+        no está activo, el usuario es el propietario o no es miembro.
+    """
+    object_id = _to_object_id(channel_id)
+    if object_id is None or not user_id:
         return None
-    try:
-        now = datetime.now().timestamp()
-        query = Q(id=channel_id) & Q(is_active=False)
-        document = ChannelDocument.objects(query).modify(
-            new=True,
-            set__is_active=True,
-            set__updated_at=now
+
+    now = datetime.now().timestamp()
+    event = _outbox_event(
+        "channelService.v1.user.removed",
+        {"channel_id": str(object_id), "user_id": user_id, "removed_at": now},
+        now
+    )
+
+    async def delete(session):
+        active_channel = {"_id": object_id, "owner_id": {"$ne": user_id}, "is_active": True}
+        if not await _find_active_channel(active_channel, session):
+            # El canal no existe o el usuario es el propietario
+            return None
+        removed_member = await _members_collection().find_one_and_delete(
+            {"channel_id": object_id, "user_id": user_id},
+            projection=MEMBER_PROJECTION,
+            session=session
         )
-        if not document:
+        if removed_member is None:
+            # El usuario no es miembro
             return None
-    except ValidationError:
-        return None
-    return _document_to_channel(document)
+        document = await _channels_collection().find_one_and_update(
+            active_channel,
+            {"$inc": {"user_count": -1}, "$set": {"updated_at": now}, **_outbox_push(event)},
+            projection=channel_projection,
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if document is None:
+            raise _Rollback()
+        return removed_member, document
 
-def db_add_user_to_channel(channel_id: str, user_id: str) -> Channel | None:
-    if not channel_id or not user_id:
+    return await _run_transaction(delete)
+
+def _raw_to_membership_change(member: dict, channel: dict) -> MembershipChangeResponse:
+    return MembershipChangeResponse(
+        channel_id=str(channel["_id"]),
+        member=_raw_to_member(member),
+        user_count=channel["user_count"],
+        updated_at=channel["updated_at"]
+    )
+
+async def db_add_user_to_channel(channel_id: str, user_id: str) -> Channel | None:
+    result = await _insert_member(channel_id, user_id, CHANNEL_PROJECTION)
+    if result is None:
         return None
-    try:
-        new_member = ChannelMemberDocument(id=user_id, joined_at=datetime.now().timestamp(), status="normal")
-        
-        query = Q(id=channel_id) & Q(users__id__ne=user_id) & Q(is_active=True)
-        document = ChannelDocument.objects(query).modify(
-            new=True,
-            add_to_set__users=new_member
-        )
-        if not document:
-            # El canal no existe o el usuario ya es miembro
-            return None
-    except ValidationError:
+    return await _build_channel(result[1])
+
+async def db_add_user_to_channel_minimal(channel_id: str, user_id: str) -> MembershipChangeResponse | None:
+    """Igual que `db_add_user_to_channel`, pero sin leer el canal completo ni sus miembros."""
+    result = await _insert_member(channel_id, user_id, MEMBERSHIP_CHANGE_PROJECTION)
+    if result is None:
         return None
-    return _document_to_channel(document)
+    return _raw_to_membership_change(*result)
 
-def db_remove_user_from_channel(channel_id: str, user_id: str) -> Channel | None:
-    if not channel_id or not user_id:
+async def db_remove_user_from_channel(channel_id: str, user_id: str) -> Channel | None:
+    result = await _delete_member(channel_id, user_id, CHANNEL_PROJECTION)
+    if result is None:
         return None
-    try:
-        query = Q(id=channel_id) & Q(owner_id__ne=user_id) & Q(users__id=user_id) & Q(is_active=True)
-        document = ChannelDocument.objects(query).modify(
-            new=True,
-            pull__users__id=user_id
-        )
-        if not document:
-            # El canal no existe, el usuario no es miembro o es el propietario
-            return None
-    except ValidationError:
+    return await _build_channel(result[1])
+
+async def db_remove_user_from_channel_minimal(channel_id: str, user_id: str) -> MembershipChangeResponse | None:
+    """Igual que `db_remove_user_from_channel`, pero sin leer el canal completo ni sus miembros."""
+    result = await _delete_member(channel_id, user_id, MEMBERSHIP_CHANGE_PROJECTION)
+    if result is None:
         return None
-    return _document_to_channel(document)
+    return _raw_to_membership_change(*result)
 
-def db_get_channels_by_member_id(user_id: str) -> list[ChannelBasicInfoResponse]:
+def _channels_by_member_pipeline(user_id: str, after_id: ObjectId | None) -> list[dict]:
+    """Canales activos de un miembro ordenados por `_id`.
+
+    Recorre `channel_members` por el índice (user_id, channel_id) y une cada membresía con su canal,
+    de modo que un `$limit` posterior corta tanto las membresías como los canales leídos.
+    """
+    match = {"user_id": user_id}
+    if after_id is not None:
+        match["channel_id"] = {"$gt": after_id}
+    return [
+        {"$match": match},
+        {"$sort": {"channel_id": 1}},
+        {"$lookup": {"from": ChannelDocument._get_collection_name(), "localField": "channel_id", "foreignField": "_id", "as": "channel"}},
+        {"$unwind": "$channel"},
+        {"$replaceRoot": {"newRoot": "$channel"}},
+        {"$match": {"is_active": True}}
+    ]
+
+def _legacy_channels_by_member_pipeline(user_id: str, after_id: ObjectId | None) -> list[dict]:
+    """Canales activos aún no migrados que tienen al usuario en el arreglo legado `users`, ordenados por `_id`
+    (índice parcial legacy_users_id, que solo contiene esos canales)."""
+    match = {"users.id": user_id, "users": {"$exists": True}, "is_active": True}
+    if after_id is not None:
+        match["_id"] = {"$gt": after_id}
+    return [{"$match": match}, {"$sort": {"_id": 1}}]
+
+@_fallback_on_error("Error al obtener canales por miembro", list)
+async def db_get_channels_by_member_id(user_id: str, after_id: ObjectId | None = None, limit: int | None = None) -> list[ChannelBasicInfoResponse]:
+    """Canales activos de un miembro, paginados por keyset sobre `_id` si se indica `limit`.
+
+    Une las membresías de `channel_members` con las de los canales aún no migrados.
+    """
     if not user_id:
         return []
-    try:
-        pipeline = [
-            {"$match": {"users.id": user_id, "is_active": True}},
-            {
-                "$project": {
-                    "id": {"$toString": "$_id"},
-                    "name": "$name",
-                    "owner_id": "$owner_id",
-                    "channel_type": "$channel_type",
-                    "created_at": "$created_at",
-                    "user_count": {"$size": "$users"}
-                }
-            }
-        ]
-        aggregated_results = ChannelDocument.objects.aggregate(pipeline)
-        return [ChannelBasicInfoResponse.model_validate(doc) for doc in aggregated_results]
-    except Exception as e:
-        logger.exception("Error al obtener canales por miembro")
-        return []
+    pipeline = _channels_by_member_pipeline(user_id, after_id)
+    legacy_pipeline = _legacy_channels_by_member_pipeline(user_id, after_id)
+    if limit is not None:
+        pipeline.append({"$limit": limit})
+        legacy_pipeline.append({"$limit": limit})
+    pipeline.append(BASIC_INFO_PROJECTION)
+    legacy_pipeline.append(BASIC_INFO_PROJECTION)
+    members_results, legacy_results = await asyncio.gather(
+        _members_collection().aggregate(pipeline), _channels_collection().aggregate(legacy_pipeline)
+    )
+    documents = {doc["id"]: doc for doc in [*await members_results.to_list(), *await legacy_results.to_list()]}
+    # `id` es el ObjectId en hexadecimal de largo fijo: ordenar el texto equivale a ordenar por `_id`
+    merged = [documents[channel_id] for channel_id in sorted(documents)]
+    return _raw_to_basic_infos(merged if limit is None else merged[:limit])
+
+async def db_iter_channels_by_member_id(user_id: str, after_id: ObjectId | None = None) -> AsyncIterator[ChannelBasicInfoResponse]:
+    """Recorre los canales activos de un miembro sin cargar el resultado completo en memoria.
 
-def db_get_basic_channel_info(channel_id: str) -> ChannelBasicInfoResponse | None:
-    if not channel_id:
+    Los canales aún no migrados del usuario (pocos, y cada vez menos) se leen completos y se intercalan
+    por `_id` con el cursor de `channel_members`.
+    """
+    if not user_id:
+        return
+    legacy_pipeline = [*_legacy_channels_by_member_pipeline(user_id, after_id), BASIC_INFO_PROJECTION]
+    legacy = deque(await (await _channels_collection().aggregate(legacy_pipeline)).to_list())
+    pipeline = [*_channels_by_member_pipeline(user_id, after_id), BASIC_INFO_PROJECTION]
+    async for doc in await _members_collection().aggregate(pipeline, batchSize=STREAM_BATCH_SIZE):
+        while legacy and legacy[0]["id"] < doc["id"]:
+            yield ChannelBasicInfoResponse.model_validate(legacy.popleft())
+        if legacy and legacy[0]["id"] == doc["id"]:
+            legacy.popleft()
+        yield ChannelBasicInfoResponse.model_validate(doc)
+    for doc in legacy:
+        yield ChannelBasicInfoResponse.model_validate(doc)
+
+@_fallback_on_error("Error al obtener información básica del canal")
+async def db_get_basic_channel_info(channel_id: str) -> ChannelBasicInfoResponse | None:
+    object_id = _to_object_id(channel_id)
+    if object_id is None or not channel_may_exist(object_id):
         return None
-    try:
-        pipeline = [
-            {"$match": {"_id": ObjectId(channel_id), "is_active": True}},
-            {
-                "$project": {
-                    "id": {"$toString": "$_id"},
-                    "name": "$name",
-                    "owner_id": "$owner_id",
-                    "channel_type": "$channel_type",
-                    "created_at": "$created_at",
-                    "user_count": {"$size": "$users"}
-                }
-            }
-        ]
-        aggregated_results = ChannelDocument.objects.aggregate(pipeline)
-        return ChannelBasicInfoResponse.model_validate(next(aggregated_results))
-    except Exception as e:
-        logger.exception("Error al obtener información básica del canal")
+    pipeline = [
+        {"$match": {"_id": object_id, "is_active": True}},
+        BASIC_INFO_PROJECTION
+    ]
+    aggregated_results = await _channels_collection().aggregate(pipeline)
+    document = await anext(aggregated_results, None)
+    if document is None:
         return None
+    return ChannelBasicInfoResponse.model_validate(document)
 
-def db_get_channel_member_ids(channel_id: str, skip: int = 0, limit: int = 100) -> list[ChannelMember] | None:
-    if not channel_id:
-        return None
-    try:
-        if not ChannelDocument.objects(id=channel_id).first():
-            return None
+@_fallback_on_error("Error al obtener miembros del canal")
+async def db_get_channel_member_ids(
+    channel_id: str,
+    skip: int = 0,
+    limit: int = 100,
+    after_user_id: str | None = None,
+    status: str | None = None
+) -> tuple[list[ChannelMember], float | None] | None:
+    """Página de miembros de un canal en una sola agregación: el canal y su `$lookup` paginado a `channel_members`.
 
-        pipeline = [
-            {"$match": {"_id": ObjectId(channel_id), "is_active": True}},
-            {"$unwind": "$users"},
-            {"$replaceRoot": {"newRoot": "$users"}},
-            {"$skip": skip},
-            {"$limit": limit}
-        ]
-        aggregated_results = ChannelDocument.objects.aggregate(pipeline)
-        return [ChannelMember.model_validate(doc) for doc in aggregated_results]
-    except (DoesNotExist, ValidationError):
+    Los miembros se ordenan por `user_id`. Con `after_user_id` la página se obtiene por keyset sobre los
+    índices (channel_id, user_id) o (channel_id, status, user_id), así que cualquier página cuesta lo mismo
+    que la primera; `skip` se mantiene para la paginación por número de página.
+
+    Returns:
+        tuple: (miembros, updated_at del canal) para armar las cabeceras de validación sin otra lectura;
+        ([], None) si el canal está desactivado. None si el canal no existe.
+    """
+    object_id = _to_object_id(channel_id)
+    if object_id is None:
         return None
-    except Exception as e:
-        logger.exception(f"Error al obtener miembros del canal {channel_id}")
+    match = {}
+    if after_user_id is not None:
+        match["user_id"] = {"$gt": after_user_id}
+    if status is not None:
+        match["status"] = status
+    pipeline = [
+        {"$match": {"_id": object_id}},
+        {"$lookup": {
+            "from": MemberDocument._get_collection_name(),
+            "localField": "_id",
+            "foreignField": "channel_id",
+            "pipeline": [{"$match": match}, {"$sort": {"user_id": 1}}, {"$skip": skip}, {"$limit": limit}, MEMBER_LIST_PROJECTION],
+            "as": "members"
+        }},
+        {"$project": {"_id": 0, "is_active": 1, "updated_at": 1, "members": 1, "legacy_members": {"$isArray": "$users"}}}
+    ]
+    channel = await anext(await _channels_collection().aggregate(pipeline), None)
+    if channel is None:
         return None
+    if not channel["is_active"]:
+        return [], None
+    if channel.get("legacy_members"):
+        # Canal aún no migrado: se migra y se vuelve a leer la página
+        await db_migrate_legacy_members([object_id])
+        return await db_get_channel_member_ids(channel_id, skip, limit, after_user_id, status)
+    return _raw_to_members(channel["members"]), channel["updated_at"]
 
-def db_change_status(channel_id: str, user_id: str, new_status: str) -> Channel | None:
+async def db_change_status(channel_id: str, user_id: str, new_status: str) -> ChannelMember | None:
     """Cambia el status de un usuario en un canal específico.
-    
+
     Args:
         channel_id: ID del canal
         user_id: ID del usuario
         new_status: Nuevo status ("normal", "warning", o "banned")
-    
+
     Returns:
-        Channel actualizado o None si no se pudo actualizar
+        ChannelMember actualizado o None si no se pudo actualizar
     """
-    if not channel_id or not user_id or not new_status:
+    object_id = _to_object_id(channel_id)
+    if object_id is None or not user_id or not new_status:
         return None
-    
+
     valid_statuses = ["normal", "warning", "banned"]
     if new_status not in valid_statuses:
         return None
-    
-    try:
-        query = Q(id=channel_id) & Q(users__id=user_id) & Q(is_active=True)
-        document = ChannelDocument.objects(query).modify(
-            new=True,
-            set__users__S__status=new_status
+
+    now = datetime.now().timestamp()
+    event = _outbox_event(
+        "channelService.v1.user.status_changed",
+        {"channel_id": str(object_id), "user_id": user_id, "status": new_status, "changed_at": now},
+        now
+    )
+
+    async def change(session):
+        if not await _find_active_channel({"_id": object_id, "is_active": True}, session):
+            return None
+        document = await _members_collection().find_one_and_update(
+            {"channel_id": object_id, "user_id": user_id},
+            {"$set": {"status": new_status}},
+            projection=MEMBER_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+            session=session
         )
-        if not document:
+        if document is None:
             return None
-    except ValidationError:
-        return None
-    return _document_to_channel(document)
+        # El evento se confirma junto con el cambio de status
+        await _channels_collection().update_one(
+            {"_id": object_id}, {"$set": {"updated_at": now}, **_outbox_push(event)}, session=session
+        )
+        return document
 
-def db_is_channel_active(channel_id: str) -> bool | None:
-    if not channel_id:
-        return None
+    return _raw_to_member(await _run_transaction(change))
+
+async def db_get_channels_batch(channel_ids: list[str]) -> dict[str, tuple[bool, ChannelBasicInfoResponse]]:
+    """Resuelve varios canales (activos o no) con una sola consulta `$in`.
+
+    Returns:
+        dict: ID del canal tal como lo pidió el llamador -> (is_active, información básica). Los IDs
+        inexistentes o inválidos no aparecen.
+    """
+    # `$toString` entrega el ObjectId en hexadecimal en minúsculas: se agrupan los IDs pedidos por su
+    # forma normalizada para devolver el resultado con las claves originales (p. ej. en mayúsculas)
+    requested: dict[str, list[str]] = {}
+    for channel_id in channel_ids:
+        object_id = _to_object_id(channel_id)
+        if object_id is not None:
+            requested.setdefault(str(object_id), []).append(channel_id)
+    if not requested:
+        return {}
+    object_ids = [ObjectId(normalized_id) for normalized_id in requested]
     try:
-        query = Q(id=channel_id)
-        document = ChannelDocument.objects.get(query)
-        return document.is_active
-    except (DoesNotExist, ValidationError):
-        return None
+        pipeline = [
+            {"$match": {"_id": {"$in": object_ids}}},
+            {"$project": {**BASIC_INFO_PROJECTION["$project"], "is_active": "$is_active"}}
+        ]
+        documents = await (await _channels_collection().aggregate(pipeline)).to_list()
+        return {
+            channel_id: (doc["is_active"], info)
+            for doc, info in zip(documents, _raw_to_basic_infos(documents))
+            for channel_id in requested[doc["id"]]
+        }
     except Exception as e:
-        logger.exception("Error al verificar si el canal está activo")
+        logger.exception("Error al obtener canales por lote")
+        raise e
+
+@_fallback_on_error("Error al verificar si el canal está activo")
+async def db_is_channel_active(channel_id: str) -> bool | None:
+    object_id = _to_object_id(channel_id)
+    if object_id is None or not channel_may_exist(object_id):
+        return None
+    document = await _channels_collection().find_one({"_id": object_id}, {"is_active": 1})
+    if document is None:
         return None
+    return document["is_active"]
 
-def db_check_user_exists_in_channel(channel_id: str, user_id: str) -> bool:
-    if not channel_id or not user_id:
-        return False
+async def db_get_channel_member(channel_id: str, user_id: str) -> tuple[bool, ChannelMember | None]:
+    """Obtiene la membresía de un usuario en un canal activo.
+
+    Ambas lecturas son puntuales sobre índices (`_id` e índice único `channel_id_user_id`) con
+    proyección, y se lanzan en paralelo para pagar un solo viaje de ida y vuelta.
+    En un canal aún no migrado, el miembro se busca también en el arreglo legado `users`.
+
+    Returns:
+        tuple: (channel_active, member). `member` es None si el canal no está activo o el usuario no es miembro.
+    """
+    object_id = _to_object_id(channel_id)
+    if object_id is None or not user_id or not channel_may_exist(object_id):
+        return False, None
+    channel, member = await asyncio.gather(
+        _channels_collection().find_one({"_id": object_id, "is_active": True}, {"_id": 1, "users": {"$elemMatch": {"id": user_id}}}),
+        _members_collection().find_one({"channel_id": object_id, "user_id": user_id}, MEMBER_PROJECTION)
+    )
+    if channel is None:
+        return False, None
+    if member is None and channel.get("users"):
+        legacy_member = channel["users"][0]
+        member = {"user_id": legacy_member["id"], "joined_at": legacy_member["joined_at"], "status": legacy_member.get("status", "normal")}
+    return True, _raw_to_member(member)
+
+async def db_iter_channels_export(
+    is_active: bool | None = None,
+    channel_type: str | None = None,
+    updated_since: float | None = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> AsyncIterator[dict]:
+    """Recorre los canales que cumplen los filtros, ordenados por `_id`, como dicts ya proyectados.
+
+    Los documentos se leen del cursor en lotes de `batch_size` y se entregan sin pasar por pydantic.
+    """
+    match = {}
+    if is_active is not None:
+        match["is_active"] = is_active
+    if channel_type is not None:
+        match["channel_type"] = channel_type
+    if updated_since is not None:
+        match["updated_at"] = {"$gte": updated_since}
+    pipeline = [{"$match": match}, {"$sort": {"_id": 1}}, EXPORT_CHANNEL_PROJECTION]
+    async for doc in await _channels_collection().aggregate(pipeline, batchSize=batch_size):
+        yield doc
+
+async def db_iter_members_export(status: str | None = None, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[dict]:
+    """Recorre las membresías ordenadas por (channel_id, user_id), como dicts ya proyectados."""
+    match = {"status": status} if status is not None else {}
+    pipeline = [{"$match": match}, {"$sort": {"channel_id": 1, "user_id": 1}}, EXPORT_MEMBER_PROJECTION]
+    async for doc in await _members_collection().aggregate(pipeline, batchSize=batch_size):
+        yield doc
+
+async def db_get_pending_outbox(channel_limit: int, event_limit: int) -> list[dict]:
+    """Canales con eventos pendientes en su outbox, del evento pendiente más antiguo al más reciente.
+
+    Omite los canales cuyo próximo reintento aún no llega (`outbox_retry_at`, ver `db_defer_outbox`).
+    Usa el índice parcial `outbox_since_retry_at`. De cada canal se leen a lo sumo `event_limit`
+    eventos, en el orden en que se encolaron.
+
+    Returns:
+        list: documentos `{"_id", "outbox_since", "outbox", "outbox_attempts"}` (el último solo si hubo fallos).
+    """
+    now = datetime.now().timestamp()
+    pipeline = [
+        {"$match": {"outbox_since": {"$exists": True}, "outbox_retry_at": {"$not": {"$gt": now}}}},
+        {"$sort": {"outbox_since": 1}},
+        {"$limit": channel_limit},
+        {"$project": {"outbox_since": 1, "outbox_attempts": 1, "outbox": {"$slice": ["$outbox", event_limit]}}}
+    ]
+    return await (await _channels_collection().aggregate(pipeline)).to_list()
+
+async def db_ack_outbox_events(channel_object_id: ObjectId, event_ids: list[ObjectId], session=None):
+    """Quita del outbox de un canal los eventos ya publicados.
+
+    `outbox_since` pasa a ser el `created_at` del evento pendiente más antiguo; si no queda ninguno,
+    se eliminan ambos campos y el canal sale del índice parcial. También se descartan los fallos
+    registrados (`db_defer_outbox`), que eran del evento que encabezaba el outbox.
+    """
+    empty = {"$eq": [{"$size": "$outbox"}, 0]}
+    await _channels_collection().update_one(
+        {"_id": channel_object_id},
+        [
+            {"$set": {"outbox": {"$filter": {"input": {"$ifNull": ["$outbox", []]}, "cond": {"$not": [{"$in": ["$$this.event_id", event_ids]}]}}}}},
+            {"$set": {
+                "outbox_since": {"$cond": [empty, "$$REMOVE", {"$min": "$outbox.created_at"}]},
+                "outbox": {"$cond": [empty, "$$REMOVE", "$outbox"]}
+            }},
+            {"$unset": ["outbox_attempts", "outbox_retry_at", "outbox_error"]}
+        ],
+        session=session
+    )
+
+async def db_defer_outbox(channel_object_id: ObjectId, attempts: int, retry_at: float, error: str):
+    """Registra un fallo al publicar el primer evento del outbox de un canal y aplaza el canal hasta `retry_at`."""
+    await _channels_collection().update_one(
+        {"_id": channel_object_id},
+        {"$set": {"outbox_attempts": attempts, "outbox_retry_at": retry_at, "outbox_error": error}}
+    )
+
+async def db_dead_letter_outbox_event(channel_object_id: ObjectId, event: dict, attempts: int, error: str):
+    """Retira del outbox de un canal un evento que el broker rechazó `attempts` veces y lo guarda en
+    `OUTBOX_DEAD_LETTERS_COLLECTION`, en una transacción, para que no bloquee los eventos siguientes."""
+    dead_letter = {
+        **event, "channel_id": channel_object_id, "attempts": attempts, "error": error,
+        "dead_lettered_at": datetime.now().timestamp()
+    }
+
+    async def move(session):
+        await get_async_database()[OUTBOX_DEAD_LETTERS_COLLECTION].insert_one(dict(dead_letter), session=session)
+        await db_ack_outbox_events(channel_object_id, [event["event_id"]], session=session)
+
+    await _run_transaction(move)
+
+async def db_get_stuck_outbox(limit: int) -> tuple[int, list[dict]]:
+    """Canales cuyo outbox no avanza porque falló la publicación de su primer evento (índice parcial `outbox_attempts`).
+
+    Returns:
+        tuple: (cantidad de canales, los `limit` con más intentos fallidos).
+    """
+    stuck = {"outbox_attempts": {"$exists": True}}
+    projection = {"outbox_attempts": 1, "outbox_retry_at": 1, "outbox_error": 1, "outbox_since": 1}
+    count, documents = await asyncio.gather(
+        _channels_collection().count_documents(stuck),
+        _channels_collection().find(stuck, projection).sort("outbox_attempts", -1).limit(limit).to_list()
+    )
+    return count, [
+        {
+            "channel_id": str(doc["_id"]),
+            "attempts": doc["outbox_attempts"],
+            "retry_at": doc.get("outbox_retry_at"),
+            "error": doc.get("outbox_error"),
+            "pending_since": doc.get("outbox_since")
+        }
+        for doc in documents
+    ]
+
+async def db_acquire_lease(name: str, owner: str, ttl: float) -> bool:
+    """Toma o renueva por `ttl` segundos el lock `name` para `owner`.
+
+    Returns:
+        bool: True si `owner` tiene el lock; False si lo tiene otro y aún no vence.
+    """
+    now = datetime.now().timestamp()
     try:
-        query = Q(id=channel_id) & Q(users__id=user_id) & Q(is_active=True)
-        exists = ChannelDocument.objects(query).first() is not None
-        return exists
-    except ValidationError:
-        return False
\ No newline at end of file
+        await get_async_database()[LOCKS_COLLECTION].update_one(
+            {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + ttl}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # El lock existe, es de otro y está vigente: el upsert intentó crear otro con el mismo _id
+        return False
+    return True
+
+async def db_release_lease(name: str, owner: str):
+    """Libera el lock `name` si lo tiene `owner`."""
+    await get_async_database()[LOCKS_COLLECTION].delete_one({"_id": name, "owner": owner})
@@ -0,0 +1,60 @@
+"""Coalescencia de lecturas concurrentes idénticas ("single flight").
+
+Mientras una carga para una clave está en curso, las demás peticiones con la misma clave esperan
+su resultado en lugar de repetir la consulta a MongoDB.
+"""
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Agrupa las llamadas concurrentes con la misma clave en una sola ejecución de `loader`.
+
+    - La carga corre en su propia tarea: si se cancela la petición que la inició, las demás
+      siguen esperando; solo se cancela cuando ya no queda nadie esperándola.
+    - Si la carga falla, todas las peticiones que la esperaban reciben la misma excepción y la
+      siguiente llamada vuelve a intentarlo (los errores no se guardan).
+    """
+
+    def __init__(self):
+        self._flights: dict[Hashable, _Flight] = {}
+        self.loads = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(loader()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._discard(key, flight))
+            self.loads += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nadie espera el resultado: se cancela la carga y las llamadas nuevas inician otra
+                self._discard(key, flight)
+                flight.task.cancel()
+
+    def forget(self, key: Hashable):
+        """Hace que las llamadas siguientes con `key` no se unan a la carga en curso (p. ej. tras una escritura)."""
+        self._flights.pop(key, None)
+
+    def _discard(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights), "loads": self.loads, "coalesced": self.coalesced}
@@ -0,0 +1,85 @@
+"""Tiempo límite (deadline) por petición.
+
+El middleware de `main.py` fija el deadline de cada petición en una `ContextVar`, así llega a los
+controladores, consultas y publicaciones sin pasarlo como parámetro:
+
+- MongoDB: `pymongo.timeout` acota cada operación al tiempo restante y lo envía como `maxTimeMS`.
+- RabbitMQ: `deadline_scope` acota las publicaciones al tiempo restante.
+
+Las tareas creadas durante la petición heredan el deadline (p. ej. una carga compartida por
+`SingleFlight` usa el de la petición que la inició).
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+import pymongo
+from pymongo.errors import PyMongoError
+
+# Segundos por defecto para atender una petición (0 = sin límite)
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "10"))
+# Máximo que un cliente puede pedir con la cabecera `REQUEST_TIMEOUT_HEADER`
+REQUEST_TIMEOUT_MAX = float(os.getenv("REQUEST_TIMEOUT_MAX", "60"))
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout"
+
+DEADLINE_DETAIL = "Se agotó el tiempo límite de la petición."
+
+_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Excepción lanzada cuando se agota el tiempo límite de la petición en curso."""
+    pass
+
+
+def is_deadline_error(exc: BaseException) -> bool:
+    """Indica si `exc` se debe a que se agotó un tiempo límite.
+
+    Además de `DeadlineExceeded`, cubre todos los errores de pymongo cuyo `timeout` es verdadero
+    (`ExecutionTimeout`, `NetworkTimeout`, `ServerSelectionTimeoutError`, `WaitQueueTimeoutError`, ...),
+    que es como pymongo reporta un `pymongo.timeout` agotado.
+    """
+    return isinstance(exc, DeadlineExceeded) or (isinstance(exc, PyMongoError) and exc.timeout)
+
+
+def remaining() -> float | None:
+    """Segundos que le quedan a la petición en curso, o None si no tiene deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+@contextmanager
+def request_deadline(timeout: float | None):
+    """Fija el deadline de la petición (`timeout` segundos desde ahora; None o 0 = sin límite)."""
+    if not timeout:
+        yield
+        return
+    token = _deadline.set(time.monotonic() + timeout)
+    try:
+        with pymongo.timeout(timeout):
+            yield
+    finally:
+        _deadline.reset(token)
+
+
+@asynccontextmanager
+async def deadline_scope(default: float | None = None):
+    """Acota el bloque al tiempo restante de la petición (o a `default` fuera de una petición).
+
+    Raises:
+        DeadlineExceeded: Si el bloque no termina a tiempo.
+    """
+    timeout = remaining()
+    if timeout is None:
+        timeout = default
+    if timeout is None:
+        yield
+        return
+    try:
+        async with asyncio.timeout(max(timeout, 0)):
+            yield
+    except TimeoutError as exc:
+        raise DeadlineExceeded(DEADLINE_DETAIL) from exc
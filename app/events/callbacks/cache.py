@@ -0,0 +1,29 @@
+import aio_pika
+import json
+import logging
+from ...db.cache import invalidate_channel
+from ...db.bloom import add_channel
+
+logger = logging.getLogger(__name__)
+
+
+async def process_channel_event(message: aio_pika.IncomingMessage):
+    """Invalida la caché local del canal afectado por un evento publicado por cualquier réplica.
+
+    Los canales nuevos se agregan además al filtro de Bloom de esta réplica.
+    """
+    try:
+        data = json.loads(message.body.decode())
+    except json.JSONDecodeError as e:
+        logger.error(f"Error al decodificar JSON: {e}")
+        raise
+
+    channel_id = data.get("channel_id")
+    if not channel_id:
+        logger.warning(f"Evento '{message.routing_key}' sin 'channel_id'; no se invalida la caché.")
+        return
+
+    if message.routing_key == "channelService.v1.channel.created":
+        add_channel(channel_id)
+    invalidate_channel(channel_id)
+    logger.debug(f"Caché invalidada para el canal '{channel_id}' por evento '{message.routing_key}'.")
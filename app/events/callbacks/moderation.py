@@ -2,10 +2,18 @@ import aio_pika
 import json
 import logging
 from ...db import querys
+from ...db.cache import invalidate_channel
+from ..outbox import notify_outbox
 
 logger = logging.getLogger(__name__)
 
-def _process_warning(data: dict):
+def _status_changed(channel_id: str):
+    """Invalida la caché local del canal y avisa al relay del evento `user.status_changed` encolado
+    por `db_change_status` (las demás réplicas invalidan al recibirlo)."""
+    invalidate_channel(channel_id)
+    notify_outbox()
+
+async def _process_warning(data: dict):
     user_id = data.get("user_id")
     channel_id = data.get("channel_id")
     
@@ -13,14 +21,15 @@ def _process_warning(data: dict):
         logger.error("Faltan 'user_id' o 'channel_id' en los datos del evento de advertencia.")
         return
     
-    channel = querys.db_change_status(channel_id, user_id, "warning")
+    channel = await querys.db_change_status(channel_id, user_id, "warning")
     
     if channel is None:
         logger.warning(f"No se encontró el canal '{channel_id}' o el usuario '{user_id}' no es miembro.")
     else:
         logger.info(f"Usuario '{user_id}' en canal '{channel_id}' marcado con 'warning'.")
+        _status_changed(channel_id)
 
-def _process_ban(data: dict):
+async def _process_ban(data: dict):
     user_id = data.get("user_id")
     channel_id = data.get("channel_id")
     
@@ -28,14 +37,15 @@ def _process_ban(data: dict):
         logger.error("Faltan 'user_id' o 'channel_id' en los datos del evento de usuario baneado.")
         return
     
-    channel = querys.db_change_status(channel_id, user_id, "banned")
+    channel = await querys.db_change_status(channel_id, user_id, "banned")
     
     if channel is None:
         logger.warning(f"No se encontró el canal '{channel_id}' o el usuario '{user_id}' no es miembro.")
     else:
         logger.info(f"Usuario '{user_id}' en canal '{channel_id}' marcado con 'banned'.")
+        _status_changed(channel_id)
 
-def _process_unban(data: dict):
+async def _process_unban(data: dict):
     user_id = data.get("user_id")
     channel_id = data.get("channel_id")
     
@@ -43,12 +53,13 @@ def _process_unban(data: dict):
         logger.error("Faltan 'user_id' o 'channel_id' en los datos del evento de usuario desbaneado.")
         return
     
-    channel = querys.db_change_status(channel_id, user_id, "normal")
+    channel = await querys.db_change_status(channel_id, user_id, "normal")
     
     if channel is None:
         logger.warning(f"No se encontró el canal '{channel_id}' o el usuario '{user_id}' no es miembro.")
     else:
         logger.info(f"Usuario '{user_id}' en canal '{channel_id}' marcado con 'normal'.")
+        _status_changed(channel_id)
 
 async def process_moderation_message(message: aio_pika.IncomingMessage):
     """Procesa mensajes de la cola de moderación."""
@@ -62,11 +73,11 @@ async def process_moderation_message(message: aio_pika.IncomingMessage):
         message_data = data.get("data", {})
         
         if event_type == "moderation.warning":
-            _process_warning(message_data)
+            await _process_warning(message_data)
         elif event_type == "moderation.user_banned":
-            _process_ban(message_data)
+            await _process_ban(message_data)
         elif event_type == "moderation.user_unbanned":
-            _process_unban(message_data)
+            await _process_unban(message_data)
         else:
             logger.error(f"Tipo de evento desconocido: {event_type}")
 
@@ -3,6 +3,8 @@ import os
 import logging
 import json
 import asyncio
+import time
+from collections.abc import Awaitable, Callable
 from typing import Optional
 
 class RabbitMQClient:
@@ -46,18 +48,52 @@ class RabbitMQClient:
         self.dlq_queue_name = dlq_queue_name
         self.dlq_durable = dlq_durable
         
-        # Objetos de conexión
+        # Objetos de conexión. La conexión es compartida con los demás clientes (ver conn._ConnectionPool)
         self.connection: Optional[aio_pika.Connection] = None
+        # Canal de consumo: declara la topología y recibe los consumidores
         self.channel: Optional[aio_pika.Channel] = None
+        # Canal de publicación, con publisher confirms
+        self.publish_channel: Optional[aio_pika.Channel] = None
         
         # Objetos declarados
         self.main_exchange: Optional[aio_pika.Exchange] = None
         self.main_queue: Optional[aio_pika.Queue] = None
         self.dlx_exchange: Optional[aio_pika.Exchange] = None
         self.dlq_queue: Optional[aio_pika.Queue] = None
+        # El exchange principal en el canal de publicación
+        self.publish_exchange: Optional[aio_pika.Exchange] = None
+        
+        # Exchanges obtenidos por nombre para publicar (ver publish_message)
+        self.exchanges: dict[str, aio_pika.Exchange] = {}
         
         # Lista de consumidores (tag, queue)
         self.active_consumers: list[tuple[str, aio_pika.Queue]] = []
+        
+        # Listeners que crearon los consumidores; se vuelven a iniciar tras una reconexión (ver conn.add_listener)
+        self.listeners: list[Callable[["RabbitMQClient"], Awaitable[None]]] = []
+        
+        # Estado de la conexión y reconexiones automáticas (ver conn.py)
+        self.closing = False
+        self.reconnect_task: Optional[asyncio.Task] = None
+        self.connected = False
+        self.reconnects = 0
+        self.failed_reconnects = 0
+        # Segundos acumulados sin conexión (sin contar la caída en curso)
+        self.downtime = 0.0
+        # Instante (reloj monotónico) en que se perdió la conexión, o None si está conectado
+        self.disconnected_since: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def connection_stats(self) -> dict:
+        current_outage = time.monotonic() - self.disconnected_since if self.disconnected_since is not None else 0.0
+        return {
+            "connected": self.connected,
+            "reconnects": self.reconnects,
+            "failed_reconnects": self.failed_reconnects,
+            "downtime_seconds": self.downtime + current_outage,
+            "current_outage_seconds": current_outage,
+            "last_error": self.last_error,
+        }
 
 # Diccionario de clientes RabbitMQ
 # TODO: Si hay que agregar más clientes, hacerlo aquí!!!
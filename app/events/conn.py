@@ -3,6 +3,9 @@ import os
 import logging
 import json
 import asyncio
+import random
+import time
+from collections.abc import Awaitable, Callable
 from typing import Optional
 from .clients import RabbitMQClient, rabbit_clients
 
@@ -12,7 +15,67 @@ logger = logging.getLogger(__name__)
 
 # Configuración global de reintentos
 MAX_RETRIES = int(os.getenv("RABBITMQ_MAX_RETRIES", "20"))
+# Espera base (segundos) entre reintentos; se duplica en cada intento hasta RETRY_MAX_DELAY, con jitter
 RETRY_DELAY = float(os.getenv("RABBITMQ_RETRY_DELAY", "3"))
+RETRY_MAX_DELAY = float(os.getenv("RABBITMQ_RETRY_MAX_DELAY", "30"))
+# Conexiones AMQP por URL que comparten los clientes (cada cliente usa sus propios canales)
+POOL_SIZE = max(1, int(os.getenv("RABBITMQ_CONNECTIONS", "1")))
+
+
+class _ConnectionPool:
+    """Conexiones AMQP compartidas por los clientes de `rabbit_clients`.
+
+    Los clientes de una misma URL se reparten en `size` conexiones (una por defecto) y cada uno abre
+    sus canales sobre la que le toca. Si una conexión se cae, el primer cliente que la pide de nuevo
+    la reabre y los demás reutilizan la nueva.
+    """
+
+    def __init__(self, size: int = POOL_SIZE):
+        self.size = size
+        self._connections: dict[tuple[str, int], aio_pika.abc.AbstractConnection] = {}
+        self._locks: dict[tuple[str, int], asyncio.Lock] = {}
+        self._slots: dict[RabbitMQClient, int] = {}
+        self.opened = 0
+
+    def _key(self, client: RabbitMQClient) -> tuple[str, int]:
+        if client not in self._slots:
+            same_url = sum(1 for other in self._slots if other.rabbitmq_url == client.rabbitmq_url)
+            self._slots[client] = same_url % self.size
+        return client.rabbitmq_url, self._slots[client]
+
+    async def acquire(self, client: RabbitMQClient) -> aio_pika.abc.AbstractConnection:
+        """Devuelve la conexión del cliente, abriéndola si aún no existe o si se cerró."""
+        key = self._key(client)
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            connection = self._connections.get(key)
+            if connection is None or connection.is_closed:
+                connection = await aio_pika.connect(client.rabbitmq_url)
+                self._connections[key] = connection
+                self.opened += 1
+                logger.info(f"Conexión {key[1] + 1}/{self.size} a RabbitMQ abierta.")
+        return connection
+
+    async def release(self, client: RabbitMQClient):
+        """Desasigna al cliente y cierra su conexión si ningún otro cliente la usa."""
+        if client not in self._slots:
+            return
+        key = self._key(client)
+        del self._slots[client]
+        if any(self._key(other) == key for other in self._slots):
+            return
+        connection = self._connections.pop(key, None)
+        if connection is not None and not connection.is_closed:
+            await connection.close()
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "open": sum(1 for connection in self._connections.values() if not connection.is_closed),
+            "opened": self.opened,
+        }
+
+
+pool = _ConnectionPool()
 
 async def _setup_rabbitmq(client: RabbitMQClient):
     """Funcion auxiliar para configurar los exchanges, colas y bindings."""
@@ -58,22 +121,122 @@ async def _setup_rabbitmq(client: RabbitMQClient):
     
     logger.info("Configuración de RabbitMQ completada.")
 
+def _backoff_delay(attempt: int) -> float:
+    """Espera antes del reintento `attempt` (desde 0): backoff exponencial acotado con jitter completo.
+
+    El jitter evita que todas las réplicas (y todos los clientes) reintenten a la vez tras una caída del broker.
+    """
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_DELAY * 2 ** attempt))
+
+async def _open(client: RabbitMQClient):
+    """Abre los canales del cliente sobre su conexión del pool y declara su topología.
+
+    El canal de consumo (`client.channel`) declara la topología y recibe los consumidores; el de
+    publicación (`client.publish_channel`) solo publica, así su QoS, sus confirmaciones y un error
+    de publicación que lo cierre no afectan a los consumidores.
+    """
+    client.connection = await pool.acquire(client)
+    # Ambos canales en paralelo: cada apertura es un viaje de ida y vuelta al broker
+    client.channel, client.publish_channel = await asyncio.gather(
+        client.connection.channel(),
+        # Con publisher confirms, cada publicación espera el ack del broker; los mensajes sin
+        # destino se devuelven y se reportan como error en lugar de descartarse en silencio
+        client.connection.channel(publisher_confirms=True, on_return_raises=True)
+    )
+    client.exchanges.clear()
+    # Los consumidores de la conexión anterior murieron con ella
+    client.active_consumers.clear()
+
+    await _setup_rabbitmq(client)
+    # Ya declarado en el canal de consumo; se obtiene por nombre, sin otro viaje al broker
+    client.publish_exchange = await client.publish_channel.get_exchange(client.exchange_name, ensure=False)
+
+    # Si la conexión compartida se cae, se cierran los canales de todos sus clientes y cada uno se reconecta
+    client.channel.close_callbacks.add(lambda sender, exc: _on_closed(client, sender, exc))
+    client.publish_channel.close_callbacks.add(lambda sender, exc: _on_closed(client, sender, exc))
+    client.connected = True
+
+def _on_closed(client: RabbitMQClient, sender, exc: BaseException | None):
+    """Callback de cierre de un canal del cliente: si no fue pedido, inicia la reconexión."""
+    if client.closing or sender not in (client.channel, client.publish_channel):
+        # Cierre ordenado, o un canal de una conexión anterior
+        return
+    if client.reconnect_task is not None and not client.reconnect_task.done():
+        # Al cerrarse la conexión se cierran ambos canales: una sola reconexión
+        return
+    logger.error(f"Se perdió la conexión a RabbitMQ del exchange '{client.exchange_name}': {exc}. Reconectando...")
+    client.connected = False
+    client.disconnected_since = time.monotonic()
+    client.last_error = str(exc)
+    # Sin canal, las publicaciones fallan de inmediato con ConnectionError en vez de esperar su timeout.
+    # Si solo se cerró uno, el otro sigue abierto (con sus consumidores): `_reconnect` lo cierra antes de abrir otros
+    stale_channels = (client.channel, client.publish_channel)
+    client.channel = client.publish_channel = None
+    client.reconnect_task = asyncio.create_task(_reconnect(client, stale_channels))
+
+async def _close_quietly(client: RabbitMQClient, stale_channels: tuple = ()):
+    """Cierra los canales del cliente, y los anteriores `stale_channels`, que sigan abiertos (la conexión
+    es compartida y queda en el pool)."""
+    channels = (client.channel, client.publish_channel, *stale_channels)
+    client.channel = client.publish_channel = None
+    for channel in channels:
+        if channel is not None and not channel.is_closed:
+            try:
+                await channel.close()
+            except Exception as e:
+                logger.warning(f"Error al cerrar un canal anterior de RabbitMQ: {e}")
+
+async def _reconnect(client: RabbitMQClient, stale_channels: tuple = ()):
+    """Reconecta el cliente con backoff exponencial y jitter hasta lograrlo o hasta que se cierre la app.
+
+    Antes de abrir los canales nuevos se cierran los anteriores (`stale_channels`) que sigan abiertos,
+    para no dejar consumidores duplicados. Tras reconectar se vuelve a declarar la topología (`_setup_rabbitmq`) y se vuelven a iniciar los
+    listeners registrados, que recrean los consumidores de `active_consumers`.
+    """
+    attempt = 0
+    while not client.closing:
+        await asyncio.sleep(_backoff_delay(attempt))
+        if client.closing:
+            return
+        try:
+            await _close_quietly(client, stale_channels)
+            await _open(client)
+            for listener in client.listeners:
+                await listener(client)
+        except Exception as e:
+            attempt += 1
+            client.connected = False
+            client.failed_reconnects += 1
+            client.last_error = str(e)
+            logger.error(f"Reintento {attempt} de reconexión a RabbitMQ fallido para exchange '{client.exchange_name}': {e}")
+            continue
+
+        outage = time.monotonic() - client.disconnected_since
+        client.downtime += outage
+        client.disconnected_since = None
+        client.reconnects += 1
+        logger.info(f"Reconexión a RabbitMQ para exchange '{client.exchange_name}' exitosa tras {outage:.1f} s ({len(client.active_consumers)} consumidor(es) restaurado(s)).")
+        return
+
 async def connect_to_rabbitmq(client: RabbitMQClient):
-    """Establece la conexión con RabbitMQ para un cliente específico. Si falla, reintenta hasta N veces."""
+    """Establece la conexión con RabbitMQ para un cliente específico. Si falla, reintenta hasta N veces.
+
+    Una vez conectado, si la conexión se pierde se reconecta sola (ver `_reconnect`).
+    """
+    client.closing = False
     for attempt in range(MAX_RETRIES):
         try:
             logger.info(f"Conectando a RabbitMQ en: {client.rabbitmq_url}... (Intento {attempt + 1} de {MAX_RETRIES})")
-            client.connection = await aio_pika.connect(client.rabbitmq_url)
-            client.channel = await client.connection.channel()
-
-            await _setup_rabbitmq(client)
+            await _open(client)
 
             logger.info(f"Conexión a RabbitMQ en {client.rabbitmq_url} establecida con éxito para exchange '{client.exchange_name}'.")
             return
         except (ConnectionError, asyncio.TimeoutError, aio_pika.exceptions.AMQPConnectionError) as e:
+            await _close_quietly(client)
             if MAX_RETRIES - (attempt + 1) > 0:
-                logger.error(f"No se pudo conectar a RabbitMQ: {e}. Reintentando en {RETRY_DELAY} segundos...")
-                await asyncio.sleep(RETRY_DELAY)
+                delay = _backoff_delay(attempt)
+                logger.error(f"No se pudo conectar a RabbitMQ: {e}. Reintentando en {delay:.1f} segundos...")
+                await asyncio.sleep(delay)
             else:
                 logger.error(f"No se pudo conectar a RabbitMQ después de {MAX_RETRIES} intentos. Rindiéndose.")
                 raise e
@@ -81,16 +244,26 @@ async def connect_to_rabbitmq(client: RabbitMQClient):
             logger.error(f"Ocurrió un error inesperado durante la conexión a RabbitMQ: {e}.")
             raise
 
+async def add_listener(client: RabbitMQClient, listener: Callable[[RabbitMQClient], Awaitable[None]]):
+    """Inicia un listener (función que crea consumidores en `client`) y lo registra para volver a
+    iniciarlo cada vez que el cliente se reconecte."""
+    await listener(client)
+    client.listeners.append(listener)
+
 async def connect_to_rabbitmq_all():
-    """Establece la conexión con RabbitMQ para todos los clientes en rabbit_clients."""
-    logger.info(f"Conectando a todos los clientes RabbitMQ ({len(rabbit_clients)} cliente(s))...")
-    for client_name, client in rabbit_clients.items():
-        logger.info(f"Conectando cliente '{client_name}'...")
-        await connect_to_rabbitmq(client)
+    """Establece la conexión con RabbitMQ para todos los clientes en rabbit_clients, en paralelo."""
+    logger.info(f"Conectando a todos los clientes RabbitMQ ({len(rabbit_clients)} cliente(s), {pool.size} conexión(es) por URL)...")
+    await asyncio.gather(*(connect_to_rabbitmq(client) for client in rabbit_clients.values()))
     logger.info("Todos los clientes RabbitMQ conectados exitosamente.")
 
 async def close_rabbitmq_connection(client: RabbitMQClient):
-    """Cierra la conexión con RabbitMQ para un cliente específico."""
+    """Cierra la conexión con RabbitMQ para un cliente específico (y detiene su reconexión, si está en curso)."""
+    client.closing = True
+    client.listeners.clear()
+    if client.reconnect_task is not None:
+        client.reconnect_task.cancel()
+        await asyncio.gather(client.reconnect_task, return_exceptions=True)
+        client.reconnect_task = None
     if client.channel:
         for tag, queue in client.active_consumers:
             try:
@@ -101,9 +274,11 @@ async def close_rabbitmq_connection(client: RabbitMQClient):
         
         client.active_consumers.clear()
 
-        await client.channel.close()
-    if client.connection:
-        await client.connection.close()
+    await _close_quietly(client)
+    # La conexión se cierra cuando ya no la usa ningún cliente
+    await pool.release(client)
+    client.connection = None
+    client.connected = False
     logger.info(f"Conexión a RabbitMQ cerrada para exchange '{client.exchange_name}'.")
 
 async def close_rabbitmq_connection_all():
@@ -113,3 +288,10 @@ async def close_rabbitmq_connection_all():
         logger.info(f"Cerrando cliente '{client_name}'...")
         await close_rabbitmq_connection(client)
     logger.info("Todas las conexiones RabbitMQ cerradas.")
+
+def rabbitmq_stats() -> dict:
+    """Conexiones del pool y estado de cada cliente RabbitMQ (reconexiones y tiempo sin conexión)."""
+    return {
+        "connections": pool.stats(),
+        "clients": {client_name: client.connection_stats() for client_name, client in rabbit_clients.items()},
+    }
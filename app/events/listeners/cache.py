@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import os
+from ...db.cache import CHANNEL_CACHE_ENABLED, clear_caches
+from ...db.bloom import CHANNEL_BLOOM_ENABLED, rebuild_channel_filter
+from ...events.conn import add_listener
+from ...events.consumer import start_consumer
+from ..callbacks.cache import process_channel_event
+
+logger = logging.getLogger(__name__)
+
+# Eventos del exchange `channel` que modifican un canal o sus miembros
+CACHE_INVALIDATION_ROUTING_KEYS = ("channelService.v1.channel.#", "channelService.v1.user.#")
+CACHE_INVALIDATION_PREFETCH = int(os.getenv("CHANNEL_CACHE_INVALIDATION_PREFETCH", "100"))
+
+# Reconstrucción del filtro de Bloom lanzada tras una reconexión (se guarda para que no la recolecte el GC)
+_rebuild_task: asyncio.Task | None = None
+
+
+async def _start_cache_consumer(client):
+    # La cola exclusiva se pierde con la conexión: tras una reconexión se declara una nueva
+    queue = await client.channel.declare_queue(exclusive=True, auto_delete=True)
+    for routing_key in CACHE_INVALIDATION_ROUTING_KEYS:
+        await queue.bind(client.main_exchange, routing_key=routing_key)
+
+    consumer_tag = await start_consumer(
+        client=client,
+        callback=process_channel_event,
+        queue_name=queue.name,
+        prefetch_count=CACHE_INVALIDATION_PREFETCH,
+        manual_ack=False
+    )
+    logger.info(f"Listener de invalidación de caché iniciado en la cola '{queue.name}' con tag: {consumer_tag}")
+
+    if client.disconnected_since is not None:
+        # Reconexión: los eventos emitidos mientras no existía la cola no llegaron a esta réplica
+        clear_caches()
+        global _rebuild_task
+        _rebuild_task = asyncio.create_task(_rebuild_filter_after_reconnect())
+
+
+async def _rebuild_filter_after_reconnect():
+    try:
+        await rebuild_channel_filter()
+    except Exception as e:
+        logger.error(f"Error al reconstruir el filtro de Bloom tras reconectar: {e}")
+
+
+async def create_cache_listeners(clients: dict):
+    """Suscribe esta réplica a los eventos de canales para invalidar su caché local y registrar
+    los canales creados en otras réplicas en su filtro de Bloom.
+
+    Cada réplica declara su propia cola exclusiva (nombrada por el broker y eliminada al
+    desconectarse), de modo que todas reciben cada evento, a diferencia de la cola principal.
+    """
+    if not CHANNEL_CACHE_ENABLED and not CHANNEL_BLOOM_ENABLED:
+        logger.info("Caché y filtro de Bloom de canales deshabilitados; no se inicia el listener de invalidación.")
+        return
+
+    if "channel" not in clients:
+        logger.warning("Cliente 'channel' no encontrado en la configuración de RabbitMQ")
+        return
+
+    try:
+        await add_listener(clients["channel"], _start_cache_consumer)
+    except Exception as e:
+        logger.error(f"Error al iniciar listener de invalidación de caché: {e}")
+        raise
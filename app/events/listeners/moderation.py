@@ -1,10 +1,21 @@
 import logging
+from ...events.conn import add_listener
 from ...events.consumer import start_consumer_main
 from ..callbacks.moderation import process_moderation_message
 
 logger = logging.getLogger(__name__)
 
 
+async def _start_moderation_consumer(client):
+    consumer_tag = await start_consumer_main(
+        client=client,
+        callback=process_moderation_message,
+        prefetch_count=1,
+        manual_ack=False
+    )
+    logger.info(f"Listener de moderación iniciado con tag: {consumer_tag}")
+
+
 async def create_moderation_listeners(clients: dict):
     """Crea los listeners para las colas de moderación."""
     if "moderation" not in clients:
@@ -12,13 +23,7 @@ async def create_moderation_listeners(clients: dict):
         return
     
     try:
-        consumer_tag = await start_consumer_main(
-            client=clients["moderation"],
-            callback=process_moderation_message,
-            prefetch_count=1,
-            manual_ack=False
-        )
-        logger.info(f"Listener de moderación iniciado con tag: {consumer_tag}")
+        await add_listener(clients["moderation"], _start_moderation_consumer)
     except Exception as e:
         logger.error(f"Error al iniciar listener de moderación: {e}")
         raise
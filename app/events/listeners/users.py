@@ -1,10 +1,21 @@
 import logging
+from ...events.conn import add_listener
 from ...events.consumer import start_consumer_main
 from ..callbacks.users import process_user_message
 
 logger = logging.getLogger(__name__)
 
 
+async def _start_users_consumer(client):
+    consumer_tag = await start_consumer_main(
+        client=client,
+        callback=process_user_message,
+        prefetch_count=1,
+        manual_ack=False
+    )
+    logger.info(f"Listener de usuarios iniciado con tag: {consumer_tag}")
+
+
 async def create_user_listeners(clients: dict):
     """Crea los listeners para las colas de usuarios."""
     if "users" not in clients:
@@ -12,13 +23,7 @@ async def create_user_listeners(clients: dict):
         return
     
     try:
-        consumer_tag = await start_consumer_main(
-            client=clients["users"],
-            callback=process_user_message,
-            prefetch_count=1,
-            manual_ack=False
-        )
-        logger.info(f"Listener de usuarios iniciado con tag: {consumer_tag}")
+        await add_listener(clients["users"], _start_users_consumer)
     except Exception as e:
         logger.error(f"Error al iniciar listener de usuarios: {e}")
         raise
@@ -0,0 +1,202 @@
+"""Relay del outbox: publica en RabbitMQ los eventos encolados en los canales.
+
+Cada escritura sobre un canal o sus miembros encola su evento en el outbox del propio documento del
+canal (ver `_outbox_push` en `db/querys.py`): en la misma actualización cuando el cambio es del canal,
+y en la misma transacción cuando es de `channel_members`. Así la petición no espera al broker, y un
+evento no se pierde ni se emite sin que el cambio haya ocurrido.
+
+Una sola réplica a la vez (la que tiene el lock `OUTBOX_LEASE_NAME`) drena los outbox en lotes:
+
+- Los eventos de un canal se publican de a uno y en orden, esperando la confirmación del broker
+  antes del siguiente; si uno falla, el resto del canal espera y el canal se aplaza con backoff
+  exponencial (`OUTBOX_RETRY_BASE_DELAY` a `OUTBOX_RETRY_MAX_DELAY`), sin frenar a los demás.
+- Un evento que el broker rechaza (`PublishError`) `OUTBOX_MAX_ATTEMPTS` veces seguidas se retira
+  a la colección `outbox_dead_letters` para que no bloquee al resto del canal. Los fallos de
+  conexión no cuentan para esto: el evento espera a que el broker vuelva.
+- Los canales de un lote se publican en paralelo (acotados por la ventana del publicador).
+- Un evento publicado se quita del outbox después de su confirmación: la entrega es "al menos una
+  vez" y cada mensaje lleva `event_id` para que los consumidores descarten duplicados.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+from ..db import querys
+from .clients import rabbit_clients
+from .publish import PublishError, publish_message_main, _LatencySamples
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_RELAY_ENABLED = os.getenv("OUTBOX_RELAY_ENABLED", "true").lower() == "true"
+# Segundos entre revisiones del outbox cuando no hay avisos de escrituras locales
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "0.5"))
+# Canales por lote y eventos por canal en cada lote
+OUTBOX_BATCH_CHANNELS = int(os.getenv("OUTBOX_BATCH_CHANNELS", "100"))
+OUTBOX_BATCH_EVENTS = int(os.getenv("OUTBOX_BATCH_EVENTS", "100"))
+# Vigencia (segundos) del lock del relay; se renueva en cada vuelta
+OUTBOX_LEASE_TTL = float(os.getenv("OUTBOX_LEASE_TTL", "15"))
+OUTBOX_LEASE_NAME = "outbox_relay"
+# Backoff (segundos) de un canal cuyo primer evento no se pudo publicar: base * 2^(intentos - 1), con tope
+OUTBOX_RETRY_BASE_DELAY = float(os.getenv("OUTBOX_RETRY_BASE_DELAY", "1"))
+OUTBOX_RETRY_MAX_DELAY = float(os.getenv("OUTBOX_RETRY_MAX_DELAY", "300"))
+# Rechazos del broker tras los que un evento se retira a `outbox_dead_letters`
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+# Canales atascados que se detallan en /status
+OUTBOX_STUCK_SAMPLE = int(os.getenv("OUTBOX_STUCK_SAMPLE", "5"))
+
+
+class _OutboxRelay:
+    """Drena los outbox de los canales mientras esta réplica tenga el lock del relay."""
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self._wakeup = asyncio.Event()
+        # Hasta cuándo (reloj monotónico) se puede publicar sin renovar el lock
+        self._lease_until = 0.0
+        self.is_leader = False
+        self.relayed = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self.batches = 0
+        # Antigüedad del evento pendiente más antiguo en la última revisión
+        self.lag = 0.0
+        self.pending_channels = 0
+        # Desde que el evento se encoló hasta que el broker confirmó su publicación
+        self.delivery_lag = _LatencySamples()
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def _wait(self):
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_INTERVAL)
+        except TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def _holds_lease(self) -> bool:
+        return self.is_leader and time.monotonic() < self._lease_until
+
+    async def _acquire_lease(self) -> bool:
+        requested_at = time.monotonic()
+        self.is_leader = await querys.db_acquire_lease(OUTBOX_LEASE_NAME, self.owner, OUTBOX_LEASE_TTL)
+        if self.is_leader:
+            # Margen para que el lock no venza en MongoDB mientras esta réplica aún publica
+            self._lease_until = requested_at + OUTBOX_LEASE_TTL / 2
+        return self.is_leader
+
+    async def _relay_channel(self, document: dict) -> int:
+        """Publica en orden los eventos de un canal y los quita del outbox. Devuelve cuántos publicó."""
+        published = []
+        failure = None
+        for event in document["outbox"]:
+            if not self._holds_lease():
+                break
+            message = {**event["payload"], "event_id": str(event["event_id"])}
+            try:
+                await publish_message_main(rabbit_clients["channel"], message, event["routing_key"])
+            except Exception as e:
+                # Los eventos siguientes del canal esperan: publicarlos ahora alteraría el orden
+                self.failed += 1
+                logger.error(f"No se pudo publicar el evento '{event['routing_key']}' del canal '{document['_id']}': {e}")
+                failure = (event, e)
+                break
+            self.delivery_lag.add(max(0.0, datetime.now().timestamp() - event["created_at"]))
+            published.append(event["event_id"])
+
+        if published:
+            await querys.db_ack_outbox_events(document["_id"], published)
+            self.relayed += len(published)
+        if failure is not None:
+            # Confirmar eventos descarta los fallos previos: el que falló ahora encabeza el outbox
+            attempts = (0 if published else document.get("outbox_attempts", 0)) + 1
+            await self._handle_failure(document["_id"], *failure, attempts)
+        return len(published)
+
+    async def _handle_failure(self, channel_id, event: dict, error: Exception, attempts: int):
+        """Aplaza el canal con backoff o, si el broker ya rechazó el evento `OUTBOX_MAX_ATTEMPTS` veces, lo retira."""
+        if isinstance(error, PublishError) and attempts >= OUTBOX_MAX_ATTEMPTS:
+            await querys.db_dead_letter_outbox_event(channel_id, event, attempts, str(error))
+            self.dead_lettered += 1
+            logger.error(f"Evento '{event['routing_key']}' del canal '{channel_id}' retirado a outbox_dead_letters tras {attempts} intentos.")
+            return
+        delay = min(OUTBOX_RETRY_MAX_DELAY, OUTBOX_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+        await querys.db_defer_outbox(channel_id, attempts, datetime.now().timestamp() + delay, str(error))
+
+    async def relay_batch(self) -> int:
+        """Publica un lote de eventos pendientes. Devuelve cuántos eventos se publicaron."""
+        documents = await querys.db_get_pending_outbox(OUTBOX_BATCH_CHANNELS, OUTBOX_BATCH_EVENTS)
+        self.pending_channels = len(documents)
+        self.lag = datetime.now().timestamp() - documents[0]["outbox_since"] if documents else 0.0
+        if not documents:
+            return 0
+        self.batches += 1
+        return sum(await asyncio.gather(*(self._relay_channel(document) for document in documents)))
+
+    async def run(self):
+        logger.info(f"Relay del outbox iniciado ({self.owner}).")
+        try:
+            while True:
+                try:
+                    if await self._acquire_lease() and await self.relay_batch() > 0:
+                        # Mientras haya eventos publicables se sigue sin esperar
+                        continue
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error en el relay del outbox: {e}")
+                await self._wait()
+        finally:
+            if self.is_leader:
+                self.is_leader = False
+                try:
+                    await querys.db_release_lease(OUTBOX_LEASE_NAME, self.owner)
+                except Exception as e:
+                    logger.warning(f"No se pudo liberar el lock del relay del outbox: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": OUTBOX_RELAY_ENABLED,
+            "leader": self.is_leader,
+            "relayed": self.relayed,
+            "failed": self.failed,
+            "dead_lettered": self.dead_lettered,
+            "batches": self.batches,
+            "lag_seconds": self.lag,
+            "pending_channels": self.pending_channels,
+            "delivery_lag": self.delivery_lag.stats(),
+        }
+
+
+relay = _OutboxRelay()
+
+
+def notify_outbox():
+    """Avisa al relay de esta réplica que hay eventos nuevos, para no esperar a la próxima revisión."""
+    relay.notify()
+
+
+def start_outbox_relay() -> asyncio.Task | None:
+    """Inicia el relay en segundo plano. None si está deshabilitado (`OUTBOX_RELAY_ENABLED=false`)."""
+    if not OUTBOX_RELAY_ENABLED:
+        logger.info("Relay del outbox deshabilitado en esta réplica.")
+        return None
+    return asyncio.create_task(relay.run())
+
+
+async def outbox_stats() -> dict:
+    """Métricas del relay del outbox (lag, eventos publicados y fallidos) y canales atascados.
+
+    `stuck` se consulta en MongoDB, así que cualquier réplica lo reporta (no solo la que publica).
+    """
+    stats = relay.stats()
+    try:
+        count, channels = await querys.db_get_stuck_outbox(OUTBOX_STUCK_SAMPLE)
+        stats["stuck"] = {"channels": count, "top": channels}
+    except Exception as e:
+        logger.warning(f"No se pudieron obtener los canales atascados del outbox: {e}")
+        stats["stuck"] = None
+    return stats
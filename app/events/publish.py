@@ -1,54 +1,158 @@
 import aio_pika
+import asyncio
 import json
 import logging
+import os
+import time
+from collections import deque
+from ..deadline import deadline_scope
 
 logger = logging.getLogger(__name__)
 
+# Tiempo límite (segundos) de una publicación hecha fuera de una petición HTTP
+PUBLISH_TIMEOUT = float(os.getenv("RABBITMQ_PUBLISH_TIMEOUT", "5"))
+# Publicaciones enviadas y aún sin confirmar por el broker; al llenarse, las siguientes esperan
+PUBLISH_MAX_IN_FLIGHT = int(os.getenv("RABBITMQ_PUBLISH_MAX_IN_FLIGHT", "256"))
+# Muestras recientes con las que se calculan los percentiles de latencia
+LATENCY_SAMPLES = 1024
+
 class PublishError(Exception):
     """Excepción personalizada para errores de publicación en RabbitMQ."""
     pass
 
-async def publish_message_main(client, message_body: dict, routing_key: str):
-    """Publica un mensaje simple en el exchange principal de RabbitMQ."""
-    if not client.channel:
-        logger.error("No hay un canal de RabbitMQ disponible para publicar.")
-        raise ConnectionError("La conexión a RabbitMQ no está establecida.")
 
-    message_body["type"] = routing_key
+class _LatencySamples:
+    """Latencias recientes (en segundos) para reportar percentiles."""
+
+    def __init__(self, maxlen: int = LATENCY_SAMPLES):
+        self._samples: deque[float] = deque(maxlen=maxlen)
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+        self.max = max(self.max, seconds)
+
+    def stats(self) -> dict:
+        if not self._samples:
+            return {"p50_ms": 0.0, "p99_ms": 0.0, "max_ms": self.max * 1000}
+        ordered = sorted(self._samples)
+        return {
+            "p50_ms": ordered[len(ordered) // 2] * 1000,
+            "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class _Publisher:
+    """Publica con confirmaciones del broker (publisher confirms), con una ventana acotada de
+    mensajes sin confirmar.
+
+    Las publicaciones concurrentes se envían sin esperarse entre sí y cada una espera solo la
+    confirmación de su mensaje. Un `nack` o un mensaje devuelto por no tener destino se reportan
+    como `PublishError`.
+    """
+
+    def __init__(self, max_in_flight: int = PUBLISH_MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self._window = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.published = 0
+        self.failed = 0
+        # Desde que se pide publicar (incluida la espera por la ventana) hasta la confirmación
+        self.latency = _LatencySamples()
+        # Desde que el mensaje se envía hasta que el broker lo confirma
+        self.confirm_lag = _LatencySamples()
+
+    async def publish(self, exchange: aio_pika.abc.AbstractExchange, message: aio_pika.Message, routing_key: str):
+        requested_at = time.monotonic()
+        async with self._window:
+            self.in_flight += 1
+            sent_at = time.monotonic()
+            try:
+                await exchange.publish(message, routing_key=routing_key)
+            except (aio_pika.exceptions.DeliveryError, aio_pika.exceptions.PublishError) as e:
+                self.failed += 1
+                logger.error(f"El broker no confirmó el mensaje con routing key '{routing_key}': {e}")
+                raise PublishError(f"El broker no confirmó el mensaje con routing key '{routing_key}'.") from e
+            except BaseException:
+                self.failed += 1
+                raise
+            finally:
+                self.in_flight -= 1
+        confirmed_at = time.monotonic()
+        self.confirm_lag.add(confirmed_at - sent_at)
+        self.latency.add(confirmed_at - requested_at)
+        self.published += 1
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "published": self.published,
+            "failed": self.failed,
+            "latency": self.latency.stats(),
+            "confirm_lag": self.confirm_lag.stats(),
+        }
+
+
+publisher = _Publisher()
+
 
-    message_payload = aio_pika.Message(
+def publisher_stats() -> dict:
+    """Métricas de las publicaciones en RabbitMQ."""
+    return publisher.stats()
+
+
+def _build_message(message_body: dict, routing_key: str) -> aio_pika.Message:
+    message_body["type"] = routing_key
+    return aio_pika.Message(
         body=json.dumps(message_body).encode('utf-8'),
         delivery_mode=aio_pika.DeliveryMode.PERSISTENT
     )
-    
-    try:
-        _ = await client.channel.get_exchange(client.main_exchange.name, ensure=True)
-    except aio_pika.exceptions.ExchangeNotFoundEntity:
-        logger.error(f"El exchange '{client.main_exchange.name}' no existe.")
-        raise PublishError(f"El exchange '{client.main_exchange.name}' no existe.")
 
-    await client.main_exchange.publish(message_payload, routing_key=routing_key)
-    logger.info(f"Mensaje publicado en exchange '{client.main_exchange.name}' con routing key '{routing_key}'")
+
+async def publish_message_main(client, message_body: dict, routing_key: str):
+    """Publica un mensaje simple en el exchange principal de RabbitMQ y espera su confirmación.
+
+    Usa el exchange declarado al conectar (`client.publish_exchange`), sin volver a verificarlo en
+    cada publicación.
+    """
+    if not client.publish_channel:
+        logger.error("No hay un canal de RabbitMQ disponible para publicar.")
+        raise ConnectionError("La conexión a RabbitMQ no está establecida.")
+
+    if not client.publish_exchange:
+        logger.error(f"El exchange '{client.exchange_name}' no está declarado.")
+        raise PublishError(f"El exchange '{client.exchange_name}' no está declarado.")
+
+    message_payload = _build_message(message_body, routing_key)
+
+    # Acotada por el deadline de la petición en curso: un broker trabado no retiene al worker
+    async with deadline_scope(PUBLISH_TIMEOUT):
+        await publisher.publish(client.publish_exchange, message_payload, routing_key)
+    logger.info(f"Mensaje publicado en exchange '{client.publish_exchange.name}' con routing key '{routing_key}'")
 
 
 async def publish_message(client, message_body: dict, routing_key: str, exchange_name: str):
-    """Publica un mensaje en un exchange de RabbitMQ."""
-    if not client.channel:
+    """Publica un mensaje en un exchange de RabbitMQ y espera su confirmación.
+
+    El exchange se verifica la primera vez y queda guardado en `client.exchanges`.
+    """
+    if not client.publish_channel:
         logger.error("No hay un canal de RabbitMQ disponible para publicar.")
         raise ConnectionError("La conexión a RabbitMQ no está establecida.")
 
-    message_body["type"] = routing_key
+    message_payload = _build_message(message_body, routing_key)
 
-    message_payload = aio_pika.Message(
-        body=json.dumps(message_body).encode('utf-8'),
-        delivery_mode=aio_pika.DeliveryMode.PERSISTENT
-    )
-    
-    try:
-        target_exchange = await client.channel.get_exchange(exchange_name, ensure=True)
-    except aio_pika.exceptions.ChannelClosed:
-        logger.error(f"El exchange '{exchange_name}' no existe.")
-        raise PublishError(f"El exchange '{exchange_name}' no existe.")
-    
-    await target_exchange.publish(message_payload, routing_key=routing_key)
+    async with deadline_scope(PUBLISH_TIMEOUT):
+        target_exchange = client.exchanges.get(exchange_name)
+        if target_exchange is None:
+            try:
+                target_exchange = await client.publish_channel.get_exchange(exchange_name, ensure=True)
+            except aio_pika.exceptions.ChannelClosed:
+                logger.error(f"El exchange '{exchange_name}' no existe.")
+                raise PublishError(f"El exchange '{exchange_name}' no existe.")
+            client.exchanges[exchange_name] = target_exchange
+
+        await publisher.publish(target_exchange, message_payload, routing_key)
     logger.info(f"Mensaje publicado en exchange '{exchange_name}' con routing key '{routing_key}'")
@@ -1,11 +1,24 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pymongo.errors import PyMongoError
 from contextlib import asynccontextmanager
 from .routers.v1 import channels, members
 from .db.conn import connect_to_mongo, close_mongo_connection
-from .events.conn import connect_to_rabbitmq_all, close_rabbitmq_connection_all
+from .db.indexes import ensure_indexes
+from .db.cache import cache_stats
+from .db.bloom import rebuild_channel_filter, bloom_stats
+from .events.conn import connect_to_rabbitmq_all, close_rabbitmq_connection_all, rabbitmq_stats
 from .events.clients import rabbit_clients
+from .events.publish import publisher_stats
+from .events.outbox import start_outbox_relay, outbox_stats
 from .events.listeners.users import create_user_listeners
 from .events.listeners.moderation import create_moderation_listeners
+from .events.listeners.cache import create_cache_listeners
+from .admission import AdmissionControlMiddleware, admission_stats, loop_lag_monitor
+from .deadline import (
+    REQUEST_TIMEOUT, REQUEST_TIMEOUT_MAX, REQUEST_TIMEOUT_HEADER, DEADLINE_DETAIL, DeadlineExceeded, is_deadline_error, request_deadline
+)
+import asyncio
 import logging
 import socket
 import os
@@ -13,18 +26,93 @@ import os
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+# ============ Deadline por petición ============
+
+# Respuestas en streaming: sin deadline por defecto (duran lo que tarde el cliente en leerlas)
+STREAMING_PATH_PREFIXES = ("/v1/channels/export",)
+_NDJSON_ACCEPT = b"application/x-ndjson"
+
+
+class DeadlineMiddleware:
+    """Middleware ASGI que fija el tiempo límite de cada petición (ver `app/deadline.py`).
+
+    Usa `REQUEST_TIMEOUT` o el valor (en segundos) de la cabecera `X-Request-Timeout`, hasta
+    `REQUEST_TIMEOUT_MAX`. Si se agota antes de empezar a responder, la respuesta es `504`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        requested = headers.get(REQUEST_TIMEOUT_HEADER.lower().encode())
+        if requested is not None:
+            try:
+                timeout = float(requested)
+                if not 0 < timeout <= REQUEST_TIMEOUT_MAX:
+                    raise ValueError
+            except ValueError:
+                response = JSONResponse(
+                    {"detail": f"{REQUEST_TIMEOUT_HEADER} debe ser un número de segundos entre 0 y {REQUEST_TIMEOUT_MAX:g}."},
+                    status_code=400
+                )
+                await response(scope, receive, send)
+                return
+        elif scope["path"].startswith(STREAMING_PATH_PREFIXES) or _NDJSON_ACCEPT in headers.get(b"accept", b""):
+            timeout = None
+        else:
+            timeout = REQUEST_TIMEOUT
+
+        response_started = False
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            with request_deadline(timeout):
+                await self.app(scope, receive, send_wrapper)
+        except Exception as exc:
+            # Deadline agotado fuera de los routers (p. ej. en un middleware)
+            if response_started or not is_deadline_error(exc):
+                raise
+            await JSONResponse({"detail": DEADLINE_DETAIL}, status_code=504)(scope, receive, send)
+
+
+# =============================================
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Equivalente a on.event("startup")
     logging.info("Iniciando la aplicación y conectando a servicios externos...")
-    connect_to_mongo()
+    loop_lag_task = asyncio.create_task(loop_lag_monitor.run())
+    await connect_to_mongo()
+    await ensure_indexes()
     await connect_to_rabbitmq_all()
-    await create_user_listeners(rabbit_clients)
-    await create_moderation_listeners(rabbit_clients)
+    # Cada listener usa su propio cliente (y sus canales): se inician en paralelo
+    await asyncio.gather(
+        create_user_listeners(rabbit_clients),
+        create_moderation_listeners(rabbit_clients),
+        create_cache_listeners(rabbit_clients),
+    )
+    # Después del listener, para no perder canales creados por otras réplicas durante la construcción
+    await rebuild_channel_filter()
+    outbox_relay_task = start_outbox_relay()
     yield
     # Equivalente a on.event("shutdown")
     logging.info("Cerrando conexiones a servicios externos...")
-    close_mongo_connection()
+    loop_lag_task.cancel()
+    if outbox_relay_task is not None:
+        # Se espera a que libere su lock antes de cerrar MongoDB
+        outbox_relay_task.cancel()
+        await asyncio.gather(outbox_relay_task, return_exceptions=True)
+    await close_mongo_connection()
     await close_rabbitmq_connection_all()
     logging.info("Aplicación detenida.")
 
@@ -41,6 +129,18 @@ app = FastAPI(
     description=descripcion_texto
 )
 
+app.add_middleware(AdmissionControlMiddleware)
+# Se agrega al final para quedar por fuera: la espera por un cupo también consume el deadline
+app.add_middleware(DeadlineMiddleware)
+
+@app.exception_handler(DeadlineExceeded)
+@app.exception_handler(PyMongoError)
+async def deadline_exception_handler(request: Request, exc: Exception):
+    """Responde 504 cuando una ruta deja escapar un deadline agotado (ver `is_deadline_error`)."""
+    if not is_deadline_error(exc):
+        raise exc
+    return JSONResponse({"detail": DEADLINE_DETAIL}, status_code=504)
+
 app.include_router(channels.router)
 app.include_router(members.router)
 
@@ -53,3 +153,16 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/status")
+async def status_check():
+    """Métricas internas de la réplica (caché y filtro de Bloom de canales, control de admisión, conexiones a RabbitMQ, publicaciones, outbox)."""
+    return {
+        "hostname": socket.gethostname(),
+        "cache": cache_stats(),
+        "bloom": bloom_stats(),
+        "admission": admission_stats(),
+        "rabbitmq": rabbitmq_stats(),
+        "publisher": publisher_stats(),
+        "outbox": await outbox_stats(),
+    }
@@ -1,5 +1,6 @@
-from mongoengine import Document, StringField, FloatField, BooleanField, ListField, EmbeddedDocument, EmbeddedDocumentField
-from ..schemas.channels import Channel
+from mongoengine import Document, StringField, FloatField, BooleanField, IntField, ListField, DictField, EmbeddedDocument, EmbeddedDocumentField
+from pydantic import TypeAdapter
+from ..schemas.channels import Channel, ChannelMember
 from ..schemas.responses import ChannelBasicInfoResponse
 from datetime import datetime
 
@@ -10,41 +11,74 @@ class ChannelMemberDocument(EmbeddedDocument):
     status = StringField(required=True, choices=["normal", "warning", "banned"], default="normal")
 
 class ChannelDocument(Document):
-    meta = {"collection": "channels", "index_background": True}
+    meta = {
+        "collection": "channels",
+        "index_background": True,
+        # Los índices se crean/verifican al iniciar (ver app/db/indexes.py), no en el primer uso
+        "auto_create_index": False,
+        "indexes": [
+            # db_get_all_channels_paginated: listado de activos ordenado por _id
+            {"fields": ["is_active", "id"], "name": "is_active_id"},
+            # db_get_channels_by_owner_id: canales activos de un propietario ordenados por _id
+            {"fields": ["owner_id", "is_active", "id"], "name": "owner_id_is_active_id"},
+            # db_get_pending_outbox: solo los canales con eventos pendientes, del más antiguo al más reciente,
+            # descartando en el índice los aplazados por un fallo (outbox_retry_at)
+            {"fields": ["outbox_since", "outbox_retry_at"], "name": "outbox_since_retry_at", "partialFilterExpression": {"outbox_since": {"$exists": True}}},
+            # db_get_stuck_outbox: canales cuyo primer evento no se ha podido publicar
+            {"fields": ["-outbox_attempts"], "name": "outbox_attempts", "partialFilterExpression": {"outbox_attempts": {"$exists": True}}},
+            # db_get_channels_by_member_id: canales aún no migrados en los que el usuario es miembro (arreglo legado `users`)
+            {"fields": ["users.id"], "name": "legacy_users_id", "partialFilterExpression": {"users": {"$exists": True}}},
+        ],
+    }
     owner_id = StringField(required=True)
     name = StringField(required=True)
-    users = ListField(EmbeddedDocumentField(ChannelMemberDocument), default=[])
+    # Legado: los miembros viven en la colección `channel_members` (ver MemberDocument).
+    # Solo existe en canales aún no migrados: el servicio migra cada canal la primera vez que lo toca
+    # (ver `db_migrate_legacy_members`) y `python -m app.db.maintenance migrate-members` migra el resto.
+    users = ListField(EmbeddedDocumentField(ChannelMemberDocument))
+    # Contador desnormalizado de miembros, mantenido con $inc en cada alta/baja de miembro
+    user_count = IntField(required=True, min_value=0, default=0)
     channel_type = StringField(required=True, choices=["public", "private"], default="public")
     is_active = BooleanField(required=True, default=True)
     created_at = FloatField(required=True)
     updated_at = FloatField(required=True)
     deleted_at = FloatField()
+    # Outbox: eventos por publicar, encolados junto con el cambio que los origina (ver events/outbox.py).
+    # `outbox_since` es el `created_at` del más antiguo y solo existe si hay pendientes. Va en el canal y no
+    # en una colección aparte para que sus cambios no necesiten transacción (ver docs/rabbit.md, sección 6).
+    outbox = ListField(DictField())
+    outbox_since = FloatField()
+    # Fallos al publicar el primer evento pendiente: intentos, próximo reintento y último error
+    outbox_attempts = IntField()
+    outbox_retry_at = FloatField()
+    outbox_error = StringField()
+
+def _raw_to_channel(raw: dict, members: list[ChannelMember] | None) -> Channel | None:
+    """Convierte un documento crudo de pymongo (dict) y sus miembros en un `Channel`.
 
-def _document_to_channel(document: ChannelDocument) -> Channel | None:
-    if not document:
+    Con `members=None` el canal se construye sin la lista de miembros.
+    """
+    if not raw:
         return None
     data = {
-        "_id": str(document.pk),
-        "owner_id": document.owner_id,
-        "name": document.name,
-        "users": [{"id": u.id, "joined_at": u.joined_at, "status": u.status} for u in document.users],
-        "channel_type": document.channel_type,
-        "is_active": document.is_active,
-        "created_at": document.created_at,
-        "updated_at": document.updated_at,
-        "deleted_at": document.deleted_at,
+        "_id": str(raw["_id"]),
+        "owner_id": raw["owner_id"],
+        "name": raw["name"],
+        "users": members,
+        "channel_type": raw["channel_type"],
+        "is_active": raw["is_active"],
+        "created_at": raw["created_at"],
+        "updated_at": raw["updated_at"],
+        "deleted_at": raw.get("deleted_at"),
     }
     return Channel.model_validate(data)
 
-def _document_to_channel_basic_info(document: ChannelDocument) -> ChannelBasicInfoResponse | None:
-    if not document:
-        return None
-    data = {
-        "id": str(document.pk),
-        "name": document.name,
-        "owner_id": document.owner_id,
-        "channel_type": document.channel_type,
-        "created_at": document.created_at,
-        "user_count": len(document.users)
-    }
-    return ChannelBasicInfoResponse.model_validate(data)
+_BASIC_INFO_LIST_ADAPTER = TypeAdapter(list[ChannelBasicInfoResponse])
+
+def _raw_to_basic_infos(raws: list[dict]) -> list[ChannelBasicInfoResponse]:
+    """Convierte documentos proyectados con `BASIC_INFO_PROJECTION` en `ChannelBasicInfoResponse`, validándolos en una sola llamada.
+
+    En `benchmarks/bench_hydration.py` (1000 documentos, mínimo de rondas alternadas) el lote tarda
+    ~1.6 ms frente a ~2.3 ms validando documento a documento.
+    """
+    return _BASIC_INFO_LIST_ADAPTER.validate_python(raws)
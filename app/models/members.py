@@ -0,0 +1,42 @@
+from mongoengine import Document, StringField, FloatField, ObjectIdField
+from pydantic import TypeAdapter
+from ..schemas.channels import ChannelMember
+
+
+class MemberDocument(Document):
+    """Membresía de un usuario en un canal (un documento por par canal/usuario)."""
+    meta = {
+        "collection": "channel_members",
+        "index_background": True,
+        "auto_create_index": False,
+        "indexes": [
+            # Alta/baja/consulta de un miembro y listado de miembros de un canal
+            {"fields": ["channel_id", "user_id"], "name": "channel_id_user_id", "unique": True},
+            # Listado de miembros de un canal filtrado por status
+            {"fields": ["channel_id", "status", "user_id"], "name": "channel_id_status_user_id"},
+            # Canales de un usuario
+            {"fields": ["user_id", "channel_id"], "name": "user_id_channel_id"},
+        ],
+    }
+    channel_id = ObjectIdField(required=True)
+    user_id = StringField(required=True)
+    joined_at = FloatField(required=True)
+    status = StringField(required=True, choices=["normal", "warning", "banned"], default="normal")
+
+def _raw_to_member(raw: dict) -> ChannelMember | None:
+    """Convierte un documento crudo de `channel_members` en un `ChannelMember`."""
+    if not raw:
+        return None
+    data = {
+        "id": raw["user_id"],
+        "joined_at": raw["joined_at"],
+        "status": raw["status"],
+    }
+    return ChannelMember.model_validate(data)
+
+# Valida una lista completa en una sola llamada al núcleo de pydantic (más rápido que un model_validate por miembro)
+_MEMBER_LIST_ADAPTER = TypeAdapter(list[ChannelMember])
+
+def _raw_to_members(raws: list[dict]) -> list[ChannelMember]:
+    """Convierte documentos de `channel_members` ya proyectados con `id` (ver `MEMBER_LIST_PROJECTION`) en `ChannelMember`."""
+    return _MEMBER_LIST_ADAPTER.validate_python(raws)
@@ -0,0 +1,49 @@
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Response, status
+
+
+def make_etag(channel_id: str, updated_at: float, variant: str = "") -> str:
+    """ETag fuerte de una representación de un canal.
+
+    `variant` distingue representaciones distintas del mismo canal (completo, básico, una página de miembros...).
+    """
+    digest = hashlib.sha1(f"{channel_id}:{updated_at!r}:{variant}".encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def validator_headers(channel_id: str, updated_at: float | None, variant: str = "") -> dict[str, str]:
+    """Cabeceras `ETag`/`Last-Modified` para la representación de un canal."""
+    if updated_at is None:
+        return {}
+    return {
+        "ETag": make_etag(channel_id, updated_at, variant),
+        "Last-Modified": formatdate(updated_at, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+
+
+def is_not_modified(headers: dict[str, str], if_none_match: str | None, if_modified_since: str | None) -> bool:
+    """Evalúa las precondiciones de un GET condicional contra las cabeceras de validación actuales.
+
+    `If-None-Match` tiene prioridad; `If-Modified-Since` solo se considera si no viene `If-None-Match`.
+    """
+    if not headers:
+        return False
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        etag = headers["ETag"]
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in candidates
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return parsedate_to_datetime(headers["Last-Modified"]).timestamp() <= since
+    return False
+
+
+def not_modified_response(headers: dict[str, str]) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
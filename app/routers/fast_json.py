@@ -0,0 +1,87 @@
+import logging
+import zlib
+from collections.abc import AsyncIterator
+from typing import Any, Optional
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic_core import to_json
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Bytes que se acumulan antes de enviar un fragmento del stream NDJSON
+NDJSON_CHUNK_SIZE = 64 * 1024
+
+
+class ModelJSONResponse(JSONResponse):
+    """Respuesta JSON para modelos pydantic ya construidos desde la base de datos.
+
+    Serializa el modelo (o lista de modelos) directamente a bytes con el serializador de
+    pydantic-core, usando los alias (`_id`). Al devolver una `Response`, FastAPI no vuelve a
+    validar el contenido contra `response_model` ni lo pasa por `jsonable_encoder`;
+    `response_model` se mantiene en los endpoints solo para la documentación OpenAPI.
+
+    `exclude` permite omitir campos de la respuesta (p. ej. `users` cuando no se cargaron los miembros).
+    """
+
+    def __init__(self, content: Any, *args, exclude: Optional[set[str]] = None, **kwargs):
+        self.exclude = exclude
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        return to_json(content, by_alias=True, exclude=self.exclude)
+
+
+def wants_ndjson(accept: str | None) -> bool:
+    """Indica si el cliente pidió explícitamente NDJSON en la cabecera `Accept`."""
+    return accept is not None and NDJSON_MEDIA_TYPE in accept
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    """Indica si el cliente acepta respuestas comprimidas con gzip (cabecera `Accept-Encoding`)."""
+    if accept_encoding is None:
+        return False
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+async def _ndjson_chunks(items: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+    buffer = bytearray()
+    try:
+        async for item in items:
+            buffer += to_json(item, by_alias=True)
+            buffer += b"\n"
+            if len(buffer) >= NDJSON_CHUNK_SIZE:
+                yield bytes(buffer)
+                buffer.clear()
+    except Exception:
+        # El estado 200 ya se envió: se corta la conexión para que el cliente no tome el stream como completo
+        logger.exception("Error al generar respuesta NDJSON")
+        raise
+    if buffer:
+        yield bytes(buffer)
+
+
+async def _gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def ndjson_response(items: AsyncIterator[Any], headers: Optional[dict[str, str]] = None, gzip: bool = False) -> StreamingResponse:
+    """Respuesta NDJSON (un modelo o dict JSON por línea) que consume `items` a medida que se envía.
+
+    Las líneas se agrupan en fragmentos de hasta `NDJSON_CHUNK_SIZE` bytes, así la memoria usada
+    no depende del tamaño total del resultado. Con `gzip=True` los fragmentos se comprimen al vuelo.
+    """
+    body = _ndjson_chunks(items)
+    if gzip:
+        body = _gzip_chunks(body)
+        headers = {**(headers or {}), "Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+    return StreamingResponse(body, media_type=NDJSON_MEDIA_TYPE, headers=headers)
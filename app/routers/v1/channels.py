@@ -1,12 +1,16 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Header, HTTPException, Query, status
 from bson.errors import InvalidId
 from mongoengine.errors import ValidationError
 import logging
-from ...schemas.channels import Channel
-from ...schemas.payloads import ChannelCreatePayload, ChannelUpdatePayload
-from ...schemas.responses import ChannelIDResponse, ChannelBasicInfoResponse, ChannelStatusResponse
+from ...schemas.channels import Channel, ChannelType, MemberStatus
+from ...schemas.payloads import ChannelCreatePayload, ChannelUpdatePayload, ChannelBatchPayload
+from ...schemas.responses import ChannelIDResponse, ChannelBasicInfoResponse, ChannelStatusResponse, ChannelBatchItem
 from ...schemas.http_responses import ErrorResponse
-from ...events.publish import PublishError
+from ...deadline import is_deadline_error
+from ...db.querys import OutboxFullError, OUTBOX_FULL_RETRY_AFTER
+from ...db.pagination import InvalidCursorError, encode_cursor
+from ..fast_json import ModelJSONResponse, ndjson_response, accepts_gzip
+from ..conditional import validator_headers, is_not_modified, not_modified_response
 from ...controllers import channels as channel_controller
 
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +20,8 @@ ROUTER_ERROR_RESPONSES = {
     404: {"model": ErrorResponse, "description": "Recurso no encontrado."},
     422: {"model": ErrorResponse, "description": "Entidad no procesable – datos o ID inválidos."},
     500: {"model": ErrorResponse, "description": "Error interno del servidor."},
+    503: {"model": ErrorResponse, "description": "El canal tiene demasiados eventos sin publicar; reintentar tras Retry-After."},
+    504: {"model": ErrorResponse, "description": "Se agotó el tiempo límite de la petición."},
 }
 
 router = APIRouter(prefix="/v1/channels", tags=["channels"], responses=ROUTER_ERROR_RESPONSES)
@@ -27,16 +33,29 @@ async def add_channel(channel_data_payload: ChannelCreatePayload):
         channel = await channel_controller.create_channel(channel_data_payload)
         if channel is None:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error al crear el canal.")
-        return channel
-    except PublishError as e:
-        logger.error(f"Error de publicación en RabbitMQ: {str(e)}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error de publicación en RabbitMQ.")
+        return ModelJSONResponse(channel, status_code=status.HTTP_201_CREATED)
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error al crear el canal: {str(e)}")
 
-@router.get("/", response_model=list[ChannelBasicInfoResponse])
-async def list_channels(page: int = 1, page_size: int = 10):
-    """Obtiene una lista paginada de información básica de todos los canales."""
+@router.get(
+    "/",
+    response_model=list[ChannelBasicInfoResponse],
+    responses={
+        200: {
+            "headers": {
+                "X-Next-Cursor": {"description": "Cursor para obtener la página siguiente. Ausente si no hay más resultados.", "schema": {"type": "string"}}
+            }
+        }
+    }
+)
+async def list_channels(page: int = 1, page_size: int = 10, cursor: str | None = None):
+    """Obtiene una lista paginada de información básica de todos los canales.
+
+    Si se entrega `cursor` (valor de la cabecera `X-Next-Cursor` de una respuesta anterior) se usa
+    paginación por keyset y se ignora `page`.
+    """
     page_size_limit = 100
     
     try:
@@ -45,45 +64,157 @@ async def list_channels(page: int = 1, page_size: int = 10):
         if page < 1 or page_size < 1:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail="Los parámetros de paginación deben ser mayores a 0.")
         
-        return channel_controller.list_channels(page, page_size)
+        if cursor is not None:
+            channels, next_cursor = await channel_controller.list_channels_after(cursor, page_size)
+        else:
+            channels = await channel_controller.list_channels(page, page_size)
+            next_cursor = encode_cursor(channels[-1].id) if len(channels) == page_size else None
+
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return ModelJSONResponse(channels, headers=headers)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         logger.exception("Error interno al listar canales")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error interno del servidor: {str(e)}")
 
-@router.get("/{channel_id}", response_model=Channel)
-async def read_channel(channel_id: str):
-    """Obtiene un canal existente por su ID."""
+EXPORT_RESPONSES = {
+    200: {
+        "content": {"application/x-ndjson": {"schema": {"type": "string"}}},
+        "description": "Un objeto JSON por línea. Comprimido con gzip si el cliente envía `Accept-Encoding: gzip`."
+    }
+}
+
+def _validate_export_batch_size(batch_size: int, batch_size_limit: int = 5000):
+    if batch_size < 1 or batch_size > batch_size_limit:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"El tamaño de lote debe estar entre 1 y {batch_size_limit}.")
+
+# Las rutas de exportación se declaran antes de /{channel_id} para que "export" no se tome como un ID
+@router.get("/export", responses=EXPORT_RESPONSES)
+async def export_channels(
+    active: bool | None = None,
+    channel_type: ChannelType | None = None,
+    updated_since: float | None = None,
+    batch_size: int = 1000,
+    accept_encoding: str | None = Header(None)
+):
+    """Exporta en streaming (NDJSON) todos los canales que cumplen los filtros, ordenados por ID.
+
+    La memoria usada no depende del tamaño de la colección: el cursor se lee en lotes de `batch_size`.
+    """
+    _validate_export_batch_size(batch_size)
+    channels = channel_controller.export_channels(
+        is_active=active,
+        channel_type=channel_type.value if channel_type else None,
+        updated_since=updated_since,
+        batch_size=batch_size
+    )
+    return ndjson_response(channels, gzip=accepts_gzip(accept_encoding))
+
+@router.get("/export/members", responses=EXPORT_RESPONSES)
+async def export_members(
+    member_status: MemberStatus | None = Query(None, alias="status"),
+    batch_size: int = 1000,
+    accept_encoding: str | None = Header(None)
+):
+    """Exporta en streaming (NDJSON) todas las membresías, ordenadas por canal y usuario."""
+    _validate_export_batch_size(batch_size)
+    members = channel_controller.export_members(
+        status=member_status.value if member_status else None,
+        batch_size=batch_size
+    )
+    return ndjson_response(members, gzip=accepts_gzip(accept_encoding))
+
+@router.post("/batch", response_model=dict[str, ChannelBatchItem])
+async def read_channels_batch(batch_payload: ChannelBatchPayload):
+    """Obtiene la información básica y el estado de varios canales en una sola petición.
+
+    Devuelve un mapa ID -> resultado que incluye también los IDs no encontrados (`found=false`).
+    """
+    batch_size_limit = 100
+
+    try:
+        if not batch_payload.ids:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail="Debe indicar al menos un ID de canal.")
+        if len(batch_payload.ids) > batch_size_limit:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"No se pueden consultar más de {batch_size_limit} canales por petición.")
+
+        channels = await channel_controller.get_channels_batch(list(dict.fromkeys(batch_payload.ids)))
+        return ModelJSONResponse(channels)
+    except HTTPException:
+        raise
+    except Exception as e:
+        if is_deadline_error(e):
+            raise
+        logger.exception("Error interno al obtener canales por lote")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error interno del servidor: {str(e)}")
+
+@router.get("/{channel_id}", response_model=Channel, responses={304: {"description": "El canal no ha cambiado (ETag/Last-Modified)."}})
+async def read_channel(
+    channel_id: str,
+    include_members: bool = True,
+    if_none_match: str | None = Header(None),
+    if_modified_since: str | None = Header(None)
+):
+    """Obtiene un canal existente por su ID. Con `include_members=false` se omite `users` (solo metadatos).
+
+    Soporta GET condicional con `If-None-Match`/`If-Modified-Since`.
+    """
+    variant = "channel" if include_members else "channel:metadata"
     try:
-        channel = channel_controller.get_channel(channel_id)
+        if if_none_match is not None or if_modified_since is not None:
+            updated_at = await channel_controller.get_channel_version(channel_id)
+            headers = validator_headers(channel_id, updated_at, variant)
+            if is_not_modified(headers, if_none_match, if_modified_since):
+                return not_modified_response(headers)
+
+        channel = await channel_controller.get_channel(channel_id, include_members=include_members)
         if channel is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canal no encontrado.")
-        return channel
+        return ModelJSONResponse(
+            channel,
+            headers=validator_headers(channel_id, channel.updated_at, variant),
+            exclude=None if include_members else {"users"}
+        )
     except (InvalidId, ValidationError) as exc:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"ID de canal inválido: {exc}") from exc
     except HTTPException:
         raise
     except Exception as exc:
+        if is_deadline_error(exc):
+            raise
         logger.exception("Error interno al obtener canal")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error interno del servidor") from exc
 
-@router.put("/{channel_id}", response_model=Channel)
+@router.put(
+    "/{channel_id}",
+    response_model=Channel,
+    responses={
+        409: {"model": ErrorResponse, "description": "Conflict: el nuevo owner_id no es miembro del canal."}
+    }
+)
 async def modify_channel(channel_id: str, channel_update_payload: ChannelUpdatePayload):
     """Actualiza un canal existente en MongoDB."""
     try:
         channel = await channel_controller.update_channel(channel_id, channel_update_payload)
         if channel is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canal no encontrado o sin datos para actualizar.")
-        return channel
+        return ModelJSONResponse(channel)
+    except channel_controller.OwnerNotMemberError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except (InvalidId, ValidationError) as e:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"ID de canal inválido: {str(e)}")
     except HTTPException:
         raise
-    except PublishError as e:
-        logger.error(f"Error de publicación en RabbitMQ: {str(e)}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error de publicación en RabbitMQ.")
+    except OutboxFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": str(OUTBOX_FULL_RETRY_AFTER)})
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error al actualizar el canal: {str(e)}")
 
 
@@ -103,17 +234,18 @@ async def remove_channel(channel_id: str):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canal no encontrado.")
         
         if channel_after is None:
-            return ChannelStatusResponse(id=channel_id, is_active=False)
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="El canal ya está desactivado.")
         
         return ChannelStatusResponse(id=channel_id, is_active=False)
     except (InvalidId, ValidationError) as e:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"ID de canal inválido: {str(e)}")
     except HTTPException:
         raise
-    except PublishError as e:
-        logger.error(f"Error de publicación en RabbitMQ: {str(e)}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error de publicación en RabbitMQ.")
+    except OutboxFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": str(OUTBOX_FULL_RETRY_AFTER)})
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error al desactivar el canal: {str(e)}")
 
 @router.post(
@@ -132,39 +264,48 @@ async def reactivate_channel(channel_id: str):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canal no encontrado.")
         
         if was_already_active:
-            return ChannelStatusResponse(id=channel.id, is_active=True)
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="El canal ya está activo.")
 
         return ChannelStatusResponse(id=channel.id, is_active=True)
     except (InvalidId, ValidationError) as e:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"ID de canal inválido: {str(e)}")
     except HTTPException:
         raise
-    except PublishError as e:
-        logger.error(f"Error de publicación en RabbitMQ: {str(e)}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error de publicación en RabbitMQ.")
+    except OutboxFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": str(OUTBOX_FULL_RETRY_AFTER)})
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error al reactivar el canal: {str(e)}")
 
-@router.get("/{channel_id}/basic", response_model=ChannelBasicInfoResponse)
-async def read_channel_basic_info(channel_id: str):
-    """Obtiene información básica de un canal específico desde MongoDB."""
+@router.get("/{channel_id}/basic", response_model=ChannelBasicInfoResponse, responses={304: {"description": "El canal no ha cambiado (ETag/Last-Modified)."}})
+async def read_channel_basic_info(channel_id: str, if_none_match: str | None = Header(None), if_modified_since: str | None = Header(None)):
+    """Obtiene información básica de un canal específico desde MongoDB. Soporta GET condicional."""
     try:
-        channel = channel_controller.get_channel_basic_info(channel_id)
+        if if_none_match is not None or if_modified_since is not None:
+            updated_at = await channel_controller.get_channel_version(channel_id)
+            headers = validator_headers(channel_id, updated_at, "basic")
+            if is_not_modified(headers, if_none_match, if_modified_since):
+                return not_modified_response(headers)
+
+        channel = await channel_controller.get_channel_basic_info(channel_id)
         if channel is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canal no encontrado.")
-        return channel
+        return ModelJSONResponse(channel, headers=validator_headers(channel_id, channel.updated_at, "basic"))
     except (InvalidId, ValidationError) as e:   
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"ID de canal inválido: {str(e)}")
     except HTTPException:
         raise
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error interno del servidor: {str(e)}")
 
 @router.get("/{channel_id}/status", response_model=ChannelStatusResponse)
 async def check_channel_status(channel_id: str):
     """Verifica si un canal está activo en MongoDB."""
     try:
-        is_active = channel_controller.is_channel_active(channel_id)
+        is_active = await channel_controller.is_channel_active(channel_id)
         if is_active is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canal no encontrado.")
         return ChannelStatusResponse(id=channel_id, is_active=is_active)
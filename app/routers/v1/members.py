@@ -1,13 +1,17 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Header, HTTPException, Query, status
 from bson.errors import InvalidId
 from mongoengine.errors import ValidationError
 import logging
-from ...schemas.channels import Channel, ChannelMember
+from ...schemas.channels import Channel, ChannelMember, MemberStatus
 from ...schemas.payloads import ChannelUserPayload
-from ...schemas.responses import ChannelBasicInfoResponse
+from ...schemas.responses import ChannelBasicInfoResponse, MembershipChangeResponse
 from ...schemas.http_responses import ErrorResponse
-from ...events.publish import PublishError
+from ...deadline import is_deadline_error
+from ...db.querys import OutboxFullError, OUTBOX_FULL_RETRY_AFTER
+from ...db.pagination import InvalidCursorError, encode_key_cursor
 from ...controllers import members as members_controller
+from ..fast_json import ModelJSONResponse, ndjson_response, wants_ndjson
+from ..conditional import validator_headers, is_not_modified, not_modified_response
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,101 +19,236 @@ logger = logging.getLogger(__name__)
 ROUTER_ERROR_RESPONSES = {
     422: {"model": ErrorResponse, "description": "Entidad no procesable – datos o ID inválidos."},
     500: {"model": ErrorResponse, "description": "Error interno del servidor."},
+    503: {"model": ErrorResponse, "description": "El canal tiene demasiados eventos sin publicar; reintentar tras Retry-After."},
+    504: {"model": ErrorResponse, "description": "Se agotó el tiempo límite de la petición."},
 }
 
 router = APIRouter(prefix="/v1/members", tags=["members"], responses=ROUTER_ERROR_RESPONSES)
 
+# Respuestas documentadas de los listados de canales paginados por cursor
+CHANNEL_LIST_RESPONSES = {
+    200: {
+        "headers": {
+            "X-Next-Cursor": {"description": "Cursor para obtener la página siguiente. Ausente si no hay más resultados.", "schema": {"type": "string"}}
+        },
+        "content": {"application/x-ndjson": {"schema": {"type": "string"}}},
+        "description": "Página de canales (JSON) o todos los canales, uno por línea (`Accept: application/x-ndjson`)."
+    }
+}
+
+def _prefers_minimal(prefer: str | None) -> bool:
+    """Indica si la cabecera `Prefer` (RFC 7240) pide `return=minimal`."""
+    if prefer is None:
+        return False
+    return any(token.strip().replace(" ", "").lower() == "return=minimal" for token in prefer.split(","))
+
+def _validate_page_size(page_size: int, page_size_limit: int = 100):
+    if page_size > page_size_limit:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"El tamaño de página no puede exceder {page_size_limit}.")
+    if page_size < 1:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail="Los parámetros de paginación deben ser mayores a 0.")
+
 @router.post(
     "/",
-    response_model=Channel,
+    # `MembershipChangeResponse` con `Prefer: return=minimal`
+    response_model=Channel | MembershipChangeResponse,
     responses={
         404: {"model": ErrorResponse, "description": "Recurso no encontrado."}
     }
 )
-async def add_user_to_channel(payload: ChannelUserPayload):
-    """Agrega un usuario a un canal existente en MongoDB."""
+async def add_user_to_channel(payload: ChannelUserPayload, prefer: str | None = Header(None)):
+    """Agrega un usuario a un canal existente en MongoDB.
+
+    Con `Prefer: return=minimal` devuelve solo el miembro agregado y el nuevo conteo de miembros.
+    """
     try:
+        if _prefers_minimal(prefer):
+            change = await members_controller.add_user_to_channel_minimal(payload)
+            if change is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canal no encontrado o usuario ya en el canal.")
+            return ModelJSONResponse(change, headers={"Preference-Applied": "return=minimal"})
+
         channel = await members_controller.add_user_to_channel(payload)
         if channel is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canal no encontrado o usuario ya en el canal.")
-        return channel
+        return ModelJSONResponse(channel)
     except (InvalidId, ValidationError) as e:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"ID inválido: {str(e)}")
     except HTTPException:
         raise
-    except PublishError as e:
-        logger.error(f"Error de publicación en RabbitMQ: {str(e)}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error de publicación en RabbitMQ.")
+    except OutboxFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": str(OUTBOX_FULL_RETRY_AFTER)})
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error al agregar usuario al canal: {str(e)}")
     
 @router.delete(
     "/",
-    response_model=Channel,
+    # `MembershipChangeResponse` con `Prefer: return=minimal`
+    response_model=Channel | MembershipChangeResponse,
     responses={
         404: {"model": ErrorResponse, "description": "Recurso no encontrado."}
     }
 )
-async def remove_user_from_channel(payload: ChannelUserPayload):
-    """Elimina un usuario de un canal existente en MongoDB."""
+async def remove_user_from_channel(payload: ChannelUserPayload, prefer: str | None = Header(None)):
+    """Elimina un usuario de un canal existente en MongoDB.
+
+    Con `Prefer: return=minimal` devuelve solo el miembro eliminado y el nuevo conteo de miembros.
+    """
     try:
+        if _prefers_minimal(prefer):
+            change = await members_controller.remove_user_from_channel_minimal(payload)
+            if change is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canal no encontrado, el usuario no está en el canal o es el propietario.")
+            return ModelJSONResponse(change, headers={"Preference-Applied": "return=minimal"})
+
         channel = await members_controller.remove_user_from_channel(payload)
         if channel is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canal no encontrado, el usuario no está en el canal o es el propietario.")
-        return channel
+        return ModelJSONResponse(channel)
     except (InvalidId, ValidationError) as e:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"ID inválido: {str(e)}")
     except HTTPException:
         raise
-    except PublishError as e:
-        logger.error(f"Error de publicación en RabbitMQ: {str(e)}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error de publicación en RabbitMQ.")
+    except OutboxFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": str(OUTBOX_FULL_RETRY_AFTER)})
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error al eliminar usuario del canal: {str(e)}")
 
-@router.get("/{user_id}", response_model=list[ChannelBasicInfoResponse])
-async def read_channels_by_member(user_id: str):
-    """Obtiene todos los canales en los que un usuario es miembro desde MongoDB."""
+@router.get("/{user_id}", response_model=list[ChannelBasicInfoResponse], responses=CHANNEL_LIST_RESPONSES)
+async def read_channels_by_member(user_id: str, cursor: str | None = None, page_size: int = 100, accept: str | None = Header(None)):
+    """Obtiene los canales en los que un usuario es miembro, paginados por cursor (`X-Next-Cursor`).
+
+    Con `Accept: application/x-ndjson` devuelve en streaming todos los canales (desde `cursor`, si se indica).
+    """
     try:
-        return members_controller.get_channels_by_member(user_id)
+        if wants_ndjson(accept):
+            return ndjson_response(members_controller.stream_channels_by_member(user_id, cursor))
+
+        _validate_page_size(page_size)
+        channels, next_cursor = await members_controller.get_channels_by_member(user_id, cursor, page_size)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return ModelJSONResponse(channels, headers=headers)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e))
     except (InvalidId, ValidationError) as e:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"ID de usuario inválido: {str(e)}")
+    except HTTPException:
+        raise
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error interno del servidor: {str(e)}")
 
-@router.get("/owner/{owner_id}", response_model=list[ChannelBasicInfoResponse])
-async def read_channels_by_owner(owner_id: str):
-    """Obtiene todos los canales asociados a un propietario específico desde MongoDB."""
+@router.get("/owner/{owner_id}", response_model=list[ChannelBasicInfoResponse], responses=CHANNEL_LIST_RESPONSES)
+async def read_channels_by_owner(owner_id: str, cursor: str | None = None, page_size: int = 100, accept: str | None = Header(None)):
+    """Obtiene los canales de un propietario, paginados por cursor (`X-Next-Cursor`).
+
+    Con `Accept: application/x-ndjson` devuelve en streaming todos los canales (desde `cursor`, si se indica).
+    """
     try:
-        return members_controller.get_channels_by_owner(owner_id)
+        if wants_ndjson(accept):
+            return ndjson_response(members_controller.stream_channels_by_owner(owner_id, cursor))
+
+        _validate_page_size(page_size)
+        channels, next_cursor = await members_controller.get_channels_by_owner(owner_id, cursor, page_size)
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+        return ModelJSONResponse(channels, headers=headers)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e))
     except (InvalidId, ValidationError):
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail="ID de servidor inválido.")
+    except HTTPException:
+        raise
     except Exception as e:
+        if is_deadline_error(e):
+            raise
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error interno del servidor: {str(e)}")
 
 @router.get(
     "/channel/{channel_id}",
     response_model=list[ChannelMember],
     responses={
+        200: {
+            "headers": {
+                "X-Next-Cursor": {"description": "Cursor para obtener la página siguiente. Ausente si no hay más resultados.", "schema": {"type": "string"}}
+            }
+        },
+        304: {"description": "Los miembros del canal no han cambiado (ETag/Last-Modified)."},
         404: {"model": ErrorResponse, "description": "Recurso no encontrado."}
     }
 )
-async def read_channel_member_ids(channel_id: str, page: int = 1, page_size: int = 100):
-    """Obtiene los IDs de los miembros de un canal específico desde MongoDB."""
+async def read_channel_member_ids(
+    channel_id: str,
+    page: int = 1,
+    page_size: int = 100,
+    cursor: str | None = None,
+    member_status: MemberStatus | None = Query(None, alias="status"),
+    if_none_match: str | None = Header(None),
+    if_modified_since: str | None = Header(None)
+):
+    """Obtiene los miembros de un canal específico desde MongoDB, ordenados por ID y opcionalmente filtrados por `status`.
+
+    Si se entrega `cursor` (valor de la cabecera `X-Next-Cursor` de una respuesta anterior) se usa
+    paginación por keyset y se ignora `page`. Soporta GET condicional.
+    """
     page_size_limit = 100
+    status_filter = member_status.value if member_status else None
     try:
         if page_size > page_size_limit:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"El tamaño de página no puede exceder {page_size_limit}.")
         if page < 1 or page_size < 1:
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail="Los parámetros de paginación deben ser mayores a 0.")
         
-        member_ids = members_controller.get_channel_member_ids(channel_id, page, page_size)
+        if cursor is not None:
+            member_ids, next_cursor, updated_at = await members_controller.get_channel_members_after(channel_id, cursor, page_size, status=status_filter)
+        else:
+            member_ids, updated_at = await members_controller.get_channel_member_ids(channel_id, page, page_size, status=status_filter)
+            next_cursor = encode_key_cursor(member_ids[-1].id) if member_ids and len(member_ids) == page_size else None
         if member_ids is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canal no encontrado.")
-        return member_ids
+
+        # La versión del canal llega en la misma agregación que la página: el GET condicional no suma lecturas
+        position = f"after:{cursor}" if cursor is not None else f"page:{page}"
+        headers = validator_headers(channel_id, updated_at, f"members:{position}:{page_size}:{status_filter}")
+        if is_not_modified(headers, if_none_match, if_modified_since):
+            return not_modified_response(headers)
+        if next_cursor:
+            headers = {**headers, "X-Next-Cursor": next_cursor}
+        return ModelJSONResponse(member_ids, headers=headers)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e))
     except (InvalidId, ValidationError) as e:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=f"ID de canal inválido: {str(e)}")
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error interno del servidor: {str(e)}")
\ No newline at end of file
+        if is_deadline_error(e):
+            raise
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error interno del servidor: {str(e)}")
+
+@router.get(
+    "/channel/{channel_id}/{user_id}",
+    response_model=ChannelMember,
+    responses={
+        404: {"model": ErrorResponse, "description": "Canal no encontrado o el usuario no es miembro."}
+    }
+)
+async def read_channel_member(channel_id: str, user_id: str):
+    """Verifica si un usuario es miembro de un canal activo y devuelve su membresía (incluye `status`)."""
+    try:
+        channel_active, member = await members_controller.get_channel_member(channel_id, user_id)
+        if not channel_active:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Canal no encontrado.")
+        if member is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="El usuario no es miembro del canal.")
+        return ModelJSONResponse(member)
+    except HTTPException:
+        raise
+    except Exception as e:
+        if is_deadline_error(e):
+            raise
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error interno del servidor: {str(e)}")
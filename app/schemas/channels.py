@@ -21,7 +21,8 @@ class Channel(BaseModel):
     id: Optional[str] = Field(None, alias="_id")
     name: str
     owner_id: str
-    users: list[ChannelMember]
+    # None cuando la lectura se hizo sin miembros (include_members=false)
+    users: Optional[list[ChannelMember]] = None
     is_active: bool = True
     channel_type: ChannelType = ChannelType.PUBLIC
     created_at: float
@@ -46,3 +46,15 @@ class ChannelUserPayload(BaseModel):
             }
         }
     )
+
+
+class ChannelBatchPayload(BaseModel):
+    ids: list[str]
+
+    model_config = ConfigDict(
+        json_schema_extra = {
+            "example": {
+                "ids": ["60f7c0c2b4d1c8b4f8e4d2a1", "60f7c0c2b4d1c8b4f8e4d2a2"]
+            }
+        }
+    )
@@ -2,7 +2,7 @@ from pydantic import BaseModel, Field, ConfigDict
 from typing import Optional
 from enum import Enum
 from datetime import datetime
-from .channels import ChannelType
+from .channels import ChannelType, ChannelMember
 
 class ChannelIDResponse(BaseModel):
     id: str
@@ -21,6 +21,7 @@ class ChannelBasicInfoResponse(BaseModel):
     owner_id: str
     channel_type: ChannelType
     created_at: float
+    updated_at: Optional[float] = None
     user_count: int
 
     model_config = ConfigDict(
@@ -31,6 +32,7 @@ class ChannelBasicInfoResponse(BaseModel):
                 "owner_id": "owner123",
                 "channel_type": "public",
                 "created_at": 1760833769.259725,
+                "updated_at": 1760833769.259725,
                 "user_count": 5
             }
         }
@@ -47,4 +49,44 @@ class ChannelStatusResponse(BaseModel):
                 "is_active": True
             }
         }
-    )
\ No newline at end of file
+    )
+
+class ChannelBatchItem(BaseModel):
+    found: bool
+    is_active: Optional[bool] = None
+    channel: Optional[ChannelBasicInfoResponse] = None
+
+    model_config = ConfigDict(
+        json_schema_extra = {
+            "example": {
+                "found": True,
+                "is_active": True,
+                "channel": {
+                    "id": "60f7c0c2b4d1c8b4f8e4d2a1",
+                    "name": "general",
+                    "owner_id": "owner123",
+                    "channel_type": "public",
+                    "created_at": 1760833769.259725,
+                    "updated_at": 1760833769.259725,
+                    "user_count": 5
+                }
+            }
+        }
+    )
+
+class MembershipChangeResponse(BaseModel):
+    channel_id: str
+    member: ChannelMember
+    user_count: int
+    updated_at: float
+
+    model_config = ConfigDict(
+        json_schema_extra = {
+            "example": {
+                "channel_id": "60f7c0c2b4d1c8b4f8e4d2a1",
+                "member": {"id": "user123", "joined_at": 1760833769.259725, "status": "normal"},
+                "user_count": 6,
+                "updated_at": 1760833769.259725
+            }
+        }
+    )
@@ -0,0 +1,68 @@
+"""Benchmark de throughput concurrente de la API por worker.
+
+Lanza ráfagas de peticiones concurrentes contra un servicio en ejecución y reporta
+peticiones por segundo y latencias para cada nivel de concurrencia. Con la capa de datos
+asíncrona, el throughput de un solo worker de uvicorn debe crecer con la concurrencia
+(hasta saturar MongoDB) en lugar de quedarse plano.
+
+Uso:
+    uvicorn app.main:app --workers 1
+    python -m benchmarks.bench_concurrency --url http://localhost:8000 --channel-id <id>
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def _worker(client: httpx.AsyncClient, path: str, deadline: float, latencies: list[float], errors: list[int]):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError:
+            errors.append(0)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_level(url: str, path: str, concurrency: int, duration: float) -> dict:
+    """Ejecuta `concurrency` clientes durante `duration` segundos y devuelve las métricas."""
+    latencies: list[float] = []
+    errors: list[int] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(_worker(client, path, deadline, latencies, errors) for _ in range(concurrency)))
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / duration,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--channel-id", required=True, help="ID de un canal existente para leer.")
+    parser.add_argument("--levels", default="1,2,4,8,16,32,64", help="Niveles de concurrencia separados por coma.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Segundos por nivel.")
+    args = parser.parse_args()
+
+    path = f"/v1/channels/{args.channel_id}"
+    print(f"{'concurrencia':>12} {'peticiones':>10} {'errores':>8} {'req/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for level in (int(x) for x in args.levels.split(",")):
+        r = await run_level(args.url, path, level, args.duration)
+        print(f"{r['concurrency']:>12} {r['requests']:>10} {r['errors']:>8} {r['rps']:>10.1f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,164 @@
+"""Microbenchmark de construcción de modelos de respuesta a partir de documentos de MongoDB.
+
+Compara, para canales con distinta cantidad de miembros y para listas de información básica:
+- "mongoengine": hidratar un `ChannelDocument` (con un `ChannelMemberDocument` por miembro),
+  copiarlo a dicts y validarlo con `Channel.model_validate` (el camino original).
+- "validate": dicts crudos de pymongo, un `model_validate` por documento.
+- "construct": dicts crudos de pymongo con `model_construct` (sin validación, pero en Python puro).
+- "batch": el camino que usa `querys.py`: documentos que MongoDB ya entrega con la forma del modelo
+  (`MEMBER_LIST_PROJECTION` / `BASIC_INFO_PROJECTION`) validados en una sola llamada por lista
+  (`_raw_to_members` / `_raw_to_basic_infos`).
+
+Reporta el tiempo por construcción (el mínimo entre varias rondas en que los caminos se alternan) y
+las asignaciones de memoria (pico y bloques) medidas con `tracemalloc`. No requiere MongoDB.
+
+Uso:
+    python -m benchmarks.bench_hydration [--members 10,1000,50000] [--repeat 20] [--rounds 10]
+"""
+import argparse
+import time
+import tracemalloc
+
+from bson import ObjectId
+
+from app.models.channels import ChannelDocument, _raw_to_channel, _raw_to_basic_infos
+from app.models.members import _raw_to_members
+from app.schemas.channels import Channel, ChannelMember, ChannelType, MemberStatus
+from app.schemas.responses import ChannelBasicInfoResponse
+
+
+def make_raw_channel(member_count: int) -> tuple[dict, list[dict]]:
+    """Documento de canal y sus miembros tal como los entrega pymongo con `MEMBER_LIST_PROJECTION`."""
+    now = time.time()
+    channel_id = ObjectId()
+    channel = {
+        "_id": channel_id, "name": "general", "owner_id": "owner123", "channel_type": "public",
+        "is_active": True, "user_count": member_count, "created_at": now, "updated_at": now,
+    }
+    members = [
+        {"id": f"user-{i}", "joined_at": now, "status": "normal"}
+        for i in range(member_count)
+    ]
+    return channel, members
+
+
+def make_raw_basic_infos(count: int) -> list[dict]:
+    now = time.time()
+    return [
+        {"id": f"{i:024x}", "name": f"canal-{i}", "owner_id": "owner123", "channel_type": "public",
+         "created_at": now, "updated_at": now, "user_count": i}
+        for i in range(count)
+    ]
+
+
+def channel_mongoengine(channel: dict, members: list[dict]) -> Channel:
+    son = {**channel, "users": members}
+    document = ChannelDocument._from_son(son)
+    data = {
+        "_id": str(document.id), "name": document.name, "owner_id": document.owner_id,
+        "users": [{"id": u.id, "joined_at": u.joined_at, "status": u.status} for u in document.users],
+        "channel_type": document.channel_type, "is_active": document.is_active,
+        "created_at": document.created_at, "updated_at": document.updated_at, "deleted_at": document.deleted_at,
+    }
+    return Channel.model_validate(data)
+
+
+def channel_validate(channel: dict, members: list[dict]) -> Channel:
+    users = [ChannelMember.model_validate(m) for m in members]
+    return _raw_to_channel(channel, users)
+
+
+def channel_construct(channel: dict, members: list[dict]) -> Channel:
+    users = [ChannelMember.model_construct(id=m["id"], joined_at=m["joined_at"], status=MemberStatus(m["status"])) for m in members]
+    return Channel.model_construct(
+        id=str(channel["_id"]), name=channel["name"], owner_id=channel["owner_id"], users=users,
+        is_active=channel["is_active"], channel_type=ChannelType(channel["channel_type"]),
+        created_at=channel["created_at"], updated_at=channel["updated_at"], deleted_at=channel.get("deleted_at"),
+    )
+
+
+def channel_batch(channel: dict, members: list[dict]) -> Channel:
+    return _raw_to_channel(channel, _raw_to_members(members))
+
+
+def basic_validate(docs: list[dict]) -> list[ChannelBasicInfoResponse]:
+    return [ChannelBasicInfoResponse.model_validate(doc) for doc in docs]
+
+
+def basic_construct(docs: list[dict]) -> list[ChannelBasicInfoResponse]:
+    return [
+        ChannelBasicInfoResponse.model_construct(**{**doc, "channel_type": ChannelType(doc["channel_type"])})
+        for doc in docs
+    ]
+
+
+def basic_batch(docs: list[dict]) -> list[ChannelBasicInfoResponse]:
+    return _raw_to_basic_infos(docs)
+
+
+def time_call(func, args: tuple, repeat: int) -> float:
+    """ms por llamada en una ronda de `repeat` llamadas."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def measure_memory(func, args: tuple) -> tuple[float, int]:
+    """Devuelve (KiB de pico, bloques asignados y retenidos por el resultado)."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = func(*args)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    del result
+    return peak / 1024, blocks
+
+
+def measure_case(paths: list, args: tuple, repeat: int, rounds: int) -> dict[str, float]:
+    """ms por llamada de cada camino: el mínimo entre `rounds` rondas.
+
+    Los caminos se alternan en cada ronda, así el orden de ejecución y el ruido de la máquina (GC,
+    frecuencia de CPU) no favorecen al que corre primero; el mínimo es la medición menos perturbada.
+    """
+    for _, func in paths:
+        func(*args)
+    best = {name: float("inf") for name, _ in paths}
+    for _ in range(rounds):
+        for name, func in paths:
+            best[name] = min(best[name], time_call(func, args, repeat))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", default="10,1000,10000,50000", help="Cantidades de miembros separadas por coma.")
+    parser.add_argument("--repeat", type=int, default=20, help="Llamadas por ronda.")
+    parser.add_argument("--rounds", type=int, default=10, help="Rondas por camino; se reporta la más rápida.")
+    args = parser.parse_args()
+
+    cases = []
+    for count in (int(x) for x in args.members.split(",")):
+        raw = make_raw_channel(count)
+        # Todos los caminos deben producir el mismo modelo
+        paths = [("mongoengine", channel_mongoengine), ("validate", channel_validate), ("construct", channel_construct), ("batch", channel_batch)]
+        assert all(func(*raw).model_dump() == channel_batch(*raw).model_dump() for _, func in paths)
+        cases.append((f"Channel ({count} miembros)", raw, paths))
+    basic_docs = make_raw_basic_infos(1000)
+    basic_paths = [("validate", basic_validate), ("construct", basic_construct), ("batch", basic_batch)]
+    assert all(func(basic_docs) == basic_validate(basic_docs) for _, func in basic_paths)
+    cases.append(("list[BasicInfo] (1000)", (basic_docs,), basic_paths))
+
+    print(f"{'caso':<28} {'camino':<12} {'ms':>9} {'pico KiB':>10} {'bloques':>9}")
+    for name, func_args, paths in cases:
+        elapsed_by_path = measure_case(paths, func_args, args.repeat, args.rounds)
+        for path_name, func in paths:
+            elapsed = elapsed_by_path[path_name]
+            peak, blocks = measure_memory(func, func_args)
+            print(f"{name:<28} {path_name:<12} {elapsed:>9.3f} {peak:>10.1f} {blocks:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Microbenchmark de serialización de respuestas `Channel` / `ChannelBasicInfoResponse`.
+
+Compara, para canales con distinta cantidad de miembros:
+- "fastapi": el camino por defecto de FastAPI al devolver un modelo con `response_model`
+  (validación contra `response_model` + `jsonable_encoder` + `json.dumps`).
+- "fast": `ModelJSONResponse`, que serializa el modelo ya construido directo a bytes.
+
+Uso:
+    python -m benchmarks.bench_serialization [--members 10,1000,50000] [--repeat 20]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.routers.fast_json import ModelJSONResponse
+from app.schemas.channels import Channel
+from app.schemas.responses import ChannelBasicInfoResponse
+
+
+def make_channel(member_count: int) -> Channel:
+    now = time.time()
+    return Channel.model_validate({
+        "_id": "68f430e95055d3561d1d3167",
+        "name": "general",
+        "owner_id": "owner123",
+        "users": [{"id": f"user-{i}", "joined_at": now, "status": "normal"} for i in range(member_count)],
+        "created_at": now,
+        "updated_at": now,
+    })
+
+
+def make_basic_infos(count: int) -> list[ChannelBasicInfoResponse]:
+    now = time.time()
+    return [
+        ChannelBasicInfoResponse.model_validate({
+            "id": f"{i:024x}", "name": f"canal-{i}", "owner_id": "owner123",
+            "channel_type": "public", "created_at": now, "user_count": i,
+        })
+        for i in range(count)
+    ]
+
+
+async def fastapi_path(field, content) -> bytes:
+    serialized = await serialize_response(field=field, response_content=content)
+    return JSONResponse(serialized).body
+
+
+async def fast_path(field, content) -> bytes:
+    return ModelJSONResponse(content).body
+
+
+async def timeit(func, field, content, repeat: int) -> float:
+    await func(field, content)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await func(field, content)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", default="10,1000,10000,50000", help="Cantidades de miembros separadas por coma.")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    channel_field = create_model_field(name="Response", type_=Channel, mode="serialization")
+    list_field = create_model_field(name="Response", type_=list[ChannelBasicInfoResponse], mode="serialization")
+
+    print(f"{'caso':<28} {'fastapi ms':>11} {'fast ms':>9} {'speedup':>8}")
+    cases = [(f"Channel ({n} miembros)", channel_field, make_channel(n)) for n in (int(x) for x in args.members.split(","))]
+    cases.append(("list[BasicInfo] (100)", list_field, make_basic_infos(100)))
+    for name, field, content in cases:
+        # Ambos caminos deben producir el mismo documento JSON
+        assert json.loads(await fastapi_path(field, content)) == json.loads(await fast_path(field, content))
+        slow = await timeit(fastapi_path, field, content, args.repeat)
+        fast = await timeit(fast_path, field, content, args.repeat)
+        print(f"{name:<28} {slow:>11.3f} {fast:>9.3f} {slow / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
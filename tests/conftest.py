@@ -4,15 +4,25 @@ from fastapi.testclient import TestClient
 
 from app.main import app
 from app import main as main_module
-from app.routers.v1 import channels as channels_router
-from app.routers.v1 import members as members_router
+from app.db.cache import clear_caches
 
 
 @pytest.fixture(autouse=True)
 def mock_infrastructure(monkeypatch):
     """Mock de Mongo y RabbitMQ para todos los tests."""
-    monkeypatch.setattr(main_module, "connect_to_mongo", lambda: None)
-    monkeypatch.setattr(main_module, "close_mongo_connection", lambda: None)
+    async def fake_connect_to_mongo():
+        return None
+
+    async def fake_close_mongo_connection():
+        return None
+
+    monkeypatch.setattr(main_module, "connect_to_mongo", fake_connect_to_mongo)
+    monkeypatch.setattr(main_module, "close_mongo_connection", fake_close_mongo_connection)
+
+    async def fake_ensure_indexes():
+        return None
+
+    monkeypatch.setattr(main_module, "ensure_indexes", fake_ensure_indexes)
 
     async def fake_connect_to_rabbitmq():
         return None
@@ -23,13 +33,15 @@ def mock_infrastructure(monkeypatch):
     monkeypatch.setattr(main_module, "connect_to_rabbitmq_all", fake_connect_to_rabbitmq)
     monkeypatch.setattr(main_module, "close_rabbitmq_connection_all", fake_close_rabbitmq_connection)
 
-    async def fake_publish_message_main(*args, **kwargs):
-        return None
+    yield
 
-    monkeypatch.setattr(channels_router, "publish_message_main", fake_publish_message_main, raising=False)
-    monkeypatch.setattr(members_router, "publish_message_main", fake_publish_message_main, raising=False)
 
+@pytest.fixture(autouse=True)
+def clear_channel_caches():
+    """Cada test parte con la caché de canales vacía."""
+    clear_caches()
     yield
+    clear_caches()
 
 
 @pytest.fixture
@@ -0,0 +1,137 @@
+# tests/v1/test_admission.py
+import asyncio
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app import admission
+from app.admission import _RouteLimiter, _route_limiter
+from app.controllers import channels as channels_controller
+from app.main import app
+from app.schemas.channels import Channel
+from app.schemas.responses import ChannelBasicInfoResponse
+
+
+def make_fake_channel(channel_id: str = "fake-channel-id") -> Channel:
+    now = time.time()
+    data = {
+        "id": channel_id,
+        "_id": channel_id,
+        "name": "general",
+        "owner_id": "owner-123",
+        "users": [],
+        "is_active": True,
+        "channel_type": "public",
+        "created_at": now,
+        "updated_at": now,
+        "deleted_at": None,
+    }
+    return Channel.model_validate(data)
+
+
+def make_fake_basic_info(channel_id: str = "fake-channel-id") -> ChannelBasicInfoResponse:
+    data = {
+        "id": channel_id,
+        "name": "general",
+        "owner_id": "owner-123",
+        "channel_type": "public",
+        "created_at": time.time(),
+        "user_count": 0,
+    }
+    return ChannelBasicInfoResponse.model_validate(data)
+
+
+# -------------------- Grupos de rutas -------------------- #
+
+def test_heavy_routes_include_channel_listing():
+    heavy = admission.route_limiters["heavy"]
+    assert _route_limiter("GET", "/v1/channels/") is heavy
+    assert _route_limiter("GET", "/v1/channels") is heavy
+    assert _route_limiter("GET", "/v1/channels/chan-1") is heavy
+    assert _route_limiter("GET", "/v1/channels/export/members") is heavy
+    assert _route_limiter("POST", "/v1/channels/") is admission.route_limiters["default"]
+    assert _route_limiter("GET", "/v1/channels/chan-1/basic") is admission.route_limiters["default"]
+    assert _route_limiter("GET", "/health") is None
+
+
+# -------------------- _RouteLimiter -------------------- #
+
+def test_limiter_hands_released_slot_to_waiter():
+    async def scenario():
+        limiter = _RouteLimiter("test", 1)
+        assert await limiter.acquire(0)
+        waiting = asyncio.create_task(limiter.acquire(1))
+        await asyncio.sleep(0)
+
+        limiter.release()
+        # El cupo ya es del que esperaba: una petición nueva no se le adelanta
+        assert limiter.in_flight == 1
+        assert not await limiter.acquire(0)
+        assert await waiting
+        assert limiter.in_flight == 1
+
+        limiter.release()
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_limiter_timed_out_waiter_does_not_keep_slot():
+    async def scenario():
+        limiter = _RouteLimiter("test", 1)
+        assert await limiter.acquire(0)
+        assert not await limiter.acquire(0.01)
+        assert limiter.stats()["waiting"] == 0
+
+        limiter.release()
+        assert limiter.in_flight == 0
+        assert await limiter.acquire(0)
+
+    asyncio.run(scenario())
+
+
+# -------------------- AdmissionControlMiddleware -------------------- #
+
+def test_admission_sheds_heavy_reads_over_limit(monkeypatch):
+    async def slow_get_channel(channel_id: str, include_members: bool = True):
+        await asyncio.sleep(0.2)
+        return make_fake_channel(channel_id=channel_id)
+
+    monkeypatch.setattr(channels_controller, "get_channel", slow_get_channel)
+    monkeypatch.setattr(admission.route_limiters["heavy"], "limit", 1)
+    monkeypatch.setattr(admission, "ADMISSION_MAX_QUEUE_WAIT", 0.05)
+    rejected_before = admission.route_limiters["heavy"].rejected
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            return await asyncio.gather(
+                http.get("/v1/channels/chan-1"),
+                http.get("/v1/channels/chan-2"),
+                http.get("/health"),
+            )
+
+    first, second, health = asyncio.run(scenario())
+    assert sorted([first.status_code, second.status_code]) == [200, 503]
+    shed = first if first.status_code == 503 else second
+    assert shed.headers["Retry-After"] == str(admission.ADMISSION_RETRY_AFTER)
+    assert health.status_code == 200
+    assert admission.route_limiters["heavy"].rejected == rejected_before + 1
+    assert admission.route_limiters["heavy"].in_flight == 0
+
+
+def test_admission_sheds_on_event_loop_lag_but_not_health(client: TestClient, monkeypatch):
+    async def fake_get_channel_basic_info(channel_id: str):
+        return make_fake_basic_info(channel_id=channel_id)
+
+    monkeypatch.setattr(channels_controller, "get_channel_basic_info", fake_get_channel_basic_info)
+    monkeypatch.setattr(admission.loop_lag_monitor, "lag", admission.ADMISSION_MAX_LOOP_LAG + 1)
+
+    response = client.get("/v1/channels/abc123/basic")
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+    assert client.get("/health").status_code == 200
+    status_response = client.get("/status")
+    assert status_response.status_code == 200
+    assert status_response.json()["admission"]["default"]["rejected"] >= 1
@@ -1,11 +1,23 @@
 # tests/v1/test_channels.py
+import asyncio
+import json
 import time
+from datetime import datetime, timedelta, timezone
 
+import httpx
+import pytest
 from fastapi.testclient import TestClient
 
 from app.schemas.channels import Channel
 from app.schemas.responses import ChannelBasicInfoResponse
 from app.controllers import channels as channels_controller
+from bson import ObjectId
+
+from app.db import bloom, querys
+from app.db.singleflight import SingleFlight
+from app.deadline import DEADLINE_DETAIL, deadline_scope, remaining
+from pymongo.errors import ExecutionTimeout, ServerSelectionTimeoutError, WaitQueueTimeoutError
+from app.main import app
 
 
 # --------- Helpers para armar objetos falsos (Pydantic) --------- #
@@ -91,7 +103,7 @@ def test_create_channel_validation_error(client: TestClient):
 # -------------------- GET /v1/channels/ -------------------- #
 
 def test_list_channels_success(client: TestClient, monkeypatch):
-    def fake_list_channels(page: int, page_size: int):
+    async def fake_list_channels(page: int, page_size: int):
         return [
             make_fake_basic_info(channel_id="1", name="general"),
             make_fake_basic_info(channel_id="2", name="random"),
@@ -117,12 +129,45 @@ def test_list_channels_invalid_page_size(client: TestClient):
     assert response.status_code == 422
 
 
+def test_list_channels_with_cursor(client: TestClient, monkeypatch):
+    async def fake_list_channels_after(cursor: str | None, page_size: int):
+        assert cursor == "abc"
+        assert page_size == 2
+        return [
+            make_fake_basic_info(channel_id="3", name="general"),
+            make_fake_basic_info(channel_id="4", name="random"),
+        ], "next-cursor"
+
+    monkeypatch.setattr(channels_controller, "list_channels_after", fake_list_channels_after)
+
+    response = client.get("/v1/channels/?cursor=abc&page_size=2")
+    assert response.status_code == 200
+    assert response.headers["X-Next-Cursor"] == "next-cursor"
+    assert [c["id"] for c in response.json()] == ["3", "4"]
+
+
+def test_list_channels_with_cursor_last_page(client: TestClient, monkeypatch):
+    async def fake_list_channels_after(cursor: str | None, page_size: int):
+        return [make_fake_basic_info(channel_id="5")], None
+
+    monkeypatch.setattr(channels_controller, "list_channels_after", fake_list_channels_after)
+
+    response = client.get("/v1/channels/?cursor=abc&page_size=2")
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_list_channels_invalid_cursor(client: TestClient):
+    response = client.get("/v1/channels/?cursor=no-es-un-cursor")
+    assert response.status_code == 422
+
+
 # -------------------- GET /v1/channels/{channel_id} -------------------- #
 
 def test_get_channel_by_id_success(client: TestClient, monkeypatch):
     fake_channel = make_fake_channel(channel_id="abc123")
 
-    def fake_get_channel(channel_id: str):
+    async def fake_get_channel(channel_id: str, include_members: bool = True):
         assert channel_id == "abc123"
         return fake_channel
 
@@ -138,7 +183,7 @@ def test_get_channel_by_id_success(client: TestClient, monkeypatch):
 
 
 def test_get_channel_by_id_not_found(client: TestClient, monkeypatch):
-    def fake_get_channel(channel_id: str):
+    async def fake_get_channel(channel_id: str, include_members: bool = True):
         return None
 
     monkeypatch.setattr(channels_controller, "get_channel", fake_get_channel)
@@ -147,6 +192,81 @@ def test_get_channel_by_id_not_found(client: TestClient, monkeypatch):
     assert response.status_code == 404
 
 
+def test_get_channel_by_id_returns_etag(client: TestClient, monkeypatch):
+    fake_channel = make_fake_channel(channel_id="abc123")
+
+    async def fake_get_channel(channel_id: str, include_members: bool = True):
+        return fake_channel
+
+    monkeypatch.setattr(channels_controller, "get_channel", fake_get_channel)
+
+    response = client.get("/v1/channels/abc123")
+    assert response.status_code == 200
+    assert response.headers["ETag"].startswith('"')
+    assert "Last-Modified" in response.headers
+
+
+def test_get_channel_by_id_not_modified(client: TestClient, monkeypatch):
+    fake_channel = make_fake_channel(channel_id="abc123")
+
+    async def fake_get_channel(channel_id: str, include_members: bool = True):
+        return fake_channel
+
+    async def fake_get_channel_version(channel_id: str):
+        return fake_channel.updated_at
+
+    monkeypatch.setattr(channels_controller, "get_channel", fake_get_channel)
+    monkeypatch.setattr(channels_controller, "get_channel_version", fake_get_channel_version)
+
+    etag = client.get("/v1/channels/abc123").headers["ETag"]
+
+    async def fail_get_channel(channel_id: str, include_members: bool = True):
+        raise AssertionError("No se debe cargar el canal si no ha cambiado")
+
+    monkeypatch.setattr(channels_controller, "get_channel", fail_get_channel)
+
+    response = client.get("/v1/channels/abc123", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+
+def test_get_channel_by_id_modified_since_etag(client: TestClient, monkeypatch):
+    fake_channel = make_fake_channel(channel_id="abc123")
+
+    async def fake_get_channel(channel_id: str, include_members: bool = True):
+        return fake_channel
+
+    async def fake_get_channel_version(channel_id: str):
+        return fake_channel.updated_at + 1
+
+    monkeypatch.setattr(channels_controller, "get_channel", fake_get_channel)
+    monkeypatch.setattr(channels_controller, "get_channel_version", fake_get_channel_version)
+
+    response = client.get("/v1/channels/abc123", headers={"If-None-Match": '"etag-antiguo"'})
+    assert response.status_code == 200
+    assert response.json()["_id"] == "abc123"
+
+
+def test_get_channel_by_id_without_members(client: TestClient, monkeypatch):
+    fake_channel = make_fake_channel(channel_id="abc123")
+    calls = []
+
+    async def fake_get_channel(channel_id: str, include_members: bool = True):
+        calls.append(include_members)
+        return fake_channel.model_copy(update={"users": None})
+
+    monkeypatch.setattr(channels_controller, "get_channel", fake_get_channel)
+
+    full_etag = client.get("/v1/channels/abc123").headers["ETag"]
+    response = client.get("/v1/channels/abc123", params={"include_members": "false"})
+    assert response.status_code == 200
+    assert calls == [True, False]
+    assert "users" not in response.json()
+    assert response.json()["name"] == fake_channel.name
+    assert response.headers["ETag"] != full_etag
+
+
 # -------------------- PUT /v1/channels/{channel_id} -------------------- #
 
 def test_update_channel_success(client: TestClient, monkeypatch):
@@ -175,6 +295,16 @@ def test_update_channel_not_found(client: TestClient, monkeypatch):
     assert response.status_code == 404
 
 
+def test_update_channel_owner_not_member(client: TestClient, monkeypatch):
+    async def fake_update_channel(channel_id: str, update_data):
+        raise channels_controller.OwnerNotMemberError("El nuevo owner_id 'x' no es miembro del canal.")
+
+    monkeypatch.setattr(channels_controller, "update_channel", fake_update_channel)
+
+    response = client.put("/v1/channels/abc123", json={"owner_id": "x"})
+    assert response.status_code == 409
+
+
 # -------------------- DELETE /v1/channels/{channel_id} -------------------- #
 
 def test_deactivate_channel_success(client: TestClient, monkeypatch):
@@ -242,7 +372,7 @@ def test_reactivate_channel_already_active(client: TestClient, monkeypatch):
 def test_get_basic_channel_info_success(client: TestClient, monkeypatch):
     fake_basic = make_fake_basic_info(channel_id="abc123", name="general")
 
-    def fake_get_channel_basic_info(channel_id: str):
+    async def fake_get_channel_basic_info(channel_id: str):
         return fake_basic
 
     monkeypatch.setattr(
@@ -260,7 +390,7 @@ def test_get_basic_channel_info_success(client: TestClient, monkeypatch):
 
 
 def test_get_basic_channel_info_not_found(client: TestClient, monkeypatch):
-    def fake_get_channel_basic_info(channel_id: str):
+    async def fake_get_channel_basic_info(channel_id: str):
         return None
 
     monkeypatch.setattr(
@@ -271,3 +401,260 @@ def test_get_basic_channel_info_not_found(client: TestClient, monkeypatch):
 
     response = client.get("/v1/channels/no-existe/basic")
     assert response.status_code == 404
+
+
+def test_bloom_filter_answers_unknown_channels_without_mongo(client: TestClient, monkeypatch):
+    known_id = ObjectId()
+    channel_filter = bloom.BloomFilter(capacity=1000, error_rate=0.01)
+    channel_filter.add(known_id.binary)
+    monkeypatch.setattr(bloom._state, "filter", channel_filter)
+    monkeypatch.setattr(bloom._state, "ready", True)
+    monkeypatch.setattr(bloom._state, "built_at", time.time())
+
+    def fail_if_called():
+        raise AssertionError("No debería consultarse MongoDB")
+
+    monkeypatch.setattr(querys, "_channels_collection", fail_if_called)
+
+    # Generado antes de construir el filtro
+    unknown_id = str(ObjectId.from_datetime(datetime(2024, 1, 1, tzinfo=timezone.utc)))
+    assert client.get(f"/v1/channels/{unknown_id}/basic").status_code == 404
+    assert client.get(f"/v1/channels/{unknown_id}").status_code == 404
+    assert client.get(f"/v1/channels/{unknown_id}/status").status_code == 404
+
+    stats = client.get("/status").json()["bloom"]
+    assert stats["ready"] is True
+    assert stats["definite_misses"] == 3
+    assert stats["channels"] == 1
+
+
+def test_bloom_filter_lets_ids_newer_than_the_build_through(client: TestClient, monkeypatch):
+    monkeypatch.setattr(bloom._state, "filter", bloom.BloomFilter(capacity=1000, error_rate=0.01))
+    monkeypatch.setattr(bloom._state, "ready", True)
+    monkeypatch.setattr(bloom._state, "built_at", time.time())
+    monkeypatch.setattr(bloom, "CHANNEL_BLOOM_CLOCK_SKEW", 60)
+    monkeypatch.setattr(bloom._state, "recent_misses", 0)
+    monkeypatch.setattr(bloom._state, "definite_misses", 0)
+
+    # Un canal creado en otra réplica después de construir el filtro, cuyo evento aún no llega
+    assert bloom.channel_may_exist(ObjectId())
+    # Dentro del margen de desfase de reloj
+    assert bloom.channel_may_exist(ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=30)))
+    assert not bloom.channel_may_exist(ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(hours=1)))
+
+    stats = client.get("/status").json()["bloom"]
+    assert stats["recent_misses"] == 2
+    assert stats["definite_misses"] == 1
+
+
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives():
+    channel_filter = bloom.BloomFilter(capacity=5000, error_rate=0.01)
+    added = [ObjectId().binary for _ in range(5000)]
+    for key in added:
+        channel_filter.add(key)
+
+    assert all(key in channel_filter for key in added)
+    false_positives = sum(ObjectId().binary in channel_filter for _ in range(20000))
+    assert false_positives / 20000 < 0.03
+    assert 0.005 < channel_filter.false_positive_rate() < 0.02
+
+
+def test_concurrent_basic_info_reads_share_one_query(monkeypatch):
+    db_reads = []
+
+    async def fake_db_get_basic_channel_info(channel_id: str):
+        db_reads.append(channel_id)
+        await asyncio.sleep(0.05)
+        return make_fake_basic_info(channel_id=channel_id)
+
+    monkeypatch.setattr(querys, "db_get_basic_channel_info", fake_db_get_basic_channel_info)
+
+    async def read_concurrently():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            return await asyncio.gather(*(http.get(f"/v1/channels/{channel_id}/basic") for _ in range(10)))
+
+    channel_id = str(ObjectId())
+    responses = asyncio.run(read_concurrently())
+    assert [r.status_code for r in responses] == [200] * 10
+    assert db_reads == [channel_id]
+
+
+def test_single_flight_propagates_errors_and_retries():
+    calls = 0
+
+    async def failing_loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("mongo caído")
+
+    async def scenario():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do("k", failing_loader) for _ in range(5)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert calls == 1
+        # El error no queda guardado: la siguiente llamada vuelve a consultar
+        with pytest.raises(RuntimeError):
+            await flights.do("k", failing_loader)
+        assert calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_cancelling_one_waiter_keeps_the_others():
+    async def scenario():
+        flights = SingleFlight()
+        loader_cancelled = asyncio.Event()
+
+        async def slow_loader():
+            try:
+                await asyncio.sleep(0.05)
+                return "canal"
+            except asyncio.CancelledError:
+                loader_cancelled.set()
+                raise
+
+        first = asyncio.create_task(flights.do("k", slow_loader))
+        second = asyncio.create_task(flights.do("k", slow_loader))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "canal"
+        assert first.cancelled()
+        assert not loader_cancelled.is_set()
+
+        # Si se cancelan todos los que esperan, la carga se cancela
+        only = asyncio.create_task(flights.do("k", slow_loader))
+        await asyncio.sleep(0)
+        only.cancel()
+        await asyncio.sleep(0.01)
+        assert loader_cancelled.is_set()
+        assert flights.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+# -------------------- GET /v1/channels/export -------------------- #
+
+def test_export_channels_ndjson_with_filters(client: TestClient, monkeypatch):
+    received = {}
+
+    def fake_export_channels(is_active, channel_type, updated_since, batch_size):
+        received.update(is_active=is_active, channel_type=channel_type, updated_since=updated_since, batch_size=batch_size)
+
+        async def rows():
+            for i in range(3):
+                yield {"id": f"chan-{i}", "name": f"canal-{i}", "is_active": True}
+        return rows()
+
+    monkeypatch.setattr(channels_controller, "export_channels", fake_export_channels)
+
+    response = client.get(
+        "/v1/channels/export",
+        params={"active": "true", "channel_type": "private", "updated_since": 10.5, "batch_size": 50},
+        headers={"Accept-Encoding": "identity"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert "content-encoding" not in response.headers
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == ["chan-0", "chan-1", "chan-2"]
+    assert received == {"is_active": True, "channel_type": "private", "updated_since": 10.5, "batch_size": 50}
+
+
+def test_export_channels_gzip(client: TestClient, monkeypatch):
+    def fake_export_channels(is_active, channel_type, updated_since, batch_size):
+        async def rows():
+            for i in range(1000):
+                yield {"id": f"chan-{i}"}
+        return rows()
+
+    monkeypatch.setattr(channels_controller, "export_channels", fake_export_channels)
+
+    response = client.get("/v1/channels/export", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.text.splitlines()) == 1000
+
+
+def test_export_members_invalid_batch_size(client: TestClient):
+    response = client.get("/v1/channels/export/members", params={"batch_size": 0})
+    assert response.status_code == 422
+
+
+# -------------------- POST /v1/channels/batch -------------------- #
+
+def test_get_channels_batch_includes_not_found(client: TestClient, monkeypatch):
+    active = make_fake_basic_info(channel_id="a1", name="general")
+    inactive = make_fake_basic_info(channel_id="b2", name="random")
+    requested = []
+
+    async def fake_db_get_channels_batch(channel_ids: list[str]):
+        requested.append(channel_ids)
+        return {"a1": (True, active), "b2": (False, inactive)}
+
+    monkeypatch.setattr(querys, "db_get_channels_batch", fake_db_get_channels_batch)
+
+    response = client.post("/v1/channels/batch", json={"ids": ["a1", "b2", "zz", "a1"]})
+    assert response.status_code == 200
+    assert requested == [["a1", "b2", "zz"]]
+
+    data = response.json()
+    assert data["a1"]["found"] is True and data["a1"]["is_active"] is True
+    assert data["a1"]["channel"]["name"] == "general"
+    assert data["b2"] == {"found": True, "is_active": False, "channel": None}
+    assert data["zz"] == {"found": False, "is_active": None, "channel": None}
+
+
+def test_get_channels_batch_too_many_ids(client: TestClient, monkeypatch):
+    response = client.post("/v1/channels/batch", json={"ids": [str(i) for i in range(101)]})
+    assert response.status_code == 422
+
+
+# -------------------- Deadline por petición -------------------- #
+
+def test_request_timeout_header_sets_deadline_and_returns_504(client: TestClient, monkeypatch):
+    seen_remaining = []
+
+    async def slow_get_channel(channel_id: str, include_members: bool = True):
+        seen_remaining.append(remaining())
+        async with deadline_scope():
+            await asyncio.sleep(1)
+
+    monkeypatch.setattr(channels_controller, "get_channel", slow_get_channel)
+
+    start = time.monotonic()
+    response = client.get("/v1/channels/chan-1", headers={"X-Request-Timeout": "0.05"})
+    assert response.status_code == 504
+    assert time.monotonic() - start < 0.5
+    assert 0 < seen_remaining[0] <= 0.05
+
+
+def test_invalid_request_timeout_header_returns_400(client: TestClient):
+    assert client.get("/v1/channels/chan-1", headers={"X-Request-Timeout": "abc"}).status_code == 400
+    assert client.get("/v1/channels/chan-1", headers={"X-Request-Timeout": "-1"}).status_code == 400
+
+
+def test_mongo_max_time_exceeded_returns_504_instead_of_404(client: TestClient, monkeypatch):
+    class TimingOutCollection:
+        async def aggregate(self, *args, **kwargs):
+            raise ExecutionTimeout("operation exceeded time limit", code=50)
+
+    monkeypatch.setattr(querys, "_channels_collection", lambda: TimingOutCollection())
+
+    response = client.get(f"/v1/channels/{ObjectId()}/basic")
+    assert response.status_code == 504
+
+
+def test_server_selection_timeout_returns_504(client: TestClient, monkeypatch):
+    async def unreachable_get_channel(channel_id: str, include_members: bool = True):
+        raise ServerSelectionTimeoutError("No servers found yet")
+
+    async def unreachable_list_channels(*args, **kwargs):
+        raise WaitQueueTimeoutError("Timed out while checking out a connection from connection pool")
+
+    monkeypatch.setattr(channels_controller, "get_channel", unreachable_get_channel)
+    monkeypatch.setattr(channels_controller, "list_channels", unreachable_list_channels)
+
+    response = client.get("/v1/channels/chan-1")
+    assert response.status_code == 504
+    assert response.json() == {"detail": DEADLINE_DETAIL}
+    assert client.get("/v1/channels/", params={"page_size": 5}).status_code == 504
@@ -0,0 +1,469 @@
+# tests/v1/test_events.py
+import asyncio
+import json
+import time
+
+import aio_pika
+import pytest
+from bson import ObjectId
+from aio_pika.tools import CallbackCollection
+from pamqp.commands import Basic
+
+from app.db import querys
+from app.events import conn, outbox, publish
+from app.events.clients import RabbitMQClient
+
+
+# --------- Helpers: exchange y canal falsos de aio-pika --------- #
+
+class FakeExchange:
+    def __init__(self, name: str = "main_exchange", delay: float = 0.0, error: Exception | None = None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.published = []
+        self.concurrent = 0
+        self.max_concurrent = 0
+
+    async def publish(self, message, routing_key: str):
+        self.concurrent += 1
+        self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            self.published.append((routing_key, json.loads(message.body)))
+        finally:
+            self.concurrent -= 1
+
+
+class FakeChannel:
+    def __init__(self):
+        self.get_exchange_calls = 0
+
+    async def get_exchange(self, name: str, ensure: bool = True):
+        self.get_exchange_calls += 1
+        return FakeExchange(name)
+
+
+def make_client(exchange: FakeExchange) -> RabbitMQClient:
+    client = RabbitMQClient(rabbitmq_url="amqp://test", exchange_name=exchange.name)
+    client.publish_channel = FakeChannel()
+    client.publish_exchange = exchange
+    return client
+
+
+# -------------------- publish_message_main -------------------- #
+
+def test_publish_uses_cached_exchange_and_records_metrics(monkeypatch):
+    monkeypatch.setattr(publish, "publisher", publish._Publisher(max_in_flight=8))
+    exchange = FakeExchange()
+    client = make_client(exchange)
+
+    asyncio.run(publish.publish_message_main(client, {"channel_id": "c1"}, "channelService.v1.channel.created"))
+
+    assert exchange.published == [("channelService.v1.channel.created", {"channel_id": "c1", "type": "channelService.v1.channel.created"})]
+    assert client.publish_channel.get_exchange_calls == 0
+    stats = publish.publisher_stats()
+    assert stats["published"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["confirm_lag"]["max_ms"] >= 0
+
+
+def test_publish_window_bounds_unconfirmed_messages(monkeypatch):
+    monkeypatch.setattr(publish, "publisher", publish._Publisher(max_in_flight=2))
+    exchange = FakeExchange(delay=0.01)
+    client = make_client(exchange)
+
+    async def publish_many():
+        await asyncio.gather(*(publish.publish_message_main(client, {"n": i}, "channelService.v1.user.added") for i in range(10)))
+
+    asyncio.run(publish_many())
+    assert len(exchange.published) == 10
+    assert exchange.max_concurrent == 2
+
+
+def test_publish_nack_raises_publish_error(monkeypatch):
+    monkeypatch.setattr(publish, "publisher", publish._Publisher(max_in_flight=8))
+    exchange = FakeExchange(error=aio_pika.exceptions.DeliveryError(None, Basic.Nack(delivery_tag=1)))
+    client = make_client(exchange)
+
+    with pytest.raises(publish.PublishError):
+        asyncio.run(publish.publish_message_main(client, {"channel_id": "c1"}, "channelService.v1.channel.deleted"))
+    assert publish.publisher_stats()["failed"] == 1
+
+
+def test_publish_message_caches_exchange_by_name(monkeypatch):
+    monkeypatch.setattr(publish, "publisher", publish._Publisher(max_in_flight=8))
+    client = make_client(FakeExchange())
+
+    async def publish_twice():
+        await publish.publish_message(client, {"a": 1}, "x.y", "otro_exchange")
+        await publish.publish_message(client, {"a": 2}, "x.y", "otro_exchange")
+
+    asyncio.run(publish_twice())
+    assert client.publish_channel.get_exchange_calls == 1
+    assert len(client.exchanges["otro_exchange"].published) == 2
+
+
+# -------------------- relay del outbox -------------------- #
+
+def make_outbox_event(routing_key: str, n: int, created_at: float = 1.0) -> dict:
+    return {"event_id": ObjectId(), "routing_key": routing_key, "payload": {"channel_id": "c", "n": n}, "created_at": created_at}
+
+
+class FakeOutboxStore:
+    """Outbox en memoria con la misma interfaz que las consultas de `querys`."""
+
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+        self.acked = []
+        self.dead_letters = []
+
+    async def get_pending(self, channel_limit: int, event_limit: int):
+        now = time.time()
+        pending = [doc for doc in self.documents if doc["outbox"] and doc.get("outbox_retry_at", 0) <= now]
+        return [{**doc, "outbox": doc["outbox"][:event_limit]} for doc in pending[:channel_limit]]
+
+    def _document(self, channel_object_id):
+        return next(doc for doc in self.documents if doc["_id"] == channel_object_id)
+
+    async def ack(self, channel_object_id, event_ids):
+        self.acked.append((channel_object_id, list(event_ids)))
+        doc = self._document(channel_object_id)
+        doc["outbox"] = [event for event in doc["outbox"] if event["event_id"] not in event_ids]
+        for field in ("outbox_attempts", "outbox_retry_at", "outbox_error"):
+            doc.pop(field, None)
+
+    async def defer(self, channel_object_id, attempts, retry_at, error):
+        self._document(channel_object_id).update(outbox_attempts=attempts, outbox_retry_at=retry_at, outbox_error=error)
+
+    async def dead_letter(self, channel_object_id, event, attempts, error):
+        self.dead_letters.append(event)
+        await self.ack(channel_object_id, [event["event_id"]])
+
+
+def patch_outbox(monkeypatch, store: FakeOutboxStore, exchange: FakeExchange) -> outbox._OutboxRelay:
+    monkeypatch.setattr(publish, "publisher", publish._Publisher(max_in_flight=8))
+    monkeypatch.setattr(querys, "db_get_pending_outbox", store.get_pending)
+    monkeypatch.setattr(querys, "db_ack_outbox_events", store.ack)
+    monkeypatch.setattr(querys, "db_defer_outbox", store.defer)
+    monkeypatch.setattr(querys, "db_dead_letter_outbox_event", store.dead_letter)
+    monkeypatch.setitem(outbox.rabbit_clients, "channel", make_client(exchange))
+    relay = outbox._OutboxRelay()
+    relay.is_leader = True
+    relay._lease_until = float("inf")
+    return relay
+
+
+def test_outbox_relay_publishes_in_order_and_acks(monkeypatch):
+    first, second = ObjectId(), ObjectId()
+    store = FakeOutboxStore([
+        {"_id": first, "outbox_since": 1.0, "outbox": [make_outbox_event("channelService.v1.user.added", i) for i in range(3)]},
+        {"_id": second, "outbox_since": 2.0, "outbox": [make_outbox_event("channelService.v1.channel.updated", 0, 2.0)]},
+    ])
+    exchange = FakeExchange()
+    relay = patch_outbox(monkeypatch, store, exchange)
+
+    assert asyncio.run(relay.relay_batch()) == 4
+
+    first_channel = [body["n"] for key, body in exchange.published if key == "channelService.v1.user.added"]
+    assert first_channel == [0, 1, 2]
+    assert all("event_id" in body for _, body in exchange.published)
+    assert [doc["outbox"] for doc in store.documents] == [[], []]
+    stats = relay.stats()
+    assert stats["relayed"] == 4
+    assert stats["pending_channels"] == 2
+    assert stats["lag_seconds"] > 0
+
+
+def test_outbox_relay_stops_channel_at_first_failure(monkeypatch):
+    channel_id = ObjectId()
+    events = [make_outbox_event("channelService.v1.user.added", i) for i in range(3)]
+    store = FakeOutboxStore([{"_id": channel_id, "outbox_since": 1.0, "outbox": list(events)}])
+    exchange = FakeExchange()
+    relay = patch_outbox(monkeypatch, store, exchange)
+
+    original_publish = exchange.publish
+
+    async def fail_second(message, routing_key: str):
+        if json.loads(message.body)["n"] == 1:
+            raise aio_pika.exceptions.DeliveryError(None, Basic.Nack(delivery_tag=1))
+        await original_publish(message, routing_key)
+
+    exchange.publish = fail_second
+
+    assert asyncio.run(relay.relay_batch()) == 1
+    # Solo se confirma el primero; los siguientes quedan pendientes y en orden
+    assert store.acked == [(channel_id, [events[0]["event_id"]])]
+    assert [event["payload"]["n"] for event in store.documents[0]["outbox"]] == [1, 2]
+    assert relay.stats()["failed"] == 1
+    # El canal queda aplazado: la vuelta siguiente no lo reintenta de inmediato
+    assert store.documents[0]["outbox_attempts"] == 1
+    assert store.documents[0]["outbox_retry_at"] > time.time()
+    assert asyncio.run(relay.relay_batch()) == 0
+
+
+def test_outbox_relay_backs_off_exponentially(monkeypatch):
+    channel_id = ObjectId()
+    store = FakeOutboxStore([{"_id": channel_id, "outbox_since": 1.0, "outbox_attempts": 3, "outbox": [make_outbox_event("channelService.v1.user.added", 0)]}])
+    relay = patch_outbox(monkeypatch, store, FakeExchange())
+    monkeypatch.setitem(outbox.rabbit_clients, "channel", None)
+
+    before = time.time()
+    assert asyncio.run(relay.relay_batch()) == 0
+
+    document = store.documents[0]
+    assert document["outbox_attempts"] == 4
+    assert document["outbox_retry_at"] - before >= outbox.OUTBOX_RETRY_BASE_DELAY * 8
+    # Un fallo de conexión nunca retira el evento
+    assert store.dead_letters == []
+
+
+def test_outbox_relay_dead_letters_rejected_event(monkeypatch):
+    channel_id = ObjectId()
+    events = [make_outbox_event("channelService.v1.user.added", i) for i in range(2)]
+    store = FakeOutboxStore([{
+        "_id": channel_id, "outbox_since": 1.0, "outbox_attempts": outbox.OUTBOX_MAX_ATTEMPTS - 1, "outbox": list(events)
+    }])
+    exchange = FakeExchange()
+    relay = patch_outbox(monkeypatch, store, exchange)
+    original_publish = exchange.publish
+
+    async def reject_first(message, routing_key: str):
+        if json.loads(message.body)["n"] == 0:
+            raise aio_pika.exceptions.DeliveryError(None, Basic.Nack(delivery_tag=1))
+        await original_publish(message, routing_key)
+
+    exchange.publish = reject_first
+
+    assert asyncio.run(relay.relay_batch()) == 0
+    assert store.dead_letters == [events[0]]
+    assert relay.stats()["dead_lettered"] == 1
+    # El evento siguiente ya no queda bloqueado
+    assert asyncio.run(relay.relay_batch()) == 1
+    assert [body["n"] for _, body in exchange.published] == [1]
+
+
+def test_outbox_relay_does_not_publish_without_lease(monkeypatch):
+    store = FakeOutboxStore([{"_id": ObjectId(), "outbox_since": 1.0, "outbox": [make_outbox_event("channelService.v1.channel.created", 0)]}])
+    exchange = FakeExchange()
+    relay = patch_outbox(monkeypatch, store, exchange)
+    relay.is_leader = False
+
+    assert asyncio.run(relay.relay_batch()) == 0
+    assert exchange.published == []
+    assert store.acked == []
+
+
+# -------------------- reconexión automática -------------------- #
+
+class FakeQueue:
+    def __init__(self, name: str):
+        self.name = name
+
+    async def bind(self, exchange, routing_key: str):
+        return None
+
+
+class FakeAmqpChannel:
+    def __init__(self, **kwargs):
+        self.options = kwargs
+        self.close_callbacks = CallbackCollection(self)
+        self.is_closed = False
+
+    async def declare_exchange(self, name: str, type, durable: bool):
+        return FakeExchange(name)
+
+    async def get_exchange(self, name: str, ensure: bool = True):
+        return FakeExchange(name)
+
+    async def declare_queue(self, name: str = "", durable: bool = True, arguments=None, **kwargs):
+        return FakeQueue(name)
+
+    async def close(self):
+        self.is_closed = True
+
+
+class FakeConnection:
+    def __init__(self):
+        self.is_closed = False
+        self.channels = []
+
+    async def channel(self, **kwargs):
+        channel = FakeAmqpChannel(**kwargs)
+        self.channels.append(channel)
+        return channel
+
+    async def close(self):
+        self.is_closed = True
+
+    async def drop(self):
+        """Simula la caída de la conexión: el broker cierra todos sus canales."""
+        self.is_closed = True
+        for channel in self.channels:
+            channel.is_closed = True
+            await channel.close_callbacks(ConnectionError("connection reset"))
+
+
+def patch_connect(monkeypatch, failures: int = 0) -> list[FakeConnection]:
+    """Reemplaza `aio_pika.connect`; las primeras `failures` llamadas fallan."""
+    connections = []
+    calls = {"n": 0}
+
+    async def fake_connect(url: str):
+        calls["n"] += 1
+        if calls["n"] <= failures:
+            raise ConnectionError("broker caído")
+        connection = FakeConnection()
+        connections.append(connection)
+        return connection
+
+    monkeypatch.setattr(conn.aio_pika, "connect", fake_connect)
+    monkeypatch.setattr(conn, "RETRY_DELAY", 0.001)
+    return connections
+
+
+@pytest.fixture(autouse=True)
+def fresh_connection_pool(monkeypatch):
+    monkeypatch.setattr(conn, "pool", conn._ConnectionPool(size=1))
+
+
+def make_rabbit_client(exchange_name: str = "main_exchange") -> RabbitMQClient:
+    return RabbitMQClient(rabbitmq_url="amqp://test", exchange_name=exchange_name, queue_name=f"{exchange_name}_queue")
+
+
+def test_backoff_delay_is_exponential_with_jitter_and_capped(monkeypatch):
+    monkeypatch.setattr(conn, "RETRY_DELAY", 1.0)
+    monkeypatch.setattr(conn, "RETRY_MAX_DELAY", 8.0)
+    monkeypatch.setattr(conn.random, "uniform", lambda low, high: high)
+
+    assert [conn._backoff_delay(attempt) for attempt in range(6)] == [1.0, 2.0, 4.0, 8.0, 8.0, 8.0]
+
+
+def test_lost_connection_reconnects_and_restores_listeners(monkeypatch):
+    connections = patch_connect(monkeypatch, failures=0)
+    client = make_rabbit_client()
+    started_on = []
+
+    async def listener(client):
+        started_on.append(client.channel)
+        client.active_consumers.append(("tag", client.main_queue))
+
+    async def scenario():
+        await conn.connect_to_rabbitmq(client)
+        await conn.add_listener(client, listener)
+        client.exchanges["otro_exchange"] = FakeExchange("otro_exchange")
+
+        # El broker cierra la conexión: ambos canales del cliente avisan de su cierre
+        await connections[0].drop()
+        assert not client.connected
+        assert client.publish_channel is None
+        await client.reconnect_task
+
+    asyncio.run(scenario())
+
+    assert len(connections) == 2
+    assert client.connection is connections[1]
+    assert client.connected
+    assert started_on == [connections[0].channels[0], connections[1].channels[0]]
+    assert client.active_consumers == [("tag", client.main_queue)]
+    assert client.exchanges == {}
+    stats = client.connection_stats()
+    assert stats["reconnects"] == 1
+    assert stats["downtime_seconds"] > 0
+    assert stats["current_outage_seconds"] == 0.0
+
+
+def test_closed_publish_channel_also_closes_consume_channel(monkeypatch):
+    connections = patch_connect(monkeypatch, failures=0)
+    client = make_rabbit_client()
+    started_on = []
+
+    async def listener(client):
+        started_on.append(client.channel)
+
+    async def scenario():
+        await conn.connect_to_rabbitmq(client)
+        await conn.add_listener(client, listener)
+        consume_channel, publish_channel = client.channel, client.publish_channel
+
+        # Un error de canal cierra solo el de publicación; la conexión sigue abierta
+        publish_channel.is_closed = True
+        await publish_channel.close_callbacks(ConnectionError("PRECONDITION_FAILED"))
+        await client.reconnect_task
+        return consume_channel
+
+    old_consume_channel = asyncio.run(scenario())
+
+    # El canal de consumo anterior se cierra: sus consumidores no quedan duplicados con los nuevos
+    assert old_consume_channel.is_closed
+    assert client.connected
+    assert len(started_on) == 2 and started_on[1] is client.channel
+    assert not client.channel.is_closed
+
+
+def test_reconnect_retries_until_broker_is_back(monkeypatch):
+    connections = patch_connect(monkeypatch, failures=0)
+    client = make_rabbit_client()
+
+    async def scenario():
+        await conn.connect_to_rabbitmq(client)
+        # Los próximos dos intentos fallan
+        patch_connect(monkeypatch, failures=2)
+        await connections[0].drop()
+        await client.reconnect_task
+
+    asyncio.run(scenario())
+
+    stats = client.connection_stats()
+    assert stats["connected"]
+    assert stats["failed_reconnects"] == 2
+    assert stats["reconnects"] == 1
+
+
+def test_closing_the_client_does_not_reconnect(monkeypatch):
+    connections = patch_connect(monkeypatch, failures=0)
+    client = make_rabbit_client()
+
+    async def scenario():
+        await conn.connect_to_rabbitmq(client)
+        await conn.close_rabbitmq_connection(client)
+        await connections[0].drop()
+
+    asyncio.run(scenario())
+
+    assert client.reconnect_task is None
+    assert len(connections) == 1
+    assert not client.connected
+
+
+def test_clients_share_one_connection_with_separate_publish_channels(monkeypatch):
+    connections = patch_connect(monkeypatch, failures=0)
+    clients = [make_rabbit_client(name) for name in ("channel", "users", "moderation")]
+
+    async def scenario():
+        await asyncio.gather(*(conn.connect_to_rabbitmq(client) for client in clients))
+        assert conn.pool.stats()["open"] == 1
+
+        # Si la conexión compartida se cae, todos los clientes se reconectan sobre una sola conexión nueva
+        await connections[0].drop()
+        await asyncio.gather(*(client.reconnect_task for client in clients))
+
+        for client in clients[:-1]:
+            await conn.close_rabbitmq_connection(client)
+        # Sigue abierta mientras algún cliente la use
+        assert not connections[1].is_closed
+        await conn.close_rabbitmq_connection(clients[-1])
+
+    asyncio.run(scenario())
+
+    assert len(connections) == 2
+    assert connections[1].is_closed
+    for client in clients:
+        assert client.reconnects == 1
+    # Por cliente: un canal de consumo y uno de publicación con confirmaciones
+    assert len(connections[0].channels) == 6
+    publish_channels = [channel for channel in connections[0].channels if channel.options.get("publisher_confirms")]
+    assert len(publish_channels) == 3
+    assert conn.pool.stats()["opened"] == 2
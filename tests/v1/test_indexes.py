@@ -0,0 +1,106 @@
+# tests/v1/test_indexes.py
+import asyncio
+
+import pytest
+
+from app.db import indexes
+from app.models.channels import ChannelDocument
+from app.models.members import MemberDocument
+
+
+class FakeIndexCollection:
+    """Colección con solo las operaciones de índices, sobre un dict como el de `index_information`."""
+
+    def __init__(self, name: str, information: dict):
+        self.name = name
+        self.information = information
+        self.created = []
+        self.dropped = []
+
+    async def index_information(self):
+        return dict(self.information)
+
+    async def create_index(self, fields, background=False, **options):
+        name = options["name"]
+        self.information[name] = {"key": list(fields), **{k: v for k, v in options.items() if k != "name"}}
+        self.created.append(name)
+        return name
+
+    async def drop_index(self, name):
+        del self.information[name]
+        self.dropped.append(name)
+
+
+def declared_information(document_cls) -> dict:
+    """`index_information` de una colección con exactamente los índices declarados en el modelo."""
+    information = {"_id_": {"key": [("_id", 1)]}}
+    for spec in document_cls._meta["index_specs"]:
+        information[spec["name"]] = {"key": list(spec["fields"]), **{k: v for k, v in spec.items() if k not in ("fields", "name")}}
+    return information
+
+
+@pytest.fixture
+def collections(monkeypatch):
+    database = {
+        ChannelDocument._get_collection_name(): FakeIndexCollection("channels", declared_information(ChannelDocument)),
+        MemberDocument._get_collection_name(): FakeIndexCollection("channel_members", declared_information(MemberDocument)),
+    }
+    monkeypatch.setattr(indexes, "get_async_database", lambda: database)
+    return database
+
+
+def test_create_mode_adds_missing_index(collections):
+    members = collections["channel_members"]
+    del members.information["user_id_channel_id"]
+
+    asyncio.run(indexes.ensure_indexes("create"))
+    assert members.created == ["user_id_channel_id"]
+    assert collections["channels"].created == []
+
+
+def test_create_mode_replaces_index_with_other_options(collections):
+    members = collections["channel_members"]
+    members.information["channel_id_user_id"].pop("unique")
+
+    asyncio.run(indexes.ensure_indexes("create"))
+    assert members.dropped == ["channel_id_user_id"]
+    assert members.created == ["channel_id_user_id"]
+    assert members.information["channel_id_user_id"]["unique"] is True
+
+
+def test_create_mode_drops_obsolete_index(collections):
+    channels = collections["channels"]
+    channels.information["owner_id_is_active"] = {"key": [("owner_id", 1), ("is_active", 1)]}
+
+    asyncio.run(indexes.ensure_indexes("create"))
+    assert channels.dropped == ["owner_id_is_active"]
+    assert channels.created == []
+
+
+def test_verify_mode_fails_on_partial_filter_mismatch(collections):
+    channels = collections["channels"]
+    channels.information["outbox_since_retry_at"].pop("partialFilterExpression")
+
+    with pytest.raises(indexes.MissingIndexError):
+        asyncio.run(indexes.ensure_indexes("verify"))
+    assert channels.created == [] and channels.dropped == []
+
+
+def test_verify_mode_passes_with_declared_indexes(collections):
+    asyncio.run(indexes.ensure_indexes("verify"))
+
+
+def test_warn_mode_changes_nothing(collections, caplog):
+    members = collections["channel_members"]
+    del members.information["channel_id_status_user_id"]
+    collections["channels"].information["users_id_is_active"] = {"key": [("users.id", 1), ("is_active", 1)]}
+
+    asyncio.run(indexes.ensure_indexes("warn"))
+    assert members.created == [] and collections["channels"].dropped == []
+    assert "channel_id_status_user_id" in caplog.text
+    assert "users_id_is_active" in caplog.text
+
+
+def test_unknown_mode_is_rejected(collections):
+    with pytest.raises(ValueError):
+        asyncio.run(indexes.ensure_indexes("rebuild"))
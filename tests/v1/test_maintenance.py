@@ -0,0 +1,94 @@
+# tests/v1/test_maintenance.py
+import asyncio
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+from app.db import maintenance
+
+
+class FakeFindCursor:
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+
+    def sort(self, key, direction):
+        self.documents = sorted(self.documents, key=lambda doc: doc[key])
+        return self
+
+    def limit(self, n):
+        self.documents = self.documents[:n]
+        return self
+
+    async def to_list(self):
+        return list(self.documents)
+
+
+class FakeRepairChannels:
+    """Canales en memoria con `find` por `_id > after` y `bulk_write` condicionado al valor leído."""
+
+    def __init__(self, documents: list[dict]):
+        self.documents = {doc["_id"]: doc for doc in documents}
+
+    def find(self, query, projection):
+        after = query.get("_id", {}).get("$gt")
+        return FakeFindCursor([doc for doc in self.documents.values() if after is None or doc["_id"] > after])
+
+    async def bulk_write(self, updates, ordered):
+        modified = 0
+        for update in updates:
+            doc = self.documents[update._filter["_id"]]
+            if doc.get("user_count") == update._filter["user_count"]:
+                doc.update(update._doc["$set"])
+                modified += 1
+        return SimpleNamespace(modified_count=modified)
+
+
+class FakeAsyncIterator:
+    def __init__(self, documents: list[dict]):
+        self.documents = iter(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.documents)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCountMembers:
+    def __init__(self, counts: dict):
+        self.counts = counts
+
+    async def aggregate(self, pipeline):
+        channel_ids = pipeline[0]["$match"]["channel_id"]["$in"]
+        return FakeAsyncIterator([{"_id": channel_id, "count": self.counts[channel_id]} for channel_id in channel_ids if channel_id in self.counts])
+
+
+def patch_collections(monkeypatch, channels, members):
+    monkeypatch.setattr(maintenance, "_channels_collection", lambda: channels)
+    monkeypatch.setattr(maintenance, "_members_collection", lambda: members)
+
+
+def test_repair_user_counts_fixes_missing_and_wrong_counters(monkeypatch):
+    missing, wrong, right, empty = sorted(ObjectId() for _ in range(4))
+    channels = FakeRepairChannels([
+        {"_id": missing},
+        {"_id": wrong, "user_count": 9},
+        {"_id": right, "user_count": 2},
+        {"_id": empty, "user_count": 1},
+    ])
+    patch_collections(monkeypatch, channels, FakeCountMembers({missing: 3, wrong: 4, right: 2}))
+
+    assert asyncio.run(maintenance.repair_user_counts(batch_size=2)) == 3
+    assert [channels.documents[channel_id]["user_count"] for channel_id in (missing, wrong, right, empty)] == [3, 4, 2, 0]
+
+
+def test_repair_user_counts_dry_run_changes_nothing(monkeypatch):
+    channel_id = ObjectId()
+    channels = FakeRepairChannels([{"_id": channel_id, "user_count": 9}])
+    patch_collections(monkeypatch, channels, FakeCountMembers({channel_id: 1}))
+
+    assert asyncio.run(maintenance.repair_user_counts(dry_run=True)) == 1
+    assert channels.documents[channel_id]["user_count"] == 9
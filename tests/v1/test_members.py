@@ -1,11 +1,13 @@
 # tests/v1/test_members.py
+import json
 import time
 
 from fastapi.testclient import TestClient
 
 from app.schemas.channels import Channel, ChannelMember
-from app.schemas.responses import ChannelBasicInfoResponse
+from app.schemas.responses import ChannelBasicInfoResponse, MembershipChangeResponse
 from app.controllers import members as members_controller
+from app.db import querys
 
 
 def make_fake_member(user_id: str, joined_at: float | None = None, status: str = "normal") -> ChannelMember:
@@ -95,6 +97,45 @@ def test_add_user_to_channel_not_found_or_already_member(client: TestClient, mon
     assert response.status_code == 404
 
 
+def test_add_user_to_channel_full_outbox_returns_503(client: TestClient, monkeypatch):
+    async def fake_add_user_to_channel(payload):
+        raise querys.OutboxFullError("outbox lleno")
+
+    monkeypatch.setattr(members_controller, "add_user_to_channel", fake_add_user_to_channel)
+
+    body = {"channel_id": "chan-1", "user_id": "user-123"}
+    response = client.post("/v1/members/", json=body)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(querys.OUTBOX_FULL_RETRY_AFTER)
+
+
+def test_add_user_to_channel_return_minimal(client: TestClient, monkeypatch):
+    async def fail_add_user_to_channel(payload):
+        raise AssertionError("Con return=minimal no se debe cargar el canal completo")
+
+    async def fake_add_user_to_channel_minimal(payload):
+        return MembershipChangeResponse(
+            channel_id=payload.channel_id,
+            member=make_fake_member(payload.user_id),
+            user_count=7,
+            updated_at=time.time(),
+        )
+
+    monkeypatch.setattr(members_controller, "add_user_to_channel", fail_add_user_to_channel)
+    monkeypatch.setattr(members_controller, "add_user_to_channel_minimal", fake_add_user_to_channel_minimal)
+
+    body = {"channel_id": "chan-1", "user_id": "user-123"}
+    response = client.post("/v1/members/", json=body, headers={"Prefer": "return=minimal"})
+    assert response.status_code == 200
+    assert response.headers["Preference-Applied"] == "return=minimal"
+
+    data = response.json()
+    assert data["channel_id"] == "chan-1"
+    assert data["member"]["id"] == "user-123"
+    assert data["user_count"] == 7
+    assert "users" not in data
+
+
 # -------------------- DELETE /v1/members/ -------------------- #
 
 def test_remove_user_from_channel_success(client: TestClient, monkeypatch):
@@ -131,15 +172,26 @@ def test_remove_user_from_channel_not_found(client: TestClient, monkeypatch):
     assert response.status_code == 404
 
 
+def test_remove_user_from_channel_return_minimal_not_found(client: TestClient, monkeypatch):
+    async def fake_remove_user_from_channel_minimal(payload):
+        return None
+
+    monkeypatch.setattr(members_controller, "remove_user_from_channel_minimal", fake_remove_user_from_channel_minimal)
+
+    body = {"channel_id": "chan-1", "user_id": "user-999"}
+    response = client.request("DELETE", "/v1/members/", json=body, headers={"Prefer": "return=minimal"})
+    assert response.status_code == 404
+
+
 # -------------------- GET /v1/members/{user_id} -------------------- #
 
 def test_list_channels_by_member_success(client: TestClient, monkeypatch):
-    def fake_get_channels_by_member(user_id: str):
+    async def fake_get_channels_by_member(user_id: str, cursor: str | None, page_size: int):
         assert user_id == "user-123"
         return [
             make_fake_basic_info(channel_id="chan-1"),
             make_fake_basic_info(channel_id="chan-2"),
-        ]
+        ], None
 
     monkeypatch.setattr(
         members_controller,
@@ -156,8 +208,8 @@ def test_list_channels_by_member_success(client: TestClient, monkeypatch):
 
 
 def test_list_channels_by_member_empty(client: TestClient, monkeypatch):
-    def fake_get_channels_by_member(user_id: str):
-        return []
+    async def fake_get_channels_by_member(user_id: str, cursor: str | None, page_size: int):
+        return [], None
 
     monkeypatch.setattr(
         members_controller,
@@ -173,11 +225,11 @@ def test_list_channels_by_member_empty(client: TestClient, monkeypatch):
 # -------------------- GET /v1/members/owner/{owner_id} -------------------- #
 
 def test_list_channels_by_owner_success(client: TestClient, monkeypatch):
-    def fake_get_channels_by_owner(owner_id: str):
+    async def fake_get_channels_by_owner(owner_id: str, cursor: str | None, page_size: int):
         assert owner_id == "owner-123"
         return [
             make_fake_basic_info(channel_id="chan-1", owner_id=owner_id),
-        ]
+        ], None
 
     monkeypatch.setattr(
         members_controller,
@@ -194,8 +246,8 @@ def test_list_channels_by_owner_success(client: TestClient, monkeypatch):
 
 
 def test_list_channels_by_owner_empty(client: TestClient, monkeypatch):
-    def fake_get_channels_by_owner(owner_id: str):
-        return []
+    async def fake_get_channels_by_owner(owner_id: str, cursor: str | None, page_size: int):
+        return [], None
 
     monkeypatch.setattr(
         members_controller,
@@ -208,12 +260,45 @@ def test_list_channels_by_owner_empty(client: TestClient, monkeypatch):
     assert response.json() == []
 
 
+def test_list_channels_by_member_next_cursor(client: TestClient, monkeypatch):
+    async def fake_get_channels_by_member(user_id: str, cursor: str | None, page_size: int):
+        assert cursor == "abc" and page_size == 1
+        return [make_fake_basic_info(channel_id="chan-1")], "next"
+
+    monkeypatch.setattr(members_controller, "get_channels_by_member", fake_get_channels_by_member)
+
+    response = client.get("/v1/members/user-123", params={"cursor": "abc", "page_size": 1})
+    assert response.status_code == 200
+    assert response.headers["X-Next-Cursor"] == "next"
+
+
+def test_list_channels_by_member_invalid_cursor(client: TestClient):
+    response = client.get("/v1/members/user-123", params={"cursor": "!!"})
+    assert response.status_code == 422
+
+
+def test_list_channels_by_owner_ndjson_stream(client: TestClient, monkeypatch):
+    def fake_stream_channels_by_owner(owner_id: str, cursor: str | None):
+        async def channels():
+            for i in range(3):
+                yield make_fake_basic_info(channel_id=f"chan-{i}", owner_id=owner_id)
+        return channels()
+
+    monkeypatch.setattr(members_controller, "stream_channels_by_owner", fake_stream_channels_by_owner)
+
+    response = client.get("/v1/members/owner/owner-123", headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == ["chan-0", "chan-1", "chan-2"]
+
+
 # -------------------- GET /v1/members/channel/{channel_id} -------------------- #
 
 def test_list_members_by_channel_success(client: TestClient, monkeypatch):
-    def fake_get_channel_member_ids(channel_id: str, page: int, page_size: int):
+    async def fake_get_channel_member_ids(channel_id: str, page: int, page_size: int, status: str | None = None):
         assert channel_id == "chan-1"
-        return [make_fake_member("user-1"), make_fake_member("user-2")]
+        return [make_fake_member("user-1"), make_fake_member("user-2")], 1760833769.259725
 
     monkeypatch.setattr(
         members_controller,
@@ -229,6 +314,28 @@ def test_list_members_by_channel_success(client: TestClient, monkeypatch):
     assert {m["id"] for m in data} == {"user-1", "user-2"}
 
 
+def test_list_members_by_channel_not_modified(client: TestClient, monkeypatch):
+    async def fake_get_channel_member_ids(channel_id: str, page: int, page_size: int, status: str | None = None):
+        return [make_fake_member("user-1")], 1760833769.259725
+
+    async def fail_get_channel_version(channel_id: str):
+        raise AssertionError("la versión del canal debe llegar con la página de miembros")
+
+    monkeypatch.setattr(members_controller, "get_channel_member_ids", fake_get_channel_member_ids)
+    monkeypatch.setattr(querys, "db_get_channel_version", fail_get_channel_version)
+
+    response = client.get("/v1/members/channel/chan-1?page=1&page_size=10")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get("/v1/members/channel/chan-1?page=1&page_size=10", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    # Otra página es otra representación y tiene su propio ETag
+    response = client.get("/v1/members/channel/chan-1?page=2&page_size=10", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
 def test_list_members_by_channel_invalid_page_size(client: TestClient):
     response = client.get("/v1/members/channel/chan-1?page=1&page_size=1000")
     assert response.status_code == 422
@@ -277,3 +384,58 @@ def test_user_count_reflects_multiple_additions(client: TestClient, monkeypatch)
     assert response.status_code == 200
     data = response.json()
     assert len(data["users"]) == 3
+
+
+def test_list_members_by_channel_cursor_and_status(client: TestClient, monkeypatch):
+    async def fake_get_channel_members_after(channel_id: str, cursor: str, page_size: int, status: str | None = None):
+        assert cursor == "dXNlci0x"
+        assert status == "banned"
+        return [make_fake_member("user-2", status="banned")], "next", 1760833769.259725
+
+    monkeypatch.setattr(members_controller, "get_channel_members_after", fake_get_channel_members_after)
+
+    response = client.get("/v1/members/channel/chan-1", params={"cursor": "dXNlci0x", "status": "banned", "page_size": 1})
+    assert response.status_code == 200
+    assert response.headers["X-Next-Cursor"] == "next"
+    assert [m["id"] for m in response.json()] == ["user-2"]
+
+
+def test_list_members_by_channel_invalid_status(client: TestClient):
+    response = client.get("/v1/members/channel/chan-1", params={"status": "unknown"})
+    assert response.status_code == 422
+
+
+# -------------------- GET /v1/members/channel/{channel_id}/{user_id} -------------------- #
+
+def test_read_channel_member_success(client: TestClient, monkeypatch):
+    async def fake_get_channel_member(channel_id: str, user_id: str):
+        return True, make_fake_member(user_id, status="warning")
+
+    monkeypatch.setattr(members_controller, "get_channel_member", fake_get_channel_member)
+
+    response = client.get("/v1/members/channel/chan-1/user-1")
+    assert response.status_code == 200
+    assert response.json()["id"] == "user-1"
+    assert response.json()["status"] == "warning"
+
+
+def test_read_channel_member_not_member(client: TestClient, monkeypatch):
+    async def fake_get_channel_member(channel_id: str, user_id: str):
+        return True, None
+
+    monkeypatch.setattr(members_controller, "get_channel_member", fake_get_channel_member)
+
+    response = client.get("/v1/members/channel/chan-1/user-1")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "El usuario no es miembro del canal."
+
+
+def test_read_channel_member_channel_not_found(client: TestClient, monkeypatch):
+    async def fake_get_channel_member(channel_id: str, user_id: str):
+        return False, None
+
+    monkeypatch.setattr(members_controller, "get_channel_member", fake_get_channel_member)
+
+    response = client.get("/v1/members/channel/chan-1/user-1")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Canal no encontrado."
@@ -1,12 +1,16 @@
 # tests/v1/test_operations.py
+import asyncio
 import time
 
+from bson import ObjectId
 from fastapi.testclient import TestClient
 
 from app.schemas.channels import Channel, ChannelMember
 from app.schemas.responses import ChannelBasicInfoResponse
 from app.controllers import members as members_controller
 from app.controllers import channels as channels_controller
+from app.db import querys
+from app.db.cache import cache_stats
 
 
 def make_fake_member(user_id: str, joined_at: float | None = None, status: str = "normal") -> ChannelMember:
@@ -79,7 +83,7 @@ def test_add_user_increases_user_count(client: TestClient, monkeypatch):
     async def fake_add_user_to_channel(payload):
         return fake_channel
 
-    def fake_get_channel_basic_info(channel_id: str):
+    async def fake_get_channel_basic_info(channel_id: str):
         # Simular la info básica con el conteo actualizado
         return make_fake_basic_info(
             channel_id="chan-1",
@@ -125,7 +129,7 @@ def test_remove_user_decreases_user_count(client: TestClient, monkeypatch):
     async def fake_remove_user_from_channel(payload):
         return fake_channel
 
-    def fake_get_channel_basic_info(channel_id: str):
+    async def fake_get_channel_basic_info(channel_id: str):
         # Simular la info básica con el conteo actualizado
         return make_fake_basic_info(
             channel_id="chan-1",
@@ -171,7 +175,7 @@ def test_user_count_after_removing_all_members(client: TestClient, monkeypatch):
     async def fake_remove_user_from_channel(payload):
         return fake_channel
 
-    def fake_get_channel_basic_info(channel_id: str):
+    async def fake_get_channel_basic_info(channel_id: str):
         return make_fake_basic_info(
             channel_id="chan-1",
             owner_id="owner-123",
@@ -207,11 +211,11 @@ def test_user_count_consistency_across_endpoints(client: TestClient, monkeypatch
         user_count=5
     )
 
-    def fake_get_channel_basic_info(channel_id: str):
+    async def fake_get_channel_basic_info(channel_id: str):
         return fake_basic_info
     
-    def fake_get_channels_by_member(user_id: str):
-        return [fake_basic_info]
+    async def fake_get_channels_by_member(user_id: str, cursor: str | None, page_size: int):
+        return [fake_basic_info], None
 
     monkeypatch.setattr(members_controller, "get_channels_by_member", fake_get_channels_by_member)
     monkeypatch.setattr(channels_controller, "get_channel_basic_info", fake_get_channel_basic_info)
@@ -228,3 +232,55 @@ def test_user_count_consistency_across_endpoints(client: TestClient, monkeypatch
     assert info_response.status_code == 200
     info_data = info_response.json()
     assert info_data["user_count"] == 5
+
+
+def test_basic_info_cache_invalidated_by_membership_change(client: TestClient, monkeypatch):
+    """La info básica se sirve desde la caché hasta que un alta de miembro la invalida, aunque la lectura
+    use otra capitalización del ID que la escritura."""
+    channel_id = str(ObjectId())
+    user_count = 1
+    db_reads = []
+
+    async def fake_db_get_basic_channel_info(requested_id: str):
+        db_reads.append(requested_id)
+        return make_fake_basic_info(channel_id=channel_id, user_count=user_count)
+
+    async def fake_db_add_user_to_channel(requested_id: str, user_id: str):
+        return make_fake_channel(channel_id=channel_id, users=[make_fake_member("user-1"), make_fake_member(user_id)])
+
+    monkeypatch.setattr(querys, "db_get_basic_channel_info", fake_db_get_basic_channel_info)
+    monkeypatch.setattr(querys, "db_add_user_to_channel", fake_db_add_user_to_channel)
+
+    stats_before = client.get("/status").json()["cache"]["basic_info"]
+
+    upper_id = channel_id.upper()
+    assert client.get(f"/v1/channels/{upper_id}/basic").json()["user_count"] == 1
+    assert client.get(f"/v1/channels/{channel_id}/basic").json()["user_count"] == 1
+    assert db_reads == [upper_id]
+
+    user_count = 2
+    response = client.post("/v1/members/", json={"channel_id": channel_id, "user_id": "user-2"})
+    assert response.status_code == 200
+
+    assert client.get(f"/v1/channels/{upper_id}/basic").json()["user_count"] == 2
+    assert db_reads == [upper_id, upper_id]
+
+    stats_after = client.get("/status").json()["cache"]["basic_info"]
+    assert stats_after["hits"] - stats_before["hits"] == 1
+    assert stats_after["misses"] - stats_before["misses"] == 2
+    assert stats_after["invalidations"] - stats_before["invalidations"] == 1
+
+
+def test_invalid_channel_ids_are_not_cached(monkeypatch):
+    db_reads = []
+
+    async def fake_db_is_channel_active(channel_id: str):
+        db_reads.append(channel_id)
+        return None
+
+    monkeypatch.setattr(querys, "db_is_channel_active", fake_db_is_channel_active)
+
+    assert asyncio.run(channels_controller.is_channel_active("no-es-un-id")) is None
+    assert asyncio.run(channels_controller.is_channel_active("no-es-un-id")) is None
+    assert db_reads == ["no-es-un-id", "no-es-un-id"]
+    assert cache_stats()["status"]["size"] == 0
@@ -0,0 +1,479 @@
+# tests/v1/test_querys.py
+import asyncio
+import copy
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from app.db import bloom, querys
+
+
+class FakeCursor:
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+
+    async def to_list(self):
+        return list(self.documents)
+
+
+class FakeAggregateCollection:
+    """Colección que responde a `aggregate` con documentos fijos y registra los pipelines recibidos."""
+
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+        self.pipelines = []
+
+    async def aggregate(self, pipeline, **kwargs):
+        self.pipelines.append(pipeline)
+        return FakeCursor(self.documents)
+
+
+def make_batch_document(object_id: ObjectId, is_active: bool = True) -> dict:
+    return {
+        "id": str(object_id),
+        "name": "general",
+        "owner_id": "owner",
+        "channel_type": "public",
+        "created_at": 1.0,
+        "updated_at": 1.0,
+        "user_count": 1,
+        "is_active": is_active
+    }
+
+
+def evaluate(expression, document: dict):
+    """Evalúa las expresiones de agregación que usan las proyecciones de `querys`."""
+    if isinstance(expression, str) and expression.startswith("$"):
+        return document.get(expression[1:])
+    if isinstance(expression, dict):
+        (operator, args), = expression.items()
+        if operator == "$toString":
+            return str(evaluate(args, document))
+        if operator == "$ifNull":
+            value = evaluate(args[0], document)
+            return evaluate(args[1], document) if value is None else value
+        if operator == "$size":
+            return len(evaluate(args, document))
+    return expression
+
+
+class FakeProjectingCollection:
+    """Colección que aplica el `$project` final de la agregación a sus documentos."""
+
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+
+    async def aggregate(self, pipeline, **kwargs):
+        projection = pipeline[-1]["$project"]
+        return FakeCursor([{field: evaluate(value, doc) for field, value in projection.items()} for doc in self.documents])
+
+
+def make_channel_document(**fields) -> dict:
+    return {"_id": ObjectId(), "name": "general", "owner_id": "owner", "channel_type": "public", "created_at": 1.0, "updated_at": 1.0, **fields}
+
+
+# -------------------- Canales sin `user_count` -------------------- #
+
+def test_channel_listing_counts_channels_without_user_count(monkeypatch):
+    legacy = make_channel_document(users=[{"id": "owner"}, {"id": "user-1"}])
+    counted = make_channel_document(user_count=5)
+    empty = make_channel_document()
+    collection = FakeProjectingCollection([legacy, counted, empty])
+    monkeypatch.setattr(querys, "_channels_collection", lambda: collection)
+
+    channels = asyncio.run(querys.db_get_all_channels_paginated())
+
+    # Un canal anterior al contador ya no vacía la página
+    assert [channel.user_count for channel in channels] == [2, 5, 0]
+
+
+# -------------------- db_get_channels_batch -------------------- #
+
+def test_channels_batch_maps_back_to_requested_ids(monkeypatch):
+    object_id = ObjectId()
+    collection = FakeAggregateCollection([make_batch_document(object_id)])
+    monkeypatch.setattr(querys, "_channels_collection", lambda: collection)
+
+    upper_id = str(object_id).upper()
+    result = asyncio.run(querys.db_get_channels_batch([upper_id, str(object_id), "invalid"]))
+
+    assert set(result) == {upper_id, str(object_id)}
+    assert result[upper_id][0] is True
+    assert result[upper_id][1].id == str(object_id)
+    # Las dos formas del mismo ID se resuelven con un solo ObjectId en el `$in`
+    assert collection.pipelines[0][0]["$match"]["_id"]["$in"] == [object_id]
+
+
+# -------------------- Filtro de Bloom en escrituras -------------------- #
+
+class FakeFindCollection:
+    def __init__(self, document: dict | None):
+        self.document = document
+
+    async def find_one(self, query, projection=None):
+        return self.document
+
+
+def test_channel_member_read_uses_bloom_filter(monkeypatch):
+    object_id = ObjectId.from_datetime(datetime(2024, 1, 1, tzinfo=timezone.utc))
+    monkeypatch.setattr(bloom._state, "filter", bloom.BloomFilter(capacity=1000, error_rate=0.01))
+    monkeypatch.setattr(bloom._state, "ready", True)
+    monkeypatch.setattr(bloom._state, "built_at", time.time())
+    monkeypatch.setattr(querys, "_channels_collection", lambda: FakeFindCollection({"_id": object_id}))
+    monkeypatch.setattr(querys, "_members_collection", lambda: FakeFindCollection({"user_id": "user-1", "joined_at": 1.0, "status": "normal"}))
+
+    # El filtro no conoce el canal: una lectura responde "no existe" sin consultar
+    assert asyncio.run(querys.db_get_channel_member(str(object_id), "user-1")) == (False, None)
+
+
+# -------------------- Transacciones de membresía -------------------- #
+
+class FakeSession:
+    """Sesión cuya transacción aplica las escrituras al momento y las deshace si el callback falla."""
+
+    def __init__(self, database):
+        self.database = database
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def with_transaction(self, callback):
+        channel = copy.deepcopy(self.database.channels.document)
+        members = copy.deepcopy(self.database.members.members)
+        try:
+            return await callback(self)
+        except BaseException:
+            self.database.channels.document.clear()
+            self.database.channels.document.update(channel)
+            self.database.members.members.clear()
+            self.database.members.members.update(members)
+            raise
+
+
+class FakeMembersCollection:
+    def __init__(self, members: dict | None = None):
+        self.members = members or {}
+
+    async def insert_one(self, document, session):
+        key = (document["channel_id"], document["user_id"])
+        if key in self.members:
+            raise querys.DuplicateKeyError("duplicado")
+        self.members[key] = document
+
+    async def find_one(self, query, projection, session):
+        return self.members.get((query["channel_id"], query["user_id"]))
+
+    async def find_one_and_delete(self, query, projection, session):
+        return self.members.pop((query["channel_id"], query["user_id"]), None)
+
+    async def find_one_and_update(self, query, update, projection, return_document, session):
+        key = (query["channel_id"], query["user_id"])
+        if key not in self.members:
+            return None
+        self.members[key] = {**self.members[key], **update["$set"]}
+        return self.members[key]
+
+    async def count_documents(self, query, session):
+        return sum(1 for channel_id, _ in self.members if channel_id == query["channel_id"])
+
+
+class FakeChannelsCollection:
+    def __init__(self, document: dict, fail_update: bool = False):
+        self.document = document
+        self.fail_update = fail_update
+
+    async def find_one(self, query, projection=None, session=None):
+        return self.document
+
+    async def find_one_and_update(self, query, update, projection, return_document, session):
+        if self.fail_update:
+            raise ConnectionError("se perdió la conexión con MongoDB")
+        self.document.update(update["$set"])
+        self.document["outbox"] = [*self.document["outbox"], update["$push"]["outbox"]]
+        self.document["user_count"] += update.get("$inc", {}).get("user_count", 0)
+        return dict(self.document)
+
+    async def update_one(self, query, update, session):
+        if "$push" not in update:
+            # Recuento de `user_count` previo a la escritura
+            self.document.update(update["$set"])
+            return
+        if self.fail_update:
+            raise ConnectionError("se perdió la conexión con MongoDB")
+        self.document.update(update["$set"])
+        self.document["outbox"] = [*self.document["outbox"], update["$push"]["outbox"]]
+
+
+class FakeTransactionalDatabase:
+    def __init__(self, channels, members):
+        self.channels = channels
+        self.members = members
+        self.collections = {
+            querys.ChannelDocument._get_collection_name(): channels,
+            querys.MemberDocument._get_collection_name(): members
+        }
+        self.client = self
+
+    def start_session(self):
+        return FakeSession(self)
+
+    def __getitem__(self, name):
+        return self.collections[name]
+
+
+def make_transactional_database(monkeypatch, channel_id, members=None, fail_update=False):
+    channels = FakeChannelsCollection({"_id": channel_id, "user_count": 1, "outbox": []}, fail_update)
+    members = FakeMembersCollection(members)
+    monkeypatch.setattr(querys, "get_async_database", lambda: FakeTransactionalDatabase(channels, members))
+    return channels, members
+
+
+def test_insert_member_counts_and_queues_event_together(monkeypatch):
+    channel_id = ObjectId()
+    channels, members = make_transactional_database(monkeypatch, channel_id)
+
+    member, document = asyncio.run(querys._insert_member(str(channel_id), "user-1", {}))
+
+    assert member["user_id"] == "user-1"
+    assert (channel_id, "user-1") in members.members
+    assert channels.document["user_count"] == 2
+    assert [event["routing_key"] for event in channels.document["outbox"]] == ["channelService.v1.user.added"]
+
+
+def test_delete_member_decrements_count(monkeypatch):
+    channel_id = ObjectId()
+    existing = {(channel_id, "user-1"): {"channel_id": channel_id, "user_id": "user-1"}}
+    channels, members = make_transactional_database(monkeypatch, channel_id, existing)
+    channels.document["user_count"] = 2
+
+    removed, document = asyncio.run(querys._delete_member(str(channel_id), "user-1", {}))
+
+    assert removed["user_id"] == "user-1"
+    assert members.members == {}
+    assert document["user_count"] == channels.document["user_count"] == 1
+
+
+def test_insert_member_counts_channel_without_user_count(monkeypatch):
+    channel_id = ObjectId()
+    existing = {(channel_id, f"user-{n}"): {"channel_id": channel_id, "user_id": f"user-{n}"} for n in range(3)}
+    channels, members = make_transactional_database(monkeypatch, channel_id, existing)
+    del channels.document["user_count"]
+
+    asyncio.run(querys._insert_member(str(channel_id), "user-9", {}))
+
+    # El $inc parte del recuento de `channel_members`, no de un campo inexistente
+    assert channels.document["user_count"] == 4
+
+
+def test_insert_member_failure_between_writes_leaves_no_partial_change(monkeypatch):
+    channel_id = ObjectId()
+    channels, members = make_transactional_database(monkeypatch, channel_id, fail_update=True)
+
+    try:
+        asyncio.run(querys._insert_member(str(channel_id), "user-1", {}))
+        assert False, "se esperaba el error de la actualización del canal"
+    except ConnectionError:
+        pass
+
+    # Ni la membresía ni el contador ni el evento quedan a medias
+    assert members.members == {}
+    assert channels.document["user_count"] == 1
+    assert channels.document["outbox"] == []
+
+
+def test_insert_existing_member_rolls_back(monkeypatch):
+    channel_id = ObjectId()
+    existing = {(channel_id, "user-1"): {"channel_id": channel_id, "user_id": "user-1"}}
+    channels, members = make_transactional_database(monkeypatch, channel_id, existing)
+
+    assert asyncio.run(querys._insert_member(str(channel_id), "user-1", {})) is None
+    assert channels.document["user_count"] == 1
+    assert channels.document["outbox"] == []
+
+
+def test_delete_member_failure_between_writes_keeps_member(monkeypatch):
+    channel_id = ObjectId()
+    existing = {(channel_id, "user-1"): {"channel_id": channel_id, "user_id": "user-1"}}
+    channels, members = make_transactional_database(monkeypatch, channel_id, existing, fail_update=True)
+
+    try:
+        asyncio.run(querys._delete_member(str(channel_id), "user-1", {}))
+        assert False, "se esperaba el error de la actualización del canal"
+    except ConnectionError:
+        pass
+
+    assert (channel_id, "user-1") in members.members
+    assert channels.document["user_count"] == 1
+
+
+def test_update_owner_checks_membership_in_same_transaction(monkeypatch):
+    channel_id = ObjectId()
+    existing = {(channel_id, "user-2"): {"channel_id": channel_id, "user_id": "user-2"}}
+    channels, members = make_transactional_database(monkeypatch, channel_id, existing)
+
+    async def build_channel(document):
+        return document
+
+    monkeypatch.setattr(querys, "_build_channel", build_channel)
+    document = asyncio.run(querys.db_update_channel(str(channel_id), querys.ChannelUpdatePayload(owner_id="user-2")))
+
+    assert document["owner_id"] == "user-2"
+    assert [event["routing_key"] for event in channels.document["outbox"]] == ["channelService.v1.channel.updated"]
+
+
+def test_update_owner_not_member_leaves_no_change(monkeypatch):
+    channel_id = ObjectId()
+    channels, members = make_transactional_database(monkeypatch, channel_id)
+
+    try:
+        asyncio.run(querys.db_update_channel(str(channel_id), querys.ChannelUpdatePayload(owner_id="user-2")))
+        assert False, "se esperaba OwnerNotMemberError"
+    except querys.OwnerNotMemberError:
+        pass
+
+    assert "owner_id" not in channels.document
+    assert channels.document["outbox"] == []
+
+
+def test_change_status_queues_event_in_same_transaction(monkeypatch):
+    channel_id = ObjectId()
+    existing = {(channel_id, "user-1"): {"channel_id": channel_id, "user_id": "user-1", "joined_at": 1.0, "status": "normal"}}
+    channels, members = make_transactional_database(monkeypatch, channel_id, existing)
+
+    member = asyncio.run(querys.db_change_status(str(channel_id), "user-1", "banned"))
+
+    assert member.status == "banned"
+    assert [event["routing_key"] for event in channels.document["outbox"]] == ["channelService.v1.user.status_changed"]
+
+
+def test_change_status_without_event_is_rolled_back(monkeypatch):
+    channel_id = ObjectId()
+    existing = {(channel_id, "user-1"): {"channel_id": channel_id, "user_id": "user-1", "joined_at": 1.0, "status": "normal"}}
+    channels, members = make_transactional_database(monkeypatch, channel_id, existing, fail_update=True)
+
+    try:
+        asyncio.run(querys.db_change_status(str(channel_id), "user-1", "banned"))
+        assert False, "se esperaba el error al encolar el evento"
+    except ConnectionError:
+        pass
+
+    # Sin evento no hay cambio de status
+    assert members.members[(channel_id, "user-1")]["status"] == "normal"
+    assert channels.document["outbox"] == []
+
+
+# -------------------- Canales aún no migrados (arreglo legado `users`) -------------------- #
+
+def test_channel_member_falls_back_to_legacy_array(monkeypatch):
+    object_id = ObjectId()
+    legacy_channel = {"_id": object_id, "users": [{"id": "user-1", "joined_at": 1.0, "status": "banned"}]}
+    monkeypatch.setattr(querys, "_channels_collection", lambda: FakeFindCollection(legacy_channel))
+    monkeypatch.setattr(querys, "_members_collection", lambda: FakeFindCollection(None))
+
+    channel_active, member = asyncio.run(querys.db_get_channel_member(str(object_id), "user-1"))
+
+    assert channel_active is True
+    assert member.id == "user-1"
+    assert member.status == "banned"
+
+
+def test_write_on_legacy_channel_migrates_in_same_transaction(monkeypatch):
+    channel_id = ObjectId()
+    channels, members = make_transactional_database(monkeypatch, channel_id)
+    channels.document["users"] = []
+    migrated = []
+
+    async def copy_legacy_members(channel_ids, session):
+        migrated.append((channel_ids, session))
+        return len(channel_ids)
+
+    monkeypatch.setattr(querys, "_copy_legacy_members", copy_legacy_members)
+    asyncio.run(querys._insert_member(str(channel_id), "user-1", {}))
+
+    assert len(migrated) == 1
+    assert migrated[0][0] == [channel_id]
+    assert isinstance(migrated[0][1], FakeSession)
+
+
+class FakeAsyncIterator:
+    def __init__(self, documents: list[dict]):
+        self.documents = iter(documents)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.documents)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def test_member_page_of_legacy_channel_migrates_and_rereads(monkeypatch):
+    object_id = ObjectId()
+    legacy_page = {"is_active": True, "updated_at": 1.0, "members": [], "legacy_members": True}
+    migrated_page = {"is_active": True, "updated_at": 2.0, "members": [{"id": "user-1", "joined_at": 1.0, "status": "normal"}], "legacy_members": False}
+    pages = [legacy_page, migrated_page]
+
+    class PageCollection:
+        async def aggregate(self, pipeline):
+            return FakeAsyncIterator([pages.pop(0)])
+
+    migrated = []
+
+    async def migrate(channel_ids):
+        migrated.append(channel_ids)
+        return 1
+
+    monkeypatch.setattr(querys, "_channels_collection", lambda: PageCollection())
+    monkeypatch.setattr(querys, "db_migrate_legacy_members", migrate)
+
+    members, updated_at = asyncio.run(querys.db_get_channel_member_ids(str(object_id)))
+
+    assert migrated == [[object_id]]
+    assert [member.id for member in members] == ["user-1"]
+    assert updated_at == 2.0
+
+
+def test_channels_by_member_merges_legacy_channels(monkeypatch):
+    first, second, third = sorted(ObjectId() for _ in range(3))
+    members = FakeAggregateCollection([make_batch_document(first), make_batch_document(third)])
+    legacy = FakeAggregateCollection([make_batch_document(second), make_batch_document(third)])
+    monkeypatch.setattr(querys, "_members_collection", lambda: members)
+    monkeypatch.setattr(querys, "_channels_collection", lambda: legacy)
+
+    channels = asyncio.run(querys.db_get_channels_by_member_id("user-1", limit=2))
+
+    assert [channel.id for channel in channels] == [str(first), str(second)]
+    assert legacy.pipelines[0][0]["$match"]["users.id"] == "user-1"
+
+
+# -------------------- Tope del outbox -------------------- #
+
+def test_write_on_full_outbox_raises(monkeypatch):
+    channel_id = ObjectId()
+    full_channel = {"_id": channel_id, "user_count": 1, "outbox": [{}] * querys.OUTBOX_MAX_PENDING}
+
+    class FullOutboxChannels(FakeChannelsCollection):
+        async def find_one(self, query, projection=None, session=None):
+            # Responde como MongoDB a la condición sobre el último lugar del outbox
+            key = f"outbox.{querys.OUTBOX_MAX_PENDING - 1}"
+            if key in query and not query[key]["$exists"]:
+                return None
+            return self.document
+
+    channels = FullOutboxChannels(full_channel)
+    members = FakeMembersCollection()
+    monkeypatch.setattr(querys, "get_async_database", lambda: FakeTransactionalDatabase(channels, members))
+
+    try:
+        asyncio.run(querys._insert_member(str(channel_id), "user-1", {}))
+        assert False, "se esperaba OutboxFullError"
+    except querys.OutboxFullError:
+        pass
+    assert members.members == {}
+    assert channels.document["user_count"] == 1